@@ -0,0 +1,128 @@
+"""
+Benchmark of the vectorised analytics (todopomo_analytics) against a
+pure-Python loop over the same records, on a synthetic log - then of
+loading the log again once rotated (see todopomo_segments), from the
+sidecars of its segments.
+
+usage: python benchmarks/bench_analytics.py [number of records]
+       (default 1,000,000 records, written to a temporary directory)
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import todotxtio as tdt
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+import todopomo_analytics as analytics
+import generate
+
+def py_hour_histogram(rows):
+    counts, seconds = [0] * 24, [0.] * 24
+    for tdid, start, stop, duration, endpoint in rows:
+        if tdid == 'break' or endpoint == pomo_log.INTERRUPTED:
+            continue
+        hour = datetime.fromtimestamp(start).hour
+        counts[hour] += 1
+        seconds[hour] += duration
+    return counts, seconds
+
+def py_daily_totals(rows):
+    totals = {}
+    for tdid, start, stop, duration, endpoint in rows:
+        if tdid == 'break' or endpoint == pomo_log.INTERRUPTED:
+            continue
+        day = date.fromtimestamp(start).toordinal()
+        totals[day] = totals.get(day, 0.) + duration
+    if not totals:
+        return [], []
+    days = list(range(min(totals), max(totals) + 1))
+    return days, [totals.get(day, 0.) for day in days]
+
+def py_rolling_weekly(rows, weeks=4):
+    days, seconds = py_daily_totals(rows)
+    window = 7 * weeks
+    averages = []
+    for i in range(len(seconds)):
+        averages.append(sum(seconds[max(0, i + 1 - window):i + 1]) / weeks)
+    return days, averages
+
+def py_streaks(rows):
+    days, seconds = py_daily_totals(rows)
+    longest, current = 0, 0
+    for s in seconds:
+        current = current + 1 if s > 0 else 0
+        longest = max(longest, current)
+    return longest, current
+
+def py_project_shares(rows, todo_list):
+    todo_projects = {todo.tags.get('tdid'): todo.projects for todo in todo_list}
+    seconds, total = {}, 0.
+    for tdid, start, stop, duration, endpoint in rows:
+        if tdid == 'break' or endpoint == pomo_log.INTERRUPTED:
+            continue
+        projects = todo_projects.get(tdid) or ['No project']
+        for project in projects:
+            seconds[project] = seconds.get(project, 0.) \
+                               + duration / len(projects)
+        total += duration
+    return {project: s / total for project, s in seconds.items()}
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - t0, result
+
+def main(n_records=1000000):
+    if not analytics.has_numpy:
+        sys.exit("numpy is needed for this benchmark")
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'todopomo_log.txt')
+        todo_txt = os.path.join(tmp, 'todo.txt')
+        print("Writing {} records...".format(n_records))
+        generate.make_log(log_file, n_records,
+                          generate.make_todo_txt(todo_txt, 500))
+        todos = tdt.from_file(todo_txt)
+        t_rows, rows = timed(lambda: list(pomo_log.iter_csv(log_file)))
+        #same record format as the binary sidecar: epoch seconds
+        rows = [(tdid, start.timestamp(), stop.timestamp(), duration, endpoint)
+                for tdid, start, stop, duration, endpoint in rows]
+        t_columns, columns = timed(analytics.load_columns, log_file)
+        print("{:<16} {:>12} {:>12} {:>8}".format('', 'python (s)',
+                                                  'numpy (s)', 'speed-up'))
+        print("{:<16} {:>12.4f} {:>12.4f} {:>7.1f}x".format('load', t_rows,
+                                          t_columns, t_rows / t_columns))
+        cases = [('hour histogram', py_hour_histogram,
+                  analytics.hour_histogram, ()),
+                 ('rolling weekly', py_rolling_weekly,
+                  analytics.rolling_weekly, ()),
+                 ('streaks', py_streaks, analytics.streaks, ()),
+                 ('project shares', py_project_shares,
+                  analytics.project_shares, (todos,))]
+        for name, py_f, np_f, args in cases:
+            t_py, py_result = timed(py_f, rows, *args)
+            t_np, np_result = timed(np_f, columns, *args)
+            print("{:<16} {:>12.4f} {:>12.4f} {:>7.1f}x".format(name, t_py,
+                                                       t_np, t_py / t_np))
+        assert py_streaks(rows) == analytics.streaks(columns)
+        #all but the last month moved to segments
+        last = date.fromtimestamp(int(columns['start'].max()))
+        t_rotate, _ = timed(segments.rotate, log_file, last)
+        t_rows, rotated_rows = timed(lambda: list(segments.iter_log(log_file)))
+        t_columns, rotated = timed(analytics.load_columns, log_file)
+        print("{:<16} {:>12.4f} {:>12.4f} {:>7.1f}x".format('load rotated',
+                                          t_rows, t_columns, t_rows / t_columns))
+        print("(rotation: {:.4f} s, {} segments)".format(t_rotate,
+                                          len(segments.load_index(log_file))))
+        assert len(rotated_rows) == len(rows)
+        for field in ('start', 'stop', 'duration'):
+            assert (rotated[field] == columns[field]).all()
+        assert [rotated['tdids'][code] for code in rotated['tdid']] \
+               == [columns['tdids'][code] for code in columns['tdid']]
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,66 @@
+"""
+Memory benchmark: memory held by the parsed list of To-dos of a large
+todo.txt, as todotxtio.Todo and as todopomo_compact.CompactTodo.
+
+Each representation is loaded with tracemalloc running; the memory still
+allocated once loaded (current) and the most allocated while loading (peak)
+are reported, with the time taken. The lines written back from both lists
+are checked to be the same.
+
+usage: python benchmarks/bench_memory.py [number of To-dos]
+       (default 500,000 To-dos)
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import generate
+
+import todotxtio as tdt
+import todopomo_compact as compact
+
+def measure(load, todo_txt):
+    """
+    Load todo_txt with tracemalloc running
+    returns: list of To-dos, current bytes, peak bytes, seconds
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    todos = load(todo_txt)
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return todos, current, peak, seconds
+
+def main(n_todos=500000):
+    with tempfile.TemporaryDirectory() as directory:
+        todo_txt = os.path.join(directory, 'todo.txt')
+        generate.make_todo_txt(todo_txt, n_todos)
+        print("{} To-dos".format(n_todos))
+        results = {}
+        for name, load in (('todotxtio.Todo', tdt.from_file),
+                           ('CompactTodo', compact.from_file)):
+            todos, current, peak, seconds = measure(load, todo_txt)
+            results[name] = current
+            print("{:15} {:8.1f} MB held ({:5.0f} bytes/To-do), peak "
+                  "{:8.1f} MB, {:.2f} s".format(name, current / 1e6,
+                                                current / len(todos),
+                                                peak / 1e6, seconds))
+            lines = [str(todo) for todo in todos]
+            del todos
+            if name == 'todotxtio.Todo':
+                expected = lines
+            elif lines != expected:
+                print("CompactTodo lines differ from todotxtio.Todo lines!")
+            del lines
+        print("saved: {:.1f} MB ({:.0%})".format(
+              (results['todotxtio.Todo'] - results['CompactTodo']) / 1e6,
+              1 - results['CompactTodo'] / results['todotxtio.Todo']))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 500000)
@@ -0,0 +1,115 @@
+"""
+Load test of the server mode (todopomo_server): several simulated users, each
+in their own thread, list their To-dos, select today's list, start and stop
+Pomodoros (on the server's timers) and look at their stats, all at the same
+time.
+
+usage: python benchmarks/bench_server.py [users] [rounds per user] [url]
+       (default 20 users, 50 rounds; without url a local server is started
+       on a free port, with a temporary data directory)
+"""
+import os
+import sys
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import todopomo_server as todo_server
+
+def make_users(data_dir, n_users, n_todos=500, seed=0):
+    """
+    Write a todo.txt for each user
+    """
+    rng = random.Random(seed)
+    for u in range(n_users):
+        directory = os.path.join(data_dir, 'user{}'.format(u))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'todo.txt'), 'w') as fd:
+            for i in range(n_todos):
+                fd.write('({}) To-do {} of user {} +project{} @context{}\n'
+                         .format(rng.choice('ABCFIR'), i, u, rng.randint(0, 9),
+                                 rng.randint(0, 4)))
+
+def call(url, data=None):
+    """
+    GET (or POST data as json) and time the request
+    returns: seconds taken, decoded json response
+    """
+    body = None if data is None else json.dumps(data).encode()
+    request = Request(url, data=body,
+                      headers={'Content-Type': 'application/json'})
+    t0 = time.perf_counter()
+    with urlopen(request) as response:
+        result = json.loads(response.read())
+    return time.perf_counter() - t0, result
+
+def simulate_user(url, user, rounds, timings):
+    base = '{}/{}'.format(url, user)
+    for _ in range(rounds):
+        t, todos = call(base + '/todos')
+        timings['todos'].append(t)
+        t, today = call(base + '/today', {'add': [todos[0]['tdid']]})
+        timings['today'].append(t)
+        t, _ = call(base + '/pomodoro/start', {'tdid': today[0]['tdid'],
+                                               'endpoint': 'load test'})
+        timings['start'].append(t)
+        t, _ = call(base + '/pomodoro')
+        timings['status'].append(t)
+        t, _ = call(base + '/pomodoro/stop', {'completed': False})
+        timings['stop'].append(t)
+        t, _ = call(base + '/stats')
+        timings['stats'].append(t)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100. * len(values)))]
+
+def run(url, n_users, rounds):
+    timings = {key: [] for key in ('todos', 'today', 'start', 'status', 'stop',
+                                   'stats')}
+    #lists are shared by the threads, but list.append is atomic
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_users) as pool:
+        futures = [pool.submit(simulate_user, url, 'user{}'.format(u), rounds,
+                               timings) for u in range(n_users)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - t0
+    n_requests = sum(len(t) for t in timings.values())
+    print("{} users, {} requests in {:.2f} s: {:.0f} requests/s".format(
+          n_users, n_requests, elapsed, n_requests / elapsed))
+    print("{:<8} {:>10} {:>10} {:>10}".format('', 'p50 (ms)', 'p95 (ms)',
+                                               'p99 (ms)'))
+    for key, values in timings.items():
+        print("{:<8} {:>10.1f} {:>10.1f} {:>10.1f}".format(key,
+              *[1000 * percentile(values, p) for p in (50, 95, 99)]))
+
+def main(n_users=20, rounds=50, url=None):
+    if url is not None:
+        run(url, n_users, rounds)
+        return
+    from werkzeug.serving import make_server
+    with tempfile.TemporaryDirectory() as data_dir:
+        make_users(data_dir, n_users)
+        app = todo_server.create_app(data_dir)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            run('http://127.0.0.1:{}'.format(server.server_port), n_users,
+                rounds)
+        finally:
+            server.shutdown()
+            #save the users' files while the data directory is still there
+            app.config['CLOSE']()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20, int(args[1]) if len(args) > 1 else 50,
+         args[2] if len(args) > 2 else None)
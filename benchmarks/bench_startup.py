@@ -0,0 +1,71 @@
+"""
+Start-up benchmark: time from starting todopomo.py to its first menu, with
+and without the cache of the parsed todo.txt (todopomo_cache).
+
+Each run is a fresh Python process started in a temporary directory holding
+a synthetic todo.txt; it stops as soon as the first question is asked.
+
+usage: python benchmarks/bench_startup.py [number of To-dos] [runs]
+       (default 10,000 To-dos, best of 5 runs)
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import generate
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#run in the child process: time to the first input() of main()
+CHILD = """
+import time
+t0 = time.perf_counter()
+import builtins, os, sys
+def first_menu(*args):
+    print(time.perf_counter() - t0)
+    sys.stdout.flush()
+    os._exit(0)
+builtins.input = first_menu
+import todopomo as tp
+tp.USE_CACHE = {use_cache}
+tp.main()
+"""
+
+def time_to_first_menu(directory, todo_txt, use_cache):
+    """
+    Start todopomo.py on a pristine copy of todo.txt
+    returns: seconds until the first menu
+    """
+    for name in os.listdir(directory):
+        if name not in ('todo.txt.orig', 'todo_txt.cache'):
+            os.remove(os.path.join(directory, name))
+    #copy2 keeps the mtime, so the cache stays valid between runs
+    shutil.copy2(todo_txt, os.path.join(directory, 'todo.txt'))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+               [REPO, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.run([sys.executable, '-c',
+                             CHILD.format(use_cache=use_cache)],
+                            cwd=directory, env=env, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    return float(output.split()[-1])
+
+def main(n_todos=10000, runs=5):
+    with tempfile.TemporaryDirectory() as directory:
+        todo_txt = os.path.join(directory, 'todo.txt.orig')
+        generate.make_todo_txt(todo_txt, n_todos)
+        print("{} To-dos, best of {} runs".format(n_todos, runs))
+        without = min(time_to_first_menu(directory, todo_txt, False)
+                      for _ in range(runs))
+        #first run with the cache fills it
+        time_to_first_menu(directory, todo_txt, True)
+        cached = min(time_to_first_menu(directory, todo_txt, True)
+                     for _ in range(runs))
+        print("without cache: {:.3f} s".format(without))
+        print("with cache:    {:.3f} s ({:.1f}x)".format(cached,
+                                                         without / cached))
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 10000, int(args[1]) if len(args) > 1 else 5)
@@ -0,0 +1,99 @@
+"""
+Generators of realistic synthetic todo.txt and todopomo_log.txt files, for
+the benchmarks.
+
+todo.txt: mix of priorities (A-C, F, I, R, none), projects, contexts,
+          completed To-dos, tdid/Pmd/Ttotal tags (a few To-dos without tdid,
+          as if added by another todo.txt client)
+todopomo_log.txt: alternating Pomodoros (25 or 50 minutes) and breaks on
+                  the tdids of a todo.txt, with the odd interruption and day
+                  off, as written by write_pomo()
+
+usage: python benchmarks/generate.py todo.txt [To-dos] [log file] [records]
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import todopomo_log as pomo_log
+
+PRIORITIES = ['A', 'A', 'B', 'B', 'B', 'C', 'F', 'I', 'R', None, None]
+WORDS = ['write', 'review', 'call', 'plan', 'fix', 'read', 'report', 'email',
+         'budget', 'draft', 'meeting', 'garden', 'invoice', 'slides', 'backup',
+         'update', 'clean', 'book', 'order', 'test']
+
+def make_todo_txt(path, n_todos, seed=0, untagged=0.05):
+    """
+    Write n_todos To-dos to path
+    returns: list of tdids written
+    """
+    rng = random.Random(seed)
+    projects = ['project{}'.format(i) for i in range(max(10, n_todos // 200))]
+    contexts = ['home', 'office', 'phone', 'computer', 'errands', 'nas']
+    day = datetime(2020, 1, 1)
+    tdids = []
+    with open(path, 'w') as fd:
+        for i in range(n_todos):
+            parts = []
+            if rng.random() < 0.2:
+                parts.append('x ' + (day + timedelta(days=rng.randint(0, 1000)))
+                             .date().isoformat())
+            priority = rng.choice(PRIORITIES)
+            if priority:
+                parts.append('(' + priority + ')')
+            parts.append(' '.join(rng.choice(WORDS)
+                                  for _ in range(rng.randint(2, 8))))
+            parts += ['+' + p for p in rng.sample(projects, rng.randint(0, 2))]
+            parts += ['@' + c for c in rng.sample(contexts, rng.randint(0, 2))]
+            if rng.random() >= untagged:
+                tdid = 'P_{}_{}'.format((day + timedelta(days=i // 50)).date()
+                                        .isoformat(), i % 50)
+                tdids.append(tdid)
+                parts.append('tdid:' + tdid)
+                if rng.random() < 0.5:
+                    pomos = rng.randint(1, 40)
+                    parts.append('Pmd:{} Ttotal:{}'.format(pomos,
+                                 pomos * rng.choice((1500, 3000))))
+            fd.write(' '.join(parts) + '\n')
+    return tdids
+
+def make_log(log_file, n_records, tdids, seed=0):
+    """
+    Write n_records Pomodoros and breaks (and the binary sidecar) to log_file
+    """
+    rng = random.Random(seed)
+    writer = pomo_log.PomoLogWriter(log_file, flush_every=10000)
+    t = datetime(2020, 1, 1, 8)
+    tdid = tdids[0]
+    for i in range(n_records):
+        if i % 2:
+            length = 5
+            writer.write(t, t + timedelta(minutes=length), length * 60)
+        elif rng.random() < 0.05:
+            length = rng.randint(1, 20)
+            writer.write(t, t + timedelta(minutes=length), 0, tdid,
+                         'interrupted')
+        else:
+            tdid = rng.choice(tdids)
+            length = rng.choice((25, 50))
+            writer.write(t, t + timedelta(minutes=length), length * 60, tdid,
+                         'endpoint {}'.format(i))
+        t += timedelta(minutes=length)
+        #stop in the evening, sometimes take a day off
+        if t.hour >= 20:
+            t = datetime.combine(t.date() + timedelta(days=rng.choice(
+                                 (1, 1, 1, 1, 2))), datetime.min.time()) \
+                + timedelta(hours=8)
+    writer.close()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(__doc__)
+    tdids = make_todo_txt(args[0], int(args[1]) if len(args) > 1 else 1000)
+    if len(args) > 2:
+        make_log(args[2], int(args[3]) if len(args) > 3 else len(tdids),
+                 tdids)
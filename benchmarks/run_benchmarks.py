@@ -0,0 +1,198 @@
+"""
+Benchmark suite: times the functions of todopomo.py on its hot paths, each
+in isolation, on synthetic todo.txt and log files of increasing size (see
+generate.py). Results are written as json, so that runs can be compared to
+catch regressions.
+
+usage: python benchmarks/run_benchmarks.py [-s SIZES] [-r REPEAT]
+                                           [-o results.json]
+                                           [-c previous_results.json]
+"""
+import argparse
+import builtins
+import contextlib
+from datetime import datetime, timedelta
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import todotxtio as tdt
+import todopomo as tp
+import todopomo_index as indexing
+import todopomo_sorted as sorting
+import todopomo_render as render
+import generate
+
+#ratio to the previous run above which a result is reported as regression
+REGRESSION = 1.2
+
+def fresh_state(directory):
+    """
+    Point todopomo's files to directory and forget its in-memory state
+    """
+    tp.IDS_STATE = os.path.join(directory, 'todopomo_ids.json')
+    tp.LOG_FILE = os.path.join(directory, 'todopomo_log.txt')
+    tp.ROLLUP_FILE = os.path.join(directory, 'todopomo_rollup.json')
+    tp.DONE_TXT = os.path.join(directory, 'done.txt')
+    tp.todo_index = indexing.TodoIndex()
+    tp._tdid_allocator = None
+    if tp._log_writer is not None:
+        tp._log_writer.close()
+    tp._log_writer = None
+    tp._rollups = None
+    tp._done_archive = None
+    for path in (tp.IDS_STATE, tp.ROLLUP_FILE):
+        if os.path.isfile(path):
+            os.remove(path)
+
+def measure(f, setup, repeat):
+    """
+    Time f(*setup()) `repeat` times, setup not being timed
+    returns: list of seconds
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        t0 = time.perf_counter()
+        f(*args)
+        times.append(time.perf_counter() - t0)
+    return times
+
+def write_pomos(n):
+    t = datetime(2020, 1, 1, 8)
+    for _ in range(n):
+        tp.write_pomo(t, t + timedelta(minutes=25), 1500, 'P_2020-01-01_1',
+                      'endpoint')
+    tp.log_writer().flush()
+
+QUERIES = ['garden', 'rev', '+project1', '@office call', 'write dra', 'zzz']
+
+def run_queries(index):
+    for query in QUERIES:
+        index.query(query, limit=render.PAGE_SIZE)
+
+def cases(directory, size):
+    """
+    The benchmarks for one size of files
+    returns: list of (name, function, setup)
+    """
+    todo_txt = os.path.join(directory, 'todo.txt')
+    out_txt = os.path.join(directory, 'todo_out.txt')
+    generate.make_todo_txt(todo_txt, size)
+    todo_list = tdt.from_file(todo_txt)
+    tdt.to_file(out_txt, todo_list)
+
+    def parsed():
+        fresh_state(directory)
+        return tdt.from_file(todo_txt),
+
+    def shuffled():
+        todos = tp.todo_id(parsed()[0])
+        random.Random(0).shuffle(todos)
+        return todos,
+
+    def indexed():
+        return sorting.SortedTodoList(tp.todo_id(parsed()[0])),
+
+    def no_input():
+        #make_todays_list() asks which To-dos to remove: none
+        builtins.input = lambda *args: ''
+        return indexed()
+
+    def text_indexed():
+        index = indexing.TodoIndex(tp.todo_id(parsed()[0]))
+        index.query('build')
+        return index,
+
+    def empty_log():
+        fresh_state(directory)
+        if os.path.isfile(tp.LOG_FILE):
+            os.remove(tp.LOG_FILE)
+        return size,
+
+    def silent(f):
+        def run(*args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                f(*args)
+        return run
+
+    return [('tdt.from_file', tdt.from_file, lambda: (todo_txt,)),
+            ('tdt.to_file', tdt.to_file, lambda: (out_txt, todo_list)),
+            ('todo_id', tp.todo_id, parsed),
+            ('sort_todo_list', tp.sort_todo_list, shuffled),
+            ('SortedTodoList', sorting.SortedTodoList, shuffled),
+            ('print_list', silent(tp.print_list), indexed),
+            ('make_todays_list', silent(tp.make_todays_list), no_input),
+            ('TodoIndex.query x{}'.format(len(QUERIES)), run_queries,
+                                                         text_indexed),
+            ('write_pomo', write_pomos, empty_log)]
+
+def run(sizes, repeat):
+    results = []
+    original_input = builtins.input
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                for name, f, setup in cases(directory, size):
+                    times = measure(f, setup, repeat)
+                    results.append({'name': name, 'size': size,
+                                    'best': min(times), 'times': times})
+                    print("{:<18} {:>9} {:>10.4f} s".format(name, size,
+                                                            min(times)))
+                fresh_state(directory)
+    finally:
+        builtins.input = original_input
+    return results
+
+def compare(results, previous_file):
+    """
+    Print the ratio of each result to the same benchmark in a previous run
+    returns: number of regressions
+    """
+    with open(previous_file) as fd:
+        previous = {(r['name'], r['size']): r['best']
+                    for r in json.load(fd)['results']}
+    regressions = 0
+    print("\ncompared to {}:".format(previous_file))
+    for r in results:
+        before = previous.get((r['name'], r['size']))
+        if not before:
+            continue
+        ratio = r['best'] / before
+        flag = ''
+        if ratio > REGRESSION:
+            flag = ' REGRESSION'
+            regressions += 1
+        print("{:<18} {:>9} {:>7.2f}x{}".format(r['name'], r['size'], ratio,
+                                                 flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-s', '--sizes', default='1000,10000,100000',
+                        help='comma-separated numbers of To-dos (and log '
+                             'records), eg 1000,10000,100000,1000000')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('-c', '--compare', help='results of a previous run')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run(sizes, args.repeat)
+    with open(args.output, 'w') as fd:
+        json.dump({'date': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'repeat': args.repeat, 'results': results}, fd, indent=1)
+    print("results written to {}".format(args.output))
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+The archive of completed To-dos (todopomo_archive): To-dos completed a while
+ago are moved to done.txt, which is only read when needed.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo_archive as archiving
+
+def days_ago(days):
+    return (date.today() - timedelta(days=days)).isoformat()
+
+def todos(*lines):
+    return [tdt.from_string(line)[0] for line in lines]
+
+def texts(todo_list):
+    return [todo.text for todo in todo_list]
+
+@pytest.fixture
+def done_file(tmp_path):
+    return str(tmp_path / 'done.txt')
+
+def test_archive(done_file):
+    todo_list = todos('x {} old'.format(days_ago(30)),
+                      'x {} recent'.format(days_ago(2)),
+                      'x undated',
+                      '(A) open',
+                      'x {} just too old'.format(days_ago(8)),
+                      'x {} just kept'.format(days_ago(7)))
+    archive = archiving.Archive(done_file)
+    remaining, archived = archive.archive(todo_list, 7)
+    assert texts(remaining) == ['recent', 'undated', 'open', 'just kept']
+    assert texts(archived) == ['old', 'just too old']
+    assert texts(tdt.from_file(done_file)) == ['old', 'just too old']
+    assert archive.archive(remaining, 7) == (remaining, [])
+
+def test_appended_to_done_txt(done_file):
+    #written by another client, without a newline at the end
+    with open(done_file, 'w') as fd:
+        fd.write('x 2020-01-01 earlier')
+    archive = archiving.Archive(done_file)
+    archive.archive(todos('x {} old'.format(days_ago(30))), 7)
+    archive.archive(todos('x {} older'.format(days_ago(60))), 7)
+    assert texts(tdt.from_file(done_file)) == ['earlier', 'old', 'older']
+
+def test_read_on_first_use(done_file):
+    archive = archiving.Archive(done_file)
+    with open(done_file, 'w') as fd:
+        fd.write('x 2020-01-01 earlier\n')
+    assert texts(archive.todos()) == ['earlier']
+    #later archived To-dos are added to those read
+    archive.archive(todos('x {} old'.format(days_ago(30))), 7)
+    assert texts(archive.todos()) == ['earlier', 'old']
+
+def test_no_done_txt(done_file):
+    assert archiving.Archive(done_file).todos() == []
+    assert not os.path.isfile(done_file)
@@ -0,0 +1,66 @@
+"""
+Batch edits (todopomo_batch): the selection of To-dos, the operations, and
+their effect on a To-do.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo_batch as batch
+
+PRIORITIES = 'ABCDEF'
+
+@pytest.mark.parametrize('text, numbers', [
+    ('3', [3]),
+    ('0-2,5', [0, 1, 2, 5]),
+    (' 1 - 3 , 2 ', [1, 2, 3]),
+    ('7-', [7, 8, 9]),
+    ('8-,0', [0, 8, 9]),
+    ('4-4', [4]),
+    ('9', [9]),
+])
+def test_selection(text, numbers):
+    assert batch.parse_selection(text, 10) == numbers
+
+@pytest.mark.parametrize('text', ['', 'a', '1,', ',1', '1-2-3', '-3', '10',
+                                  '5-10', '3-1', '1 2', 'PA'])
+def test_selection_refused(text):
+    assert batch.parse_selection(text, 10) is None
+
+def test_operations():
+    assert batch.parse_operations('PA, p, pb,X,x, t,R, +garden,-home_work',
+                                  PRIORITIES) \
+           == [('priority', 'A'), ('priority', None), ('priority', 'B'),
+               ('complete', None), ('complete', None), ('add_today', None),
+               ('remove_today', None), ('add_project', 'garden'),
+               ('remove_project', 'home_work')]
+
+@pytest.mark.parametrize('text', ['PZ', 'PAB', 'Q', '+', '-', '+two words',
+                                  'XX', 'PA,', ''])
+def test_operations_refused(text):
+    with pytest.raises(ValueError):
+        batch.parse_operations(text, PRIORITIES)
+
+def test_apply():
+    todo = tdt.from_string('(B) write +draft +home')[0]
+    operations = batch.parse_operations('PA,+garden,-home,+draft,T',
+                                        PRIORITIES)
+    projects = todo.projects
+    assert batch.apply(todo, operations)
+    assert todo.priority == 'A'
+    assert todo.projects == ['draft', 'garden']
+    #assigned, not changed in place
+    assert projects == ['draft', 'home']
+    assert not batch.apply(todo, operations)
+    assert not batch.apply(todo, batch.parse_operations('T,R', PRIORITIES))
+    assert batch.apply(todo, batch.parse_operations('X,P', PRIORITIES))
+    assert todo.completed
+    assert todo.completion_date == date.today().isoformat()
+    assert todo.priority is None
@@ -0,0 +1,80 @@
+"""
+The tdid allocator (todopomo_ids): tdids are never handed out twice, across
+sessions and processes sharing the state file, and duplicated tdids are
+repaired.
+
+usage: python -m pytest tests
+"""
+import json
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo_ids as ids
+
+TODAY = 'P_' + date.today().isoformat() + '_'
+
+@pytest.fixture
+def state_file(tmp_path):
+    return str(tmp_path / 'todopomo_ids.json')
+
+def todos(*lines):
+    return [tdt.from_string(line)[0] for line in lines]
+
+def tdids(todo_list):
+    return [todo.tags.get('tdid') for todo in todo_list]
+
+def test_tag(state_file):
+    todo_list = todos('one', 'two tdid:{}0'.format(TODAY), 'three')
+    allocator = ids.TdidAllocator(state_file)
+    assert allocator.tag(todo_list) == [todo_list[0], todo_list[2]]
+    #today's 0 is in use already
+    assert tdids(todo_list) == [TODAY + '1', TODAY + '0', TODAY + '2']
+    assert allocator.tag(todo_list) == []
+
+def test_not_handed_out_again(state_file):
+    first = todos('one', 'two')
+    ids.TdidAllocator(state_file).tag(first)
+    #the To-dos are gone, their tdids are still not handed out again
+    second = todos('three')
+    ids.TdidAllocator(state_file).tag(second)
+    assert tdids(second) == [TODAY + '2']
+
+def test_processes_sharing_the_state(state_file):
+    allocators = [ids.TdidAllocator(state_file) for _ in range(2)]
+    handed_out = []
+    for i in range(10):
+        todo_list = todos('To-do {}'.format(i))
+        allocators[i % 2].tag(todo_list)
+        handed_out += tdids(todo_list)
+    assert sorted(handed_out) == sorted(TODAY + str(n) for n in range(10))
+
+def test_new_day(state_file):
+    with open(state_file, 'w') as fd:
+        json.dump({'day': '2000-01-01', 'counter': 5}, fd)
+    allocator = ids.TdidAllocator(state_file)
+    assert allocator.allocate() == TODAY + '0'
+
+def test_unreadable_state(state_file):
+    with open(state_file, 'w') as fd:
+        fd.write('{"day": ')
+    todo_list = todos('one')
+    ids.TdidAllocator(state_file).tag(todo_list)
+    assert tdids(todo_list) == [TODAY + '0']
+
+def test_repair(state_file):
+    todo_list = todos('one tdid:P_1', 'two tdid:P_1', 'three',
+                      'four tdid:P_2', 'five tdid:P_1')
+    allocator = ids.TdidAllocator(state_file)
+    assert allocator.repair(todo_list) == [('P_1', TODAY + '0'),
+                                           ('P_1', TODAY + '1')]
+    assert tdids(todo_list) == ['P_1', TODAY + '0', None, 'P_2', TODAY + '1']
+    assert allocator.repair(todo_list) == []
+    allocator.tag(todo_list)
+    assert todo_list[2].tags['tdid'] == TODAY + '2'
+    assert len(set(tdids(todo_list))) == len(todo_list)
@@ -0,0 +1,155 @@
+"""
+The index of To-dos (todopomo_index): search() and query() give the same
+To-dos, in the same order, as a brute-force scan of the list - through adds,
+removals and changes, with and without limit and within, whichever way
+query() finds them (all matches scored, the best band only, or the walk in
+ranking order stopping early, see TodoIndex._top).
+
+usage: python -m pytest tests
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo_index as indexing
+
+WORDS = ['garden', 'gard', 'go', 'write', 'draft', 'dr', 'home', 'x1', 'x10']
+PROJECTS = ['garden', 'work', 'go', 'x1']
+CONTEXTS = ['home', 'office', 'gard']
+QUERIES = ['garden', 'gard', 'g', 'go', '+garden', '+g', '@home', 'dr',
+           'write dr', 'x1', 'x', 'garden home', 'k:go', 'g d w', 'zz', 'o',
+           'GARDEN Draft']
+
+def random_todo(rng, n):
+    todo = tdt.Todo(text=' '.join(rng.choice(WORDS)
+                                  for _ in range(rng.randint(1, 4))),
+                    priority=rng.choice('AB') if rng.random() < .5 else None)
+    todo.projects = rng.sample(PROJECTS, rng.randint(0, 2))
+    todo.contexts = rng.sample(CONTEXTS, rng.randint(0, 1))
+    todo.tags = {'tdid': 'P_{:04d}'.format(n)}
+    if rng.random() < .3:
+        todo.tags['k'] = rng.choice(WORDS)
+    if rng.random() < .3:
+        todo.completion_date = '2024-01-01'
+    return todo
+
+def change(rng, todo):
+    what = rng.random()
+    if what < .3:
+        if todo.completed:
+            todo.completed = False
+        else:
+            todo.completion_date = '2024-01-01'
+    elif what < .6:
+        todo.text = rng.choice(WORDS) + ' ' + rng.choice(WORDS)
+    else:
+        todo.projects = rng.sample(PROJECTS, rng.randint(0, 2))
+
+def brute_query(todo_list, text, within=None, limit=None):
+    terms = indexing.query_terms(text)
+    if not terms:
+        return []
+    ranked, bonus = [], indexing.EXACT_BONUS
+    for todo in todo_list if within is None else within:
+        tokens = indexing.tokens_of(todo)
+        score = 0
+        for term in terms:
+            term_score = max([weight * (bonus if token == term else 1)
+                              for token, weight in tokens.items()
+                              if token.startswith(term)] or [0])
+            if not term_score:
+                break
+            score += term_score
+        else:
+            ranked.append((-score, bool(todo.completed), todo.tags['tdid']))
+    ranked.sort()
+    return [tdid for score, completed, tdid in ranked[:limit]]
+
+def brute_search(todo_list, priority=None, project=None, context=None,
+                 completed=None):
+    return sorted(todo.tags['tdid'] for todo in todo_list
+                  if (priority is None or todo.priority == priority)
+                  and (project is None or project in todo.projects)
+                  and (context is None or context in todo.contexts)
+                  and (completed is None or bool(todo.completed) == completed))
+
+def tdids(todo_list):
+    return [todo.tags['tdid'] for todo in todo_list]
+
+def check(rng, index, todo_list):
+    assert len(index) == len(todo_list)
+    for todo in todo_list:
+        assert todo in index and index.get(todo.tags['tdid']) is todo
+    for text in QUERIES:
+        within = None
+        if rng.random() < .4:
+            within = rng.sample(todo_list, min(len(todo_list),
+                                               rng.choice((1, 5, 50, 1000))))
+        limit = rng.choice((None, 1, 3, 10, 40))
+        assert tdids(index.query(text, within=within, limit=limit)) \
+               == brute_query(todo_list, text, within, limit), (text, limit)
+    for criteria in ({'priority': 'A'}, {'project': 'garden'},
+                     {'context': 'home', 'completed': False},
+                     {'priority': 'B', 'project': 'work', 'completed': True}):
+        assert sorted(tdids(index.search(**criteria))) \
+               == brute_search(todo_list, **criteria)
+
+@pytest.mark.parametrize('seed', range(15))
+def test_against_brute_force(seed):
+    rng = random.Random(seed)
+    todo_list = [random_todo(rng, n) for n in range(rng.randint(1, 300))]
+    n = len(todo_list)
+    index = indexing.TodoIndex(todo_list)
+    check(rng, index, todo_list)
+    for _ in range(30):
+        operation = rng.random()
+        if operation < .3 or not todo_list:
+            todo = random_todo(rng, n)
+            n += 1
+            todo_list.append(todo)
+            index.add(todo)
+        elif operation < .5:
+            index.remove(todo_list.pop(rng.randrange(len(todo_list))))
+        else:
+            todo = rng.choice(todo_list)
+            change(rng, todo)
+            index.update(todo)
+        check(rng, index, todo_list)
+
+def test_early_termination(monkeypatch):
+    #many To-dos: the best matches of common words are found by _top()
+    rng = random.Random(1)
+    todo_list = [random_todo(rng, n) for n in range(3000)]
+    index = indexing.TodoIndex(todo_list)
+    found = []
+    top = indexing.TodoIndex._top
+    def counted_top(self, *args):
+        result = top(self, *args)
+        found.append(result is not None)
+        return result
+    monkeypatch.setattr(indexing.TodoIndex, '_top', counted_top)
+    within = rng.sample(todo_list, 2000)
+    for text in QUERIES:
+        for limit in (1, 10, 40):
+            assert tdids(index.query(text, limit=limit)) \
+                   == brute_query(todo_list, text, limit=limit)
+            assert tdids(index.query(text, within=within, limit=limit)) \
+                   == brute_query(todo_list, text, within, limit)
+    #both ways: found early, and given up for a full scoring
+    assert any(found) and not all(found)
+
+def test_tokens_and_terms():
+    todo = tdt.from_string('(A) Write the Draft +home_work @office '
+                           'due:2024-01-31 tdid:P_1')[0]
+    tokens = indexing.tokens_of(todo)
+    assert tokens['write'] == tokens['draft'] == indexing.TEXT_WEIGHT
+    assert tokens['+home_work'] == tokens['home_work'] == indexing.NAME_WEIGHT
+    assert tokens['@office'] == tokens['office'] == indexing.NAME_WEIGHT
+    assert tokens['due:2024-01-31'] == indexing.TAG_WEIGHT
+    assert indexing.query_terms('Write +Home due:2024 a-b') \
+           == ['write', '+home', 'due:2024', 'a', 'b']
@@ -0,0 +1,108 @@
+"""
+The journal of To-do changes (todopomo_journal): records replayed on top of
+the snapshot, the latest record of a tdid winning, and a partly written
+last record (a crash while appending) ignored.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo as tp
+import todopomo_index as indexing
+import todopomo_journal as journal
+
+def todo(line):
+    return tdt.from_string(line)[0]
+
+def lines(todo_list):
+    return [str(todo) for todo in todo_list]
+
+@pytest.fixture
+def journal_file(tmp_path):
+    return str(tmp_path / 'todo_txt.journal')
+
+def test_replay_replaces_and_appends(journal_file):
+    snapshot = [todo('(A) one tdid:P_1'), todo('(B) two tdid:P_2')]
+    journal.append(journal_file, todo('(C) one tdid:P_1'))
+    journal.extend(journal_file, [todo('(D) three tdid:P_3'),
+                                  todo('(E) one again tdid:P_1')])
+    todo_list, replayed = journal.replay(journal_file, snapshot)
+    assert replayed == 2
+    assert lines(todo_list) == ['(E) one again tdid:P_1', '(B) two tdid:P_2',
+                                '(D) three tdid:P_3']
+
+def test_no_journal(journal_file):
+    snapshot = [todo('(A) one tdid:P_1')]
+    assert journal.replay(journal_file, snapshot) == (snapshot, 0)
+    assert journal.read(journal_file) == {}
+    assert journal.size(journal_file) == 0
+    assert journal.token(journal_file) is None
+
+def test_partly_written_record_ignored(journal_file):
+    journal.append(journal_file, todo('(A) one tdid:P_1'))
+    size = journal.size(journal_file)
+    #crash in the middle of the next record
+    with open(journal_file, 'a') as fd:
+        fd.write('P_2\t(B) tw')
+    assert journal.read(journal_file) == {'P_1': '(A) one tdid:P_1'}
+    records, offset = journal.read_since(journal_file)
+    assert offset == size
+    #the record completed later is read from there
+    with open(journal_file, 'a') as fd:
+        fd.write('o tdid:P_2\n')
+    assert journal.read_since(journal_file, offset) \
+           == ({'P_2': '(B) two tdid:P_2'}, journal.size(journal_file))
+
+def test_token_changes_with_each_journal(journal_file):
+    journal.append(journal_file, todo('(A) one tdid:P_1'))
+    first = journal.token(journal_file)
+    assert first
+    journal.append(journal_file, todo('(B) one tdid:P_1'))
+    assert journal.token(journal_file) == first
+    journal.clear(journal_file)
+    assert not os.path.isfile(journal_file)
+    journal.append(journal_file, todo('(C) one tdid:P_1'))
+    assert journal.token(journal_file) not in (None, first)
+
+def test_compact(journal_file, tmp_path):
+    snapshot_file = str(tmp_path / 'todo_txt.tmp')
+    journal.append(journal_file, todo('(A) one tdid:P_1'))
+    assert not journal.compact_if_needed(journal_file, snapshot_file,
+                                         [todo('(A) one tdid:P_1')], 1000)
+    assert os.path.isfile(journal_file) and not os.path.isfile(snapshot_file)
+    assert journal.compact_if_needed(journal_file, snapshot_file,
+                                     [todo('(A) one tdid:P_1')], 10)
+    assert not os.path.isfile(journal_file)
+    assert lines(tdt.from_file(snapshot_file)) == ['(A) one tdid:P_1']
+
+def test_session_restarted_after_crash(tmp_path, monkeypatch):
+    #a session saved changes to the journal, then crashed: the next one
+    #starts from todo_txt.tmp with the journal replayed
+    (tmp_path / 'todo.txt').write_text('(A) old tdid:P_2024-01-01_0\n')
+    (tmp_path / 'todo_txt.tmp').write_text('(B) snapshot tdid:P_2024-01-01_0\n'
+                                           '(C) other tdid:P_2024-01-01_1\n')
+    monkeypatch.chdir(tmp_path)
+    journal.extend(tp.JOURNAL_FILE,
+                   [todo('(D) journalled tdid:P_2024-01-01_0'),
+                    todo('(E) new tdid:P_2024-01-01_2')])
+    with open(tp.JOURNAL_FILE, 'a') as fd:
+        fd.write('P_2024-01-01_1\t(F) half wri')
+    monkeypatch.setattr(tp, 'WATCH_TODO_TXT', False)
+    monkeypatch.setattr(tp, 'USE_CACHE', False)
+    monkeypatch.setattr(tp, 'todo_index', indexing.TodoIndex())
+    for name in ('_todo_store', '_tdid_allocator', '_done_archive'):
+        monkeypatch.setattr(tp, name, None)
+    list_of_todos = tp.load_todos()
+    assert sorted(lines(list_of_todos)) == ['(C) other tdid:P_2024-01-01_1',
+                                            '(D) journalled tdid:P_2024-01-01_0',
+                                            '(E) new tdid:P_2024-01-01_2']
+    #and saved to the snapshot, the journal emptied
+    assert sorted(lines(tdt.from_file(tp.TODO_TXT_TMP))) \
+           == sorted(lines(list_of_todos))
+    assert journal.read(tp.JOURNAL_FILE) == {}
@@ -0,0 +1,113 @@
+"""
+The Pomodoro log writer (todopomo_log): the CSV log and its binary sidecar
+hold the same records, whether written by one or several writers, or
+converted from an existing CSV log.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import todopomo_log as pomo_log
+
+START = datetime(2024, 3, 1, 9, 0)
+RECORDS = [(START, START + timedelta(minutes=25), 1500., 'P_1', 'slides'),
+           (START + timedelta(minutes=25), START + timedelta(minutes=30),
+            300., 'break', ''),
+           (START + timedelta(minutes=30), START + timedelta(minutes=40), 0.,
+            'P_2', pomo_log.INTERRUPTED),
+           (START + timedelta(hours=1), START + timedelta(minutes=110), 3000.,
+            'P_1', 'draft, with a comma - et accentué')]
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'todopomo_log.txt')
+
+def write_record(writer, record):
+    start, stop, duration, tdid, endpoint = record
+    writer.write(start, stop, duration, tdid, endpoint)
+
+def write(log_file, records, **options):
+    writer = pomo_log.PomoLogWriter(log_file, **options)
+    for record in records:
+        write_record(writer, record)
+    writer.close()
+
+def as_binary(records):
+    return [(tdid, int(start.timestamp()), int(stop.timestamp()), duration,
+             endpoint) for start, stop, duration, tdid, endpoint in records]
+
+def as_csv(records):
+    return [(tdid, start, stop, duration, endpoint)
+            for start, stop, duration, tdid, endpoint in records]
+
+def sidecar_content(log_file):
+    content = []
+    for path in pomo_log.sidecar_paths(log_file):
+        with open(path, 'rb') as fd:
+            content.append(fd.read())
+    return content
+
+def test_csv_and_sidecar(log_file):
+    write(log_file, RECORDS)
+    assert list(pomo_log.iter_csv(log_file)) == as_csv(RECORDS)
+    assert list(pomo_log.iter_binary(log_file)) == as_binary(RECORDS)
+    with open(log_file) as fd:
+        assert fd.read().count(pomo_log.LOG_HEADER) == 1
+    assert pomo_log.read_tdids(pomo_log.sidecar_paths(log_file)[1]) \
+           == ['P_1', 'break', 'P_2']
+
+def test_buffered_until_flush(log_file):
+    writer = pomo_log.PomoLogWriter(log_file, flush_every=3)
+    for record in RECORDS[:2]:
+        write_record(writer, record)
+    assert not os.path.isfile(log_file)
+    write_record(writer, RECORDS[2])
+    assert len(list(pomo_log.iter_csv(log_file))) == 3
+    write_record(writer, RECORDS[3])
+    assert len(list(pomo_log.iter_binary(log_file))) == 3
+    writer.close()
+    assert list(pomo_log.iter_binary(log_file)) == as_binary(RECORDS)
+
+def test_several_writers(log_file):
+    first = pomo_log.PomoLogWriter(log_file)
+    second = pomo_log.PomoLogWriter(log_file)
+    for i, record in enumerate(RECORDS):
+        write_record((first, second)[i % 2], record)
+    first.close()
+    second.close()
+    assert list(pomo_log.iter_csv(log_file)) == as_csv(RECORDS)
+    assert list(pomo_log.iter_binary(log_file)) == as_binary(RECORDS)
+    #each tdid once in the table, though both writers met P_1
+    assert pomo_log.read_tdids(pomo_log.sidecar_paths(log_file)[1]) \
+           == ['P_1', 'break', 'P_2']
+
+def test_convert_as_written(log_file):
+    write(log_file, RECORDS)
+    written = sidecar_content(log_file)
+    assert pomo_log.convert(log_file) == len(RECORDS)
+    assert sidecar_content(log_file) == written
+
+def test_sidecar_built_for_existing_csv(log_file):
+    write(log_file, RECORDS[:2], binary=False)
+    assert not os.path.isfile(pomo_log.sidecar_paths(log_file)[0])
+    write(log_file, RECORDS[2:])
+    assert list(pomo_log.iter_binary(log_file)) == as_binary(RECORDS)
+
+def test_convert_records_and_append(tmp_path, log_file):
+    write(log_file, RECORDS)
+    other = str(tmp_path / 'other.txt')
+    assert pomo_log.convert(other, as_csv(RECORDS[:2])) == 2
+    assert pomo_log.convert(other, as_csv(RECORDS[2:]), append=True) == 2
+    assert sidecar_content(other) == sidecar_content(log_file)
+
+def test_incomplete_record_ignored(log_file):
+    write(log_file, RECORDS)
+    with open(pomo_log.sidecar_paths(log_file)[0], 'ab') as fd:
+        fd.write(b'\x01\x02\x03')
+    assert list(pomo_log.iter_binary(log_file)) == as_binary(RECORDS)
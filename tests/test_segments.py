@@ -0,0 +1,159 @@
+"""
+The rotation of the log into monthly segments (todopomo_segments): no record
+is lost or read twice, whatever the date range asked of iter_log(), and the
+index and binary sidecar of the segments follow them.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'todopomo_log.txt')
+
+def log(log_file, day, tdids):
+    """
+    Log 25 minute Pomodoros of tdids one after the other from 9:00
+    returns: their records, as read back
+    """
+    writer = pomo_log.PomoLogWriter(log_file)
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=9)
+    records = []
+    for tdid in tdids:
+        stop = start + timedelta(minutes=25)
+        writer.write(start, stop, 1500., tdid, 'done')
+        records.append((tdid, start, stop, 1500., 'done'))
+        start = stop
+    writer.close()
+    return records
+
+def months(log_file):
+    return sorted(segments.load_index(log_file))
+
+def test_rotate(log_file):
+    records = log(log_file, date(2024, 1, 8), ['P_1', 'P_2', 'P_1'])
+    records += log(log_file, date(2024, 2, 5), ['P_2'])
+    size = os.path.getsize(log_file)
+    #the bytes removed from the start of the log
+    assert segments.rotate(log_file, date(2024, 2, 10)) \
+           == size - os.path.getsize(log_file)
+    assert segments.rotate(log_file, date(2024, 2, 20)) == 0
+    size = os.path.getsize(log_file)
+    records += log(log_file, date(2024, 3, 4), ['P_3'])
+    assert segments.rotate(log_file, date(2024, 3, 10)) \
+           == size - len(pomo_log.LOG_HEADER)
+    assert months(log_file) == ['2024-01', '2024-02']
+    assert list(pomo_log.iter_csv(log_file)) == records[4:]
+    assert list(segments.iter_log(log_file)) == records
+    assert list(segments.iter_log(log_file, live=False)) == records[:4]
+
+def test_index(log_file):
+    log(log_file, date(2024, 1, 8), ['P_1', 'P_2', 'P_1'])
+    log(log_file, date(2024, 1, 9), ['break'])
+    segments.rotate(log_file, date(2024, 2, 1))
+    entry = segments.load_index(log_file)['2024-01']
+    assert (entry['file'], entry['first'], entry['last'], entry['records']) \
+           == ('todopomo_log.2024-01.txt.gz', '2024-01-08T09:00',
+               '2024-01-09T09:00', 4)
+    content = segments.read_segment(segments.segment_path(log_file, '2024-01'))
+    assert content.startswith(pomo_log.LOG_HEADER.encode())
+    for tdid, count in (('P_1', 2), ('P_2', 1), ('break', 1)):
+        offsets = entry['tdids'][tdid]
+        assert len(offsets) == count
+        assert all(content[offset:].startswith(tdid.encode() + b',')
+                   for offset in offsets)
+    #the same when rebuilt from the segments
+    os.remove(segments.index_path(log_file))
+    assert segments.load_index(log_file) == {'2024-01': entry}
+
+def test_rotated_into_existing_segment(log_file):
+    records = log(log_file, date(2024, 1, 8), ['P_1'])
+    segments.rotate(log_file, date(2024, 1, 20))
+    records += log(log_file, date(2024, 1, 22), ['P_2'])
+    assert segments.rotate(log_file, date(2024, 2, 1)) > 0
+    assert months(log_file) == ['2024-01']
+    assert segments.load_index(log_file)['2024-01']['records'] == 2
+    assert list(segments.iter_log(log_file)) == records
+
+def test_iter_log_ranges(log_file):
+    records = []
+    for day in (date(2024, 1, 8), date(2024, 1, 31), date(2024, 2, 1),
+                date(2024, 2, 29), date(2024, 3, 1), date(2024, 3, 4)):
+        records += log(log_file, day, ['P_1', 'P_2', 'break'])
+    segments.rotate(log_file, date(2024, 3, 10))
+    assert list(segments.iter_log(log_file)) == records
+    for start, end in ((None, None), (date(2024, 1, 31), None),
+                       (None, date(2024, 2, 1)), (date(2024, 2, 1),
+                                                  date(2024, 3, 1)),
+                       (date(2024, 2, 29), date(2024, 3, 4)),
+                       (datetime(2024, 1, 31, 9, 25),
+                        datetime(2024, 3, 1, 9, 25)),
+                       ('2024-02-29T09:50', '2024-03-04T09:00'),
+                       (date(2024, 3, 5), None), (None, date(2024, 1, 1))):
+        key_start, key_end = segments.as_key(start), segments.as_key(end)
+        for tdid in (None, 'P_2', 'break', 'P_9'):
+            expected = [record for record in records
+                        if (tdid is None or record[0] == tdid)
+                        and (key_start is None
+                             or record[1].isoformat() >= key_start)
+                        and (key_end is None
+                             or record[1].isoformat() < key_end)]
+            assert list(segments.iter_log(log_file, start, end, tdid)) \
+                   == expected, (start, end, tdid)
+
+def test_records_out_of_order(log_file):
+    records = log(log_file, date(2024, 1, 8), ['P_1'])
+    records += log(log_file, date(2024, 3, 4), ['P_2'])
+    records += log(log_file, date(2024, 2, 5), ['P_3'])
+    assert segments.rotate(log_file, date(2024, 3, 10)) is None
+    assert months(log_file) == ['2024-01', '2024-02']
+    assert list(pomo_log.iter_csv(log_file)) == [records[1]]
+    assert sorted(segments.iter_log(log_file), key=lambda record: record[1]) \
+           == sorted(records, key=lambda record: record[1])
+
+def test_partly_written_line_kept(log_file):
+    records = log(log_file, date(2024, 1, 8), ['P_1'])
+    with open(log_file, 'a') as fd:
+        fd.write('P_2,2024-01-08T09:25,2024-01-0')
+    segments.rotate(log_file, date(2024, 2, 1))
+    assert list(segments.iter_log(log_file, live=False)) == records
+    with open(log_file) as fd:
+        assert fd.read() \
+               == pomo_log.LOG_HEADER + 'P_2,2024-01-08T09:25,2024-01-0'
+
+def binary(records):
+    return [(tdid, int(start.timestamp()), int(stop.timestamp()), duration,
+             endpoint) for tdid, start, stop, duration, endpoint in records]
+
+def test_segments_sidecar(log_file):
+    records = log(log_file, date(2024, 1, 8), ['P_1', 'P_2'])
+    segments.rotate(log_file, date(2024, 2, 1))
+    assert not segments.stale_sidecar(log_file)
+    sidecar = segments.segments_sidecar(log_file)
+    assert list(pomo_log.iter_binary(sidecar)) == binary(records)
+    #later months are appended to it
+    records += log(log_file, date(2024, 2, 5), ['P_3'])
+    segments.rotate(log_file, date(2024, 3, 1))
+    assert list(pomo_log.iter_binary(sidecar)) == binary(records)
+    #missing, or older than the index: rebuilt
+    for path in pomo_log.sidecar_paths(sidecar):
+        os.remove(path)
+    assert segments.stale_sidecar(log_file)
+    assert list(pomo_log.iter_binary(segments.segments_sidecar(log_file))) \
+           == binary(records)
+    bin_file = pomo_log.sidecar_paths(sidecar)[0]
+    mtime = os.path.getmtime(segments.index_path(log_file))
+    os.utime(bin_file, (mtime - 10, mtime - 10))
+    assert segments.stale_sidecar(log_file)
+    segments.segments_sidecar(log_file)
+    assert not segments.stale_sidecar(log_file)
+    assert list(pomo_log.iter_binary(sidecar)) == binary(records)
@@ -0,0 +1,142 @@
+"""
+SortedTodoList keeps exactly the order of sort_todo_list(): checked on
+random lists of To-dos (todotxtio.Todo and CompactTodo), through adds,
+removals and changes of priority, completion and tdid.
+
+To-dos equal on all the keys keep the order in which they were added, as
+sort_todo_list() (a stable sort) keeps their order in the list: the
+reference list below appends added To-dos, and moves a To-do to its end
+when a change moves it in the order.
+
+usage: python -m pytest tests
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import todotxtio as tdt
+
+import todopomo as tp
+import todopomo_compact as compact
+import todopomo_sorted as sorting
+
+PRIORITIES = [None, 'R', 'A', 'B', 'C', 'F', 'I', 'U']
+#few tdids, so that many To-dos are equal on all the keys
+TDIDS = ['P_2024-01-0{}_{}'.format(day, n) for day in (1, 2)
+                                           for n in (0, 1, 10)]
+
+def random_todo(rng, cls):
+    todo = cls(text='To-do {}'.format(rng.random()),
+               priority=rng.choice(PRIORITIES))
+    todo.tags = {'tdid': rng.choice(TDIDS)}
+    if rng.random() < 0.3:
+        todo.completion_date = '2024-02-01'
+    return todo
+
+def change(rng, todo):
+    what = rng.choice(('priority', 'completed', 'tdid', 'text'))
+    if what == 'priority':
+        todo.priority = rng.choice(PRIORITIES)
+    elif what == 'completed':
+        if todo.completed:
+            todo.completed = False
+        else:
+            todo.completion_date = '2024-02-02'
+    elif what == 'tdid':
+        todo.tags['tdid'] = rng.choice(TDIDS)
+    else:
+        todo.text = 'changed'
+
+def expected(reference):
+    todo_list = list(reference)
+    tp.sort_todo_list(todo_list)
+    return todo_list
+
+def check(sorted_list, reference):
+    assert [id(todo) for todo in sorted_list] \
+           == [id(todo) for todo in expected(reference)]
+    assert len(sorted_list) == len(reference)
+    for i, todo in enumerate(sorted_list):
+        assert sorted_list[i] is todo
+        assert todo in sorted_list
+        assert sorted_list.index(todo) == i
+
+@pytest.mark.parametrize('cls', [tdt.Todo, compact.CompactTodo])
+@pytest.mark.parametrize('seed', range(20))
+def test_build(cls, seed):
+    rng = random.Random(seed)
+    todo_list = [random_todo(rng, cls) for _ in range(rng.randint(0, 60))]
+    check(sorting.SortedTodoList(todo_list), todo_list)
+
+@pytest.mark.parametrize('cls', [tdt.Todo, compact.CompactTodo])
+@pytest.mark.parametrize('seed', range(20))
+def test_add_reposition_discard(cls, seed):
+    rng = random.Random(seed)
+    reference = [random_todo(rng, cls) for _ in range(30)]
+    sorted_list = sorting.SortedTodoList(reference)
+    for _ in range(200):
+        operation = rng.choice(('add', 'discard', 'reposition'))
+        if operation == 'add' or not reference:
+            todo = random_todo(rng, cls)
+            reference.append(todo)
+            sorted_list.add(todo)
+        elif operation == 'discard':
+            todo = rng.choice(reference)
+            reference.remove(todo)
+            sorted_list.discard(todo)
+            sorted_list.discard(todo) #not in the list any more: no error
+        else:
+            todo = rng.choice(reference)
+            key = sorting.sort_key(todo)
+            change(rng, todo)
+            if sorting.sort_key(todo) != key:
+                reference.remove(todo)
+                reference.append(todo)
+            sorted_list.reposition(todo)
+        check(sorted_list, reference)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_refresh(seed):
+    rng = random.Random(seed)
+    reference = [random_todo(rng, tdt.Todo) for _ in range(40)]
+    sorted_list = sorting.SortedTodoList(reference)
+    before = list(sorted_list)
+    #changed without reposition(): refresh() moves those whose key changed,
+    #in the order they were in
+    changed = []
+    for todo in rng.sample(reference, 10):
+        key = sorting.sort_key(todo)
+        change(rng, todo)
+        if sorting.sort_key(todo) != key:
+            changed.append(todo)
+    sorted_list.refresh()
+    for todo in sorted(changed, key=before.index):
+        reference.remove(todo)
+        reference.append(todo)
+    check(sorted_list, reference)
+
+def test_priorities_and_completion():
+    todos = []
+    for priority, completed, tdid in ((None, False, 'P_1'), ('B', True, 'P_2'),
+                                      ('A', False, 'P_3'), ('R', False, 'P_4'),
+                                      ('R', True, 'P_0'), (None, True, 'P_5'),
+                                      ('A', False, 'P_1')):
+        todo = tdt.Todo(text=tdid, priority=priority)
+        todo.tags = {'tdid': tdid}
+        if completed:
+            todo.completion_date = '2024-02-01'
+        todos.append(todo)
+    sorted_list = sorting.SortedTodoList(todos)
+    #no priority first, then routine, then A, B... ; completed last
+    assert [(todo.priority, todo.completed, todo.tags['tdid'])
+            for todo in sorted_list] == [(None, False, 'P_1'),
+                                         ('R', False, 'P_4'),
+                                         ('A', False, 'P_1'),
+                                         ('A', False, 'P_3'),
+                                         (None, True, 'P_5'),
+                                         ('R', True, 'P_0'),
+                                         ('B', True, 'P_2')]
+    assert list(sorted_list) == expected(todos)
@@ -0,0 +1,140 @@
+"""
+The streaming stats (todopomo_stats): aggregates of the log kept up to date
+by reading only the lines appended since the last update, and still right
+after the log was rotated (rebase()) or replaced.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+import todopomo_stats as pomo_stats
+
+@pytest.fixture
+def files(tmp_path):
+    return str(tmp_path / 'todopomo_log.txt'), str(tmp_path / 'stats.cache')
+
+def log(log_file, day, records):
+    """
+    Log records (tdid, minutes, endpoint) one after the other from 9:00
+    """
+    writer = pomo_log.PomoLogWriter(log_file)
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=9)
+    for tdid, minutes, endpoint in records:
+        stop = start + timedelta(minutes=minutes)
+        duration = 0 if endpoint == pomo_log.INTERRUPTED else minutes * 60
+        writer.write(start, stop, duration, tdid, endpoint)
+        start = stop
+    writer.close()
+
+def from_scratch(log_file, tmp_path):
+    cache_file = str(tmp_path / 'scratch.cache')
+    if os.path.isfile(cache_file):
+        os.remove(cache_file)
+    return aggregates(pomo_stats.update(log_file, cache_file))
+
+def aggregates(stats):
+    return {key: stats[key] for key in ('days', 'weeks', 'tdids')}
+
+def test_aggregates(files):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a'), ('break', 5, ''),
+                                     ('P_1', 50, 'b'), ('break', 10, ''),
+                                     ('P_2', 7, pomo_log.INTERRUPTED),
+                                     ('P_2', 0, 'zero length')])
+    stats = pomo_stats.update(log_file, cache_file)
+    day = stats['days']['2024-01-08']
+    assert day == {'pomos': 4, 'seconds': 4500., 'breaks': 2,
+                   'break_seconds': 900., 'interruptions': 1}
+    assert stats['weeks'] == {'2024-W02': day}
+    #breaks go to the To-do worked on before them
+    assert stats['tdids']['P_1'] == {'pomos': 3, 'seconds': 4500.,
+                                     'breaks': 2, 'break_seconds': 900.,
+                                     'interruptions': 0}
+    assert stats['tdids']['P_2'] == {'pomos': 1, 'seconds': 0., 'breaks': 0,
+                                     'break_seconds': 0., 'interruptions': 1}
+
+def test_incremental(files, tmp_path):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a'), ('break', 5, '')])
+    pomo_stats.update(log_file, cache_file)
+    offset = pomo_stats.load_cache(cache_file)['offset']
+    assert offset == os.path.getsize(log_file)
+    log(log_file, date(2024, 1, 9), [('P_2', 25, 'b')])
+    #a line being written is left for the next update
+    with open(log_file, 'a') as fd:
+        fd.write('P_3,2024-01-10T09:00,2024-01-1')
+    stats = pomo_stats.update(log_file, cache_file)
+    assert stats['offset'] > offset
+    assert 'P_3' not in stats['tdids']
+    with open(log_file, 'a') as fd:
+        fd.write('0T09:25,1500.0,"c"\n')
+    stats = pomo_stats.update(log_file, cache_file)
+    assert stats['tdids']['P_3']['pomos'] == 1
+    assert aggregates(stats) == from_scratch(log_file, tmp_path)
+
+def test_log_replaced(files, tmp_path):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a'), ('P_2', 25, 'b')])
+    pomo_stats.update(log_file, cache_file)
+    os.remove(log_file)
+    log(log_file, date(2024, 1, 9), [('P_3', 25, 'c')])
+    stats = pomo_stats.update(log_file, cache_file)
+    assert set(stats['tdids']) == {'P_3'}
+    assert aggregates(stats) == from_scratch(log_file, tmp_path)
+
+def rotate(log_file, cache_file, today):
+    #as todopomo.rotate_log()
+    pomo_stats.update(log_file, cache_file)
+    removed = segments.rotate(log_file, today)
+    pomo_stats.rebase(cache_file, log_file, removed)
+    return removed
+
+def test_rebase_after_rotation(files, tmp_path):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a'), ('break', 5, '')])
+    log(log_file, date(2024, 2, 5), [('P_2', 50, 'b')])
+    log(log_file, date(2024, 3, 4), [('P_1', 25, 'c')])
+    before = aggregates(pomo_stats.update(log_file, cache_file))
+    assert rotate(log_file, cache_file, date(2024, 3, 10)) > 0
+    stats = pomo_stats.load_cache(cache_file)
+    assert stats['offset'] == os.path.getsize(log_file)
+    assert aggregates(stats) == before
+    log(log_file, date(2024, 3, 5), [('P_3', 25, 'd')])
+    stats = pomo_stats.update(log_file, cache_file)
+    assert stats['tdids']['P_3']['pomos'] == 1
+    #the same as from scratch, which reads the segments then the log
+    assert aggregates(stats) == from_scratch(log_file, tmp_path)
+
+def test_rotation_of_records_not_read_yet(files, tmp_path):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a')])
+    pomo_stats.update(log_file, cache_file)
+    log(log_file, date(2024, 2, 5), [('P_2', 25, 'b')])
+    log(log_file, date(2024, 3, 4), [('P_3', 25, 'c')])
+    #rotated without update() first: the cache is dropped
+    pomo_stats.rebase(cache_file, log_file,
+                      segments.rotate(log_file, date(2024, 3, 10)))
+    assert not os.path.isfile(cache_file)
+    stats = pomo_stats.update(log_file, cache_file)
+    assert set(stats['tdids']) == {'P_1', 'P_2', 'P_3'}
+    assert aggregates(stats) == from_scratch(log_file, tmp_path)
+
+def test_rotation_of_records_out_of_order(files, tmp_path):
+    log_file, cache_file = files
+    log(log_file, date(2024, 1, 8), [('P_1', 25, 'a')])
+    log(log_file, date(2024, 3, 4), [('P_2', 25, 'b')])
+    log(log_file, date(2024, 2, 5), [('P_3', 25, 'c')])
+    #February moved from after March: the cache is dropped
+    assert rotate(log_file, cache_file, date(2024, 3, 10)) is None
+    assert not os.path.isfile(cache_file)
+    stats = pomo_stats.update(log_file, cache_file)
+    assert set(stats['tdids']) == {'P_1', 'P_2', 'P_3'}
+    assert aggregates(stats) == from_scratch(log_file, tmp_path)
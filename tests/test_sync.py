@@ -0,0 +1,133 @@
+"""
+A command line session and the server working on the To-dos of the same
+directory at once (see todopomo_sync): the changes of each are seen by the
+other, and neither reverts the changes of the other.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import todopomo as tp
+import todopomo_index as indexing
+import todopomo_server as todo_server
+import todopomo_sorted as sorting
+
+TODO_TXT = '(A) first tdid:P_2024-01-01_0\n(B) second tdid:P_2024-01-01_1\n'
+T1, T2 = 'P_2024-01-01_0', 'P_2024-01-01_1'
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    """
+    A directory with a todo.txt, as the current directory of a session
+    with a fresh state
+    """
+    (tmp_path / 'todo.txt').write_text(TODO_TXT)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tp, 'WATCH_TODO_TXT', False)
+    monkeypatch.setattr(tp, 'USE_CACHE', False)
+    monkeypatch.setattr(tp, 'todo_index', indexing.TodoIndex())
+    for name in ('_todo_store', '_tdid_allocator', '_done_archive'):
+        monkeypatch.setattr(tp, name, None)
+    return str(tmp_path)
+
+def priorities(todo_list):
+    return {todo.tags['tdid']: todo.priority for todo in todo_list}
+
+def session_changes():
+    changes, merged = tp.todo_store().take()
+    return {tdid: todo.priority for tdid, todo in changes}
+
+def test_server_compaction_keeps_session_changes(directory):
+    tp.load_todos()
+    server = todo_server.UserState(directory)
+    #the session saves T1, the server saves T2 and compacts its journal
+    tp.todo_index.get(T1).priority = 'C'
+    tp.save_todo(tp.todo_index.get(T1))
+    server.sync()
+    todo = server.index.get(T2)
+    todo.priority = 'D'
+    server.changed(todo)
+    server.store.compact(server.todos)
+    #the session sees T2 changed, and its own change to T1 is kept
+    assert session_changes() == {T2: 'D'}
+    server.sync()
+    assert priorities(server.todos) == {T1: 'C', T2: 'D'}
+
+def test_server_sees_session_changes(directory):
+    tp.load_todos()
+    server = todo_server.UserState(directory)
+    tp.todo_index.get(T1).priority = 'C'
+    tp.save_todo(tp.todo_index.get(T1))
+    tp.save_list(tp.todo_index.todos.values())
+    server.sync()
+    assert priorities(server.todos) == {T1: 'C', T2: 'B'}
+
+def test_server_loads_journal_of_crashed_session(directory):
+    #a session which compacted its journal into todo_txt.tmp, saved more
+    #changes and never finished: todo.txt is older than both
+    list_of_todos = tp.load_todos()
+    tp.todo_index.get(T1).priority = 'C'
+    tp.save_todo(tp.todo_index.get(T1))
+    tp.todo_store().compact(list_of_todos)
+    tp.todo_index.get(T2).priority = 'D'
+    tp.save_todo(tp.todo_index.get(T2))
+    server = todo_server.UserState(directory)
+    assert priorities(server.todos) == {T1: 'C', T2: 'D'}
+    #the server's changes go on from there, and are in todo.txt at the end
+    todo = server.index.get(T2)
+    todo.priority = 'E'
+    server.changed(todo)
+    server.close()
+    assert not os.path.isfile(tp.TODO_TXT_TMP)
+    assert priorities(todo_server.UserState(directory).todos) \
+           == {T1: 'C', T2: 'E'}
+
+def test_session_end_seen_by_server(directory):
+    tp.load_todos()
+    server = todo_server.UserState(directory)
+    todo = server.index.get(T2)
+    todo.priority = 'D'
+    server.changed(todo)
+    #the session ends: its To-dos (with the server's change merged) are
+    #written to todo.txt, todo_txt.tmp and the journal are removed
+    tp.todo_index.get(T1).priority = 'C'
+    tp.save_todo(tp.todo_index.get(T1))
+    list_of_todos = sorting.SortedTodoList(tp.todo_index.todos.values())
+    tp.finish_session(list_of_todos, sorting.SortedTodoList())
+    assert not os.path.isfile(tp.TODO_TXT_TMP)
+    server.sync()
+    assert priorities(server.todos) == {T1: 'C', T2: 'D'}
+    with open(tp.TODO_TXT) as fd:
+        content = fd.read()
+    assert '(C) first' in content and '(D) second' in content
+
+def test_merge_at_compaction_reindexes(directory, monkeypatch):
+    #without the journal, a session's To-dos are merged with the changes of
+    #another process when the list is saved
+    monkeypatch.setattr(tp, 'USE_JOURNAL', False)
+    monkeypatch.setattr(tp, '_line_cache', None)
+    list_of_todos = sorting.SortedTodoList(tp.load_todos())
+    todays_list = sorting.SortedTodoList()
+    todo = tp.todo_index.get(T1)
+    assert '(A) first' in tp.line_cache().line(todo)
+    server = todo_server.UserState(directory)
+    theirs = server.index.get(T1)
+    theirs.priority = 'C'
+    server.changed(theirs)
+    todo.text = 'first changed'
+    tp.line_cache().invalidate(todo)
+    tp.todo_index.update(todo)
+    tp.save_todo(todo)
+    assert '(A) first changed' in tp.line_cache().line(todo)
+    tp.save_list(list_of_todos)
+    tp.take_store_changes(list_of_todos, todays_list)
+    assert todo.priority == 'C'
+    assert '(C) first changed' in tp.line_cache().line(todo)
+    assert tp.todo_index.search(priority='C') == [todo]
+    assert [found.tags['tdid'] for found in tp.todo_index.query('changed')] \
+           == [T1]
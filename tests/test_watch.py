@@ -0,0 +1,145 @@
+"""
+Changes made to todo.txt by other programs during a session (todopomo_watch,
+todopomo.merge_external_changes()): only the lines which changed are read
+again, To-dos changed there replace ours unless ours were changed in this
+session, new To-dos are added and deleted ones removed.
+
+usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import todopomo as tp
+import todopomo_index as indexing
+import todopomo_sorted as sorting
+import todopomo_watch as watch
+
+TODO_TXT = ('(A) first tdid:P_2024-01-01_0\n(B) second tdid:P_2024-01-01_1\n'
+            '(C) third tdid:P_2024-01-01_2\n')
+T1, T2, T3 = 'P_2024-01-01_0', 'P_2024-01-01_1', 'P_2024-01-01_2'
+
+def edit(path, text):
+    """
+    Write a file as another program would, its mtime moved on so the change
+    is seen whatever the resolution of the clock
+    """
+    mtime = os.stat(path).st_mtime_ns if os.path.isfile(path) else 0
+    with open(path, 'w') as fd:
+        fd.write(text)
+    mtime += 10**9
+    os.utime(path, ns=(mtime, mtime))
+
+@pytest.fixture(autouse=True)
+def polling(monkeypatch):
+    #inotify or not, the files are polled here
+    monkeypatch.setattr(watch, 'has_inotify', False)
+
+def test_read_lines_and_diff(tmp_path):
+    path = str(tmp_path / 'todo.txt')
+    edit(path, TODO_TXT + '\nno tdid\n')
+    old, content_hash = watch.read_lines(path)
+    assert old[T1] == '(A) first tdid:P_2024-01-01_0'
+    assert old[('line', 'no tdid')] == 'no tdid'
+    assert watch.read_lines(str(tmp_path / 'none.txt')) == ({}, None)
+    new = dict(old)
+    new[T1] = '(B) first tdid:P_2024-01-01_0'
+    del new[T2], new[('line', 'no tdid')]
+    new[('line', 'no tdid, edited')] = 'no tdid, edited'
+    changed, removed = watch.diff(old, new)
+    assert changed == {T1: new[T1],
+                       ('line', 'no tdid, edited'): 'no tdid, edited'}
+    assert removed == [T2, ('line', 'no tdid')]
+
+def test_poll(tmp_path):
+    path = str(tmp_path / 'todo.txt')
+    edit(path, TODO_TXT)
+    watcher = watch.TodoFileWatcher(path)
+    assert watcher.poll() is None
+    edit(path, TODO_TXT.replace('(B) second', '(B) second, edited'))
+    assert watcher.poll() == ({T2: '(B) second, edited tdid:P_2024-01-01_1'},
+                              [])
+    assert watcher.poll() is None
+    #touched, the same content
+    edit(path, TODO_TXT.replace('(B) second', '(B) second, edited'))
+    assert watcher.poll() is None
+    #written here: not a change
+    edit(path, TODO_TXT)
+    watcher.reset()
+    assert watcher.poll() is None
+    os.remove(path)
+    assert watcher.poll() == ({}, [T1, T2, T3])
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """
+    A session with fresh state which loaded the To-dos of todo.txt in a
+    directory, all of them on today's list
+    returns: path of todo.txt, list_of_todos, todays_list
+    """
+    path = tmp_path / 'todo.txt'
+    path.write_text(TODO_TXT)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tp, 'WATCH_TODO_TXT', True)
+    monkeypatch.setattr(tp, 'USE_CACHE', False)
+    monkeypatch.setattr(tp, 'todo_index', indexing.TodoIndex())
+    monkeypatch.setattr(tp, 'changed_tdids', set())
+    for name in ('_todo_store', '_tdid_allocator', '_done_archive',
+                 '_todo_watcher', '_line_cache'):
+        monkeypatch.setattr(tp, name, None)
+    list_of_todos = tp.load_todos()
+    todays_list = sorting.SortedTodoList(list_of_todos)
+    yield str(path), list_of_todos, todays_list
+    tp.todo_watcher().close()
+
+def priorities(todo_list):
+    return {todo.tags['tdid']: todo.priority for todo in todo_list}
+
+def test_merge(session):
+    path, list_of_todos, todays_list = session
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 0
+    edit(path, '(D) first tdid:P_2024-01-01_0\n(C) third tdid:P_2024-01-01_2\n'
+               '(E) new one\n')
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 3
+    #the new To-do got a tdid
+    new = [todo for todo in list_of_todos if todo.text == 'new one'][0]
+    tdid = new.tags['tdid']
+    assert tdid not in (T1, T2, T3)
+    assert priorities(list_of_todos) == {T1: 'D', T3: 'C', tdid: 'E'}
+    #indexed, and on today's list in place of ours
+    assert tp.todo_index.get(T2) is None
+    assert [todo.text for todo in tp.todo_index.search(priority='D')] \
+           == ['first']
+    assert tp.todo_index.get(tdid) is new
+    assert priorities(todays_list) == {T1: 'D', T3: 'C'}
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 0
+    #saved, as the removal can't be journalled
+    assert priorities(tp.read_todos(tp.TODO_TXT_TMP)) \
+           == priorities(list_of_todos)
+
+def test_ours_kept(session):
+    path, list_of_todos, todays_list = session
+    todo = tp.todo_index.get(T1)
+    todo.priority = 'B'
+    tp.save_todo(todo)
+    todo = tp.todo_index.get(T2)
+    todo.completed = True
+    tp.save_todo(todo)
+    #changed and removed there too: ours are kept
+    edit(path, '(D) first tdid:P_2024-01-01_0\n'
+               '(D) third tdid:P_2024-01-01_2\n')
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 1
+    assert priorities(list_of_todos) == {T1: 'B', T2: 'B', T3: 'D'}
+    assert tp.todo_index.get(T2).completed
+
+def test_untagged_line_removed(session):
+    path, list_of_todos, todays_list = session
+    edit(path, TODO_TXT + 'no tdid yet\n')
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 1
+    #the line is still without tdid in todo.txt: found by its content
+    edit(path, TODO_TXT)
+    assert tp.merge_external_changes(list_of_todos, todays_list) == 1
+    assert sorted(priorities(list_of_todos)) == [T1, T2, T3]
@@ -5,12 +5,21 @@ todo.txt file to take account of completed To-Dos and some metrics. A log is
 also kept of all pomodoros and breaks for analysis.
 
 list_of_todos: contains all To-Dos, whatever their state, from todo.txt
+               (changes made to todo.txt by other programs during the
+               session are merged in, see merge_external_changes())
 todays_list: subset of list_of_todos which can be run as Pomodoros, from where
              they are moved to done_list when completed
 priority : typical is A, B, etc ; F: future - To-Dos you haven't started working
             on but want to be associated with a projects ;
             I: important ; U: urgent ; R: for routine stuff (daily or weekly)
 todopomo_log.txt: sequential log of all Pomodoros and breaks
+done.txt: archive of To-Dos completed more than ARCHIVE_AFTER_DAYS ago, only
+          read when needed (stats, print_list(completed='include'))
+todopomo_rollup.json: totals per day and per week (Pomodoros, time worked,
+                      To-dos completed, by project), compared in feedback()
+todopomo_trace.jsonl: timings and counters of the session, only written when
+                      the TODOPOMO_TRACE environment variable is set to on
+                      (see todopomo_metrics)
 
 future improvements:
 - display analysis and stats, ways of visualising progress
@@ -18,40 +27,344 @@ future improvements:
 - improve grouping by projects for feedback and visualisation
 """
 import todotxtio as tdt
-import pomodoro as pmd
+import todopomo_journal as journal
+import todopomo_log as pomo_log
+import todopomo_index as indexing
+import todopomo_sorted as sorting
+import todopomo_ids as ids
+import todopomo_archive as archiving
+import todopomo_cache as caching
+import todopomo_metrics as metrics
+import todopomo_lock as locking
+import todopomo_render as render
+import todopomo_stats as pomo_stats
+import todopomo_rollup as rollup
+import todopomo_segments as segments
+import todopomo_sync as sync
+import todopomo_watch as watch
+import todopomo_batch as batch
+import todopomo_compact as compact
 
+import atexit
+import importlib
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime
 import os
 import re
+import shutil
 
-try:
-    from PyQt5.QtWidgets import QMessageBox
-    from PyQt5.Qt import QApplication
-except ImportError:#
-    has_qt = False
-else:
-    has_qt = True
+class LazyModule(object):
+    '''
+    Stands in for a module which is only imported when one of its
+    attributes is first used
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+#pomodoro helpers (timer, notifications) are only needed once a Pomodoro runs
+pmd = LazyModule('pomodoro')
+
+has_qt = None #not checked yet, see load_qt()
+
+def load_qt():
+    '''
+    Import the PyQt5 classes for dialogs, the first time they are needed
+    returns: True if PyQt5 is available
+    '''
+    global has_qt, QMessageBox, QApplication
+    if has_qt is None:
+        try:
+            from PyQt5.QtWidgets import QMessageBox
+            from PyQt5.Qt import QApplication
+        except ImportError:#
+            has_qt = False
+        else:
+            has_qt = True
+    return has_qt
 
 #declare filenames used
 TODO_TXT = 'todo.txt'            #the main todo.txt file, created elsewhere
 #TODO_TXT = 'test_todo.txt'
 TODO_TXT_TMP = 'todo_txt.tmp'#to save changes to To-Dos
+DONE_TXT = 'done.txt'            #archive of completed To-Dos
+TODO_CACHE = 'todo_txt.cache'    #parsed To-Dos of the last file loaded
+USE_CACHE = True
+ARCHIVE_AFTER_DAYS = 7           #completed To-Dos older than this are archived
 LOG_FILE = 'todopomo_log.txt'    #to record pomodoros and breaks for analysis
 #LOG_FILE = 'test_todopomo_log.txt'
+STATS_CACHE = 'todopomo_stats.cache'#aggregates of LOG_FILE read so far
+ROLLUP_FILE = 'todopomo_rollup.json'#daily/weekly totals, from LOG_FILE
+IDS_STATE = 'todopomo_ids.json'  #counter of the tdids handed out today
+JOURNAL_FILE = 'todo_txt.journal'#changes to To-Dos since last todo_txt.tmp
+#journal mode: append changed To-dos instead of re-writing todo_txt.tmp
+USE_JOURNAL = True
+JOURNAL_MAX_BYTES = 64 * 1024   #compact journal into todo_txt.tmp above this
+#notice changes made to TODO_TXT by other programs during the session
+WATCH_TODO_TXT = True
+#keep To-dos as todopomo_compact.CompactTodo (less memory, for large lists)
+COMPACT_TODOS = False
+#log writer policy: records buffered before writing, fsync after each write
+LOG_FLUSH_EVERY = 1
+LOG_FSYNC = False
+
+_log_writer = None
+_tdid_allocator = None
+_done_archive = None
+_rollups = None
+_todo_watcher = None
+_todo_store = None
+#tdids of the To-dos changed in this session (kept over external changes)
+changed_tdids = set()
+#index of list_of_todos by tdid, priority, project, context and completion
+todo_index = indexing.TodoIndex()
+#formatted line of each To-do, for the menus and lists (see line_cache())
+_line_cache = None
+
+def tdid_allocator():
+    """
+    The allocator handing out tdids, with its counter saved in IDS_STATE
+    """
+    global _tdid_allocator
+    if _tdid_allocator is None:
+        _tdid_allocator = ids.TdidAllocator(IDS_STATE, todo_index.todos)
+    return _tdid_allocator
+
+def done_archive():
+    """
+    The archive of completed To-dos (DONE_TXT), only read when needed
+    """
+    global _done_archive
+    if _done_archive is None:
+        _done_archive = archiving.Archive(DONE_TXT)
+    return _done_archive
 
+def line_cache():
+    """
+    The formatted line of each To-do, for the menus and lists
+    """
+    global _line_cache
+    if _line_cache is None:
+        _line_cache = render.LineCache()
+    return _line_cache
+
+@metrics.timed()
+def rollups():
+    """
+    The daily and weekly rollups (ROLLUP_FILE) - rebuilt from the log and
+    the To-dos the first time, if there is no (readable) rollup file yet;
+    saved at exit
+    """
+    global _rollups
+    if _rollups is None:
+        _rollups = rollup.Rollups(ROLLUP_FILE)
+        if not _rollups.days and os.path.isfile(LOG_FILE):
+            log_writer().flush()
+            _rollups = rollup.rebuild(ROLLUP_FILE, LOG_FILE,
+                      list(todo_index.todos.values()) + done_archive().todos())
+    return _rollups
+
+def save_rollups():
+    """
+    Save the rollups in use at exit (if any), eg when a session is
+    interrupted before main() saves them
+    """
+    if _rollups is not None:
+        _rollups.save()
+
+atexit.register(save_rollups)
+
+@metrics.timed()
 def todo_id(todo_list):
     """
     Add IDs to To-dos that don't have one, functioning like a primary key.
-    format: P_, today's date, underscore, incrementing number
+    format: P_, today's date, underscore, incrementing number (counted per
+    day, never re-used - see todopomo_ids)
     added to dictionary of todo.tags (key: tdid)
+    The To-dos are tagged in place and added to todo_index.
+    """
+    tdid_allocator().tag(todo_list)
+    for todo in todo_list:
+        todo_index.add(todo)
+    return todo_list
+
+def todo_store():
+    """
+    The To-dos saved (TODO_TXT_TMP and JOURNAL_FILE), as shared with other
+    sessions running at the same time - see todopomo_sync
+    """
+    global _todo_store
+    if _todo_store is None:
+        _todo_store = open_todo_store('')
+    return _todo_store
+
+def open_todo_store(directory):
+    """
+    The store of the To-dos of a directory: the same files for a session
+    and the server, so that either applies the changes of the other
     """
-    tagged_list = [todo for todo in todo_list if 'tdid' in todo.tags]
-    to_tag_list = [todo for todo in todo_list if 'tdid' not in todo.tags]
-    for i, todo in enumerate(to_tag_list):
-        todo.tags['tdid'] = 'P_' + str(datetime.today().date().isoformat()) + "_" + str(i)
-        tagged_list.append(todo)
-    return tagged_list
+    path = lambda name: os.path.join(directory, name)
+    return sync.TodoStore(path(JOURNAL_FILE), path(TODO_TXT_TMP),
+                          path(TODO_TXT))
+
+def merged_todo(todo):
+    '''
+    Re-index a To-do changed here which was merged with the changes another
+    session saved (it is re-sorted by take_store_changes())
+    '''
+    line_cache().invalidate(todo)
+    todo_index.update(todo)
+
+def save_todo(todo):
+    '''
+    Record a changed To-do: appended to the journal in journal mode,
+    otherwise it is saved with the rest of the list by save_list()
+    '''
+    changed_tdids.add(todo.tags['tdid'])
+    if USE_JOURNAL:
+        for merged in todo_store().save([todo]):
+            merged_todo(merged)
+        metrics.count('journal_appends')
+
+def save_todos(todo_list):
+    '''
+    Record several changed To-dos at once (see save_todo)
+    '''
+    changed_tdids.update(todo.tags['tdid'] for todo in todo_list)
+    if USE_JOURNAL:
+        for merged in todo_store().save(todo_list):
+            merged_todo(merged)
+        metrics.count('journal_appends', len(todo_list))
+
+def count_save(path):
+    '''
+    Count a full save of the To-dos (instrumentation, see todopomo_metrics)
+    '''
+    metrics.count('saves')
+    metrics.count_bytes('bytes_written', path)
+
+def save_list(todo_list):
+    '''
+    Save the list of To-dos to todo_txt.tmp - in journal mode only when the
+    journal has grown past JOURNAL_MAX_BYTES, as changes are already journalled
+    '''
+    with metrics.span('save'):
+        if USE_JOURNAL:
+            saved = todo_store().compact(todo_list, JOURNAL_MAX_BYTES)
+        else:
+            saved = todo_store().compact(todo_list)
+    if saved:
+        count_save(TODO_TXT_TMP)
+
+def todo_watcher():
+    """
+    The watcher of TODO_TXT, created when the To-dos are loaded
+    """
+    global _todo_watcher
+    if _todo_watcher is None:
+        _todo_watcher = watch.TodoFileWatcher(TODO_TXT)
+    return _todo_watcher
+
+def find_untagged(line, todo_list):
+    '''
+    Find the To-do which was read from a todo.txt line without tdid (and
+    got its tdid when loaded)
+    '''
+    read = tdt.from_string(line)[0]
+    for todo in todo_list:
+        if (todo.text, todo.priority, list(todo.projects),
+                list(todo.contexts)) == \
+                (read.text, read.priority, read.projects, read.contexts):
+            return todo
+    return None
+
+def replace_todo(previous, todo, list_of_todos, todays_list):
+    '''
+    Put a To-do read from elsewhere in the place of ours
+    previous : our To-do (None for a new To-do)
+    todo : the To-do read (None if it was removed)
+    '''
+    if previous is not None:
+        list_of_todos.discard(previous)
+        line_cache().invalidate(previous)
+        if previous in todays_list:
+            todays_list.discard(previous)
+            if todo is not None and not todo.completed:
+                todays_list.append(todo)
+        if todo is None:
+            todo_index.remove(previous)
+    if todo is not None:
+        #new To-dos get a tdid, all are (re-)indexed
+        todo_id([todo])
+        list_of_todos.append(todo)
+
+def take_store_changes(list_of_todos, todays_list):
+    '''
+    Apply the changes other sessions saved since we last looked (see
+    todopomo_sync), and re-sort our To-dos merged with their changes
+    returns: number of To-dos added, replaced or removed
+    '''
+    changes, merged = todo_store().take(todo_parser())
+    #merged when saved, or when the store was compacted (eg by save_list())
+    for todo in merged:
+        print('To-do {} was changed by another session too: changes merged'
+              .format(todo.tags['tdid']))
+        merged_todo(todo)
+        for todo_list in (list_of_todos, todays_list):
+            if todo in todo_list:
+                todo_list.reposition(todo)
+    for tdid, todo in changes:
+        replace_todo(todo_index.get(tdid), todo, list_of_todos, todays_list)
+    if changes:
+        print('Loaded {} To-dos changed by another session'.format(
+                                                              len(changes)))
+    return len(changes)
+
+def merge_external_changes(list_of_todos, todays_list):
+    '''
+    Apply the changes saved by other sessions (see take_store_changes), and
+    those made to TODO_TXT by other programs since it was last read, parsing
+    only the lines which changed: To-dos changed there replace ours (unless
+    ours was changed in this session too: then ours is kept), new To-dos are
+    added and deleted ones removed
+    returns: number of To-dos added, replaced or removed
+    '''
+    merged = take_store_changes(list_of_todos, todays_list)
+    if not WATCH_TODO_TXT:
+        return merged
+    changes = todo_watcher().poll()
+    if changes is None:
+        return merged
+    changed, removed = changes
+    for key in removed:
+        if isinstance(key, str):
+            todo = todo_index.get(key)
+        else:
+            todo = find_untagged(key[1], list_of_todos)
+        if todo is None or todo.tags['tdid'] in changed_tdids:
+            continue
+        replace_todo(todo, None, list_of_todos, todays_list)
+        merged += 1
+    for key, line in changed.items():
+        if key in changed_tdids:
+            print('Kept To-do {} as changed here, not as in {}'.format(key,
+                                                                  TODO_TXT))
+            continue
+        todo = todo_parser()(line)[0]
+        previous = todo_index.get(key) if isinstance(key, str) else None
+        replace_todo(previous, todo, list_of_todos, todays_list)
+        if USE_JOURNAL:
+            todo_store().save([todo])
+        merged += 1
+    #the journal can't record removals: save the whole list
+    if removed:
+        todo_store().compact(list_of_todos)
+    return merged
 
 def make_todays_list(list1, list2=[]):
     """
@@ -59,11 +372,13 @@ def make_todays_list(list1, list2=[]):
     (or, if a second list is provided, adding) To-do objects
     list1 : the list to be modified
     list2 : if given, the list from which items will be taken
-    returns:  new/updated list
+    returns:  new/updated list, sorted (as a todopomo_sorted.SortedTodoList)
+    The options are shown a page at a time (see todopomo_render for paging
+    and filtering)
     """
     q_remove = "To remove any To-dos from this list, "
     q_add = "To add any To-dos to the main list, "
-    q = 'please enter a comma-separated list of numbers.'
+    q = 'please enter a comma-separated list of numbers (or words to search).'
     #by default remove To_dos with priority F (ie future)
     list1 = [todo for todo in list1 if todo.priority != 'F']
     if list2:
@@ -71,55 +386,70 @@ def make_todays_list(list1, list2=[]):
         print_list(list1)
         q = q_add + q
         #only options are the difference of the two lists
-        options = [todo for todo in list2 if todo not in list1]
+        in_list1 = set(list1)
+        options = [todo for todo in list2 if todo not in in_list1]
     else:
         q = q_remove + q
         options = list1
-
-    print(80*'#')
-    print("List of options:")
-    for i,o in enumerate(options):
-        print("[{}] - {}".format(i,o))
-    print(80*'#')
+    #words instead of numbers search the options
+    pager = render.Pager(options, todo_index.query, free_text=True)
+    show = True
 
     while True:
+        if show:
+            screen = render.Screen()
+            screen.add(render.RULE, "List of options:")
+            pager.render(screen, line_cache())
+            screen.add(render.RULE)
+            screen.write()
+            show = False
         try:
-            options_selected = set(input(q).split(",")) #avoid dupes
+            answer = input(q)
+            if pager.command(answer):
+                show = True
+                continue
+            options_selected = set(answer.split(",")) #avoid dupes
             if options_selected == {''}:
                 break
-            options_selected = list(map(int,options_selected)) #only ints list
-            for i in options_selected:
-                print("You selected:{}".format(options[i]))
+            options_selected = set(map(int,options_selected)) #only ints set
+            screen = render.Screen()
+            screen.add(*["You selected:{}".format(line_cache().line(options[i]))
+                         for i in options_selected])
+            screen.write()
             break
         except KeyboardInterrupt:
             print("KeyboardInterrupt - Returning to menu.")
-            return list1
+            return sorting.SortedTodoList(list1)
         except:
             print("Incorrect selection, please try again")
             continue
     if list2:
-        new_list = list1 + [todo for i, todo in enumerate(list2)
+        new_list = list1 + [todo for i, todo in enumerate(options)
                                              if i in options_selected]
     else:
         new_list = [todo for i, todo in enumerate(list1)
                                              if i not in options_selected]
-    return new_list
+    return sorting.SortedTodoList(new_list)
 
+@metrics.timed()
 def print_list(todo_list, options='RAF', completed='exclude'):
     """
     Print out enumerated list to give overview/aid selection
     options ; 's' for simple print out
     more complex: by To-do priority R (routine),A,B,C,..., F(future),
     P(project), I(important not urgent)
+    completed : 'exclude' (default) ; 'include' also lists the To-dos
+                archived in done.txt ; any other value lists only the
+                completed To-dos of todo_list
     """
     #ensure completed are not shown unless selected
     if completed == 'exclude':
-         todo_list = tdt.search(todo_list,completed=False)
-    print(80*'#')
+         todo_list = todo_index.search(completed=False, within=todo_list)
+    screen = render.Screen()
+    screen.add(render.RULE)
     #print simple list
     if options == 's':
-        for todo in todo_list:
-            print(" * ",  todo)
+        screen.add(*[" *  " + line_cache().line(todo) for todo in todo_list])
     #print list by completion status, priority
     else:
         options = options.upper()
@@ -133,28 +463,35 @@ def print_list(todo_list, options='RAF', completed='exclude'):
                 'P' : 'Project'
                                 }
         if completed != 'exclude':
-            completed_list = tdt.search(todo_list,completed=True)
-            todo_list = tdt.search(todo_list,completed=False)
+            completed_list = todo_index.search(completed=True,
+                                               within=todo_list)
+            if completed == 'include':
+                completed_list += done_archive().todos()
+            todo_list = todo_index.search(completed=False, within=todo_list)
             dict_of_lists['Completed'] = completed_list
             list_of_keys.append('Completed')
+        priority_keys = {}
         for o in list(options):
             if o in codes.keys():
                 key = codes[o]
             else:
                 key = 'Priority ' + o
-            l = [todo for todo in todo_list if todo.priority == o]
-            dict_of_lists[key]  = l
-            todo_list = [todo for todo in todo_list
-                              if todo not in set(l)]
+            priority_keys[o] = key
+            dict_of_lists[key] = []
             list_of_keys.append(key)
-        dict_of_lists['Other priority'] = todo_list
+        dict_of_lists['Other priority'] = []
         list_of_keys.append('Other priority')
+        #single pass to separate the To-dos by priority
+        for todo in todo_list:
+            key = priority_keys.get(todo.priority, 'Other priority')
+            dict_of_lists[key].append(todo)
         for key in list_of_keys:
-            print(key,'To-dos :')
-            for todo in dict_of_lists[key]:
-                print(" * ",  todo)
-            print(80*'+')
-    print(80*'#')
+            screen.add(key + ' To-dos :')
+            screen.add(*[" *  " + line_cache().line(todo)
+                         for todo in dict_of_lists[key]])
+            screen.add(80*'+')
+    screen.add(render.RULE)
+    screen.write()
 
 def sort_todo_list(todo_list):
     '''
@@ -162,8 +499,9 @@ def sort_todo_list(todo_list):
     by completion state (completed last), priority (routine, A,B, etc),
     and tdid (ie oldest first)
 
-    Should be called after todo.txt is originally read in, or after later
-    alterations such as changing todo priority.
+    Not used by main() any more, which keeps its lists in this order with
+    todopomo_sorted.SortedTodoList (only moving the To-dos that change):
+    kept as the reference order SortedTodoList is tested against.
     '''
     #by tdid -
     todo_list.sort(key=lambda x:x.tags['tdid'])
@@ -177,6 +515,7 @@ def selection(todo_list, further_options='CRSF', default_option='0'):
     Choose which To-do to run next - or one of the alternative options
     options_list should be a string e.g. "UFRS"
     returns either a 'todotxtio.Todo' object or a string (further_options)
+    The To-dos are shown a page at a time (see todopomo_render)
     """
 
     #all possible non-To-do menu options - more can be added in future
@@ -187,52 +526,80 @@ def selection(todo_list, further_options='CRSF', default_option='0'):
                           ]
     #convert argument into list of list of keys to be used on dict
     further_options_keys = list(further_options.upper())
-    #generate selection options as list of tuples from To-do and further options
-    options = [(str(i),o) for (i,o) in enumerate(todo_list)] \
-            + [o for o in further_options_def if o[0] in further_options_keys]
-    #also create corresponding dictionary for all options_list
-    options_dict = {o[0]:o[1] for o in options}
+    further = [o for o in further_options_def if o[0] in further_options_keys]
     q1 = 'Please select a To-do from the list by typing a between 0 and {},'\
     ' or a letter for one of the further options!\n'.format(len(todo_list)-1)
-    print(80*'#')
-    print("Today's list of To-Dos is:")
-    for o in options:
-        print("[{}] - {}".format(o[0],o[1]))
-    print(80*'#')
+    pager = render.Pager(todo_list, todo_index.query)
+    show = True
 
     while True:
+        if show:
+            screen = render.Screen()
+            screen.add(render.RULE, "Today's list of To-Dos is:")
+            pager.render(screen, line_cache())
+            screen.add(*["[{}] - {}".format(*o) for o in further])
+            screen.add(render.RULE)
+            screen.write()
+            show = False
         try:
-            option_selected = input(q1).upper() or default_option
+            answer = input(q1)
         except:
             #will exit after saving list
             print(" Exiting!")
             return 'F'
-        if option_selected in options_dict.keys():
-            print("You selected:{}".format(options_dict[option_selected]))
-            break
-        else:
-            print("Incorrect selection, please try again")
-    if option_selected in further_options_keys:
-        return option_selected
-    else:
-        return options_dict[option_selected]
+        if pager.command(answer):
+            show = True
+            continue
+        option_selected = answer.upper() or default_option
+        if option_selected in further_options_keys:
+            print("You selected:{}".format(dict(further)[option_selected]))
+            return option_selected
+        if option_selected.isdigit() and int(option_selected) < len(todo_list):
+            todo = todo_list[int(option_selected)]
+            print("You selected:{}".format(line_cache().line(todo)))
+            return todo
+        print("Incorrect selection, please try again")
+
+def log_writer():
+    """
+    The writer for LOG_FILE (and its binary sidecar), kept open for the
+    whole session and flushed at exit
+    """
+    global _log_writer
+    if _log_writer is None:
+        _log_writer = pomo_log.PomoLogWriter(LOG_FILE, LOG_FLUSH_EVERY,
+                                             LOG_FSYNC)
+        atexit.register(_log_writer.close)
+    return _log_writer
+
+def rotate_log(log_file, stats_cache, writer):
+    """
+    Move the Pomodoros of past months from the log to compressed monthly
+    segments (see todopomo_segments), keeping the stats cache in step
+    writer : the PomoLogWriter of the log
+    """
+    if not segments.needs_rotation(log_file):
+        return
+    with locking.lock(log_file):
+        writer.flush()
+        #aggregate all records before they move
+        pomo_stats.update(log_file, stats_cache)
+        removed = segments.rotate(log_file)
+        pomo_stats.rebase(stats_cache, log_file, removed)
+    print('Moved the Pomodoros of past months from {} to monthly segments'
+          .format(log_file))
 
+@metrics.timed()
 def write_pomo(start, stop, duration, tdid='break', todo_endpoint=''):
     """
-    Log Pomodoros and breaks
+    Log Pomodoros and breaks, and add Pomodoros to the rollups
     """
-    start = start.isoformat(timespec='minutes')
-    stop = stop.isoformat(timespec='minutes')
-    line = "{0},{1},{2},{3},\"{4}\"\n".format(tdid, start, stop,
-                                                    duration, todo_endpoint)
-                           #escaped {4} so that commas don't mess up csv
-    if not os.path.exists(LOG_FILE):
-        fd = open(LOG_FILE, "w")
-        fd.write("To-Do ID (tdid),start,end,duration,endpoint\n")
-    else:
-        fd = open(LOG_FILE, "a")
-    fd.write(line)
-    fd.close()
+    log_writer().write(start, stop, duration, tdid, todo_endpoint)
+    metrics.count('log_records')
+    if tdid != 'break' and todo_endpoint != pomo_log.INTERRUPTED:
+        todo = todo_index.get(tdid)
+        rollups().add_pomo(start, duration, todo.projects if todo else ())
+        rollups().flush()
 
 def pomo_settings(pomo_length,todo_endpoint):
     '''
@@ -275,13 +642,17 @@ def run_pomo(todo, rest=5):
         #pomo_length, todo_endpoint = pomo_settings(pomo_length,todo_endpoint)
         pomo_length, todo_endpoint = pomo_settings(0.1, todo_endpoint)
         pmd.display("Now working on :", todo)
-        start = datetime.now()
+        #wall clock for the log, monotonic clock for the duration
+        start, t0 = datetime.now(), time.monotonic()
         interrupted = tick(int(pomo_length) * 60)
         if interrupted:
+            #logged without time worked, counted as interruption in the stats
+            write_pomo(start, datetime.now(), 0, todo.tags['tdid'],
+                       pomo_log.INTERRUPTED)
             continue
         pmd.notify('pomodoro', 'Finished pomo, rest now.')
         stop = datetime.now()
-        pomo_duration = (stop - start).seconds
+        pomo_duration = int(time.monotonic() - t0)
         #cap duration at 20% extra
         if pomo_duration > 1.2 * pomo_length * 60:
             pomo_duration = 1.2 * pomo_length * 60
@@ -295,11 +666,11 @@ def run_pomo(todo, rest=5):
         if another.upper() == "N":
             completed = input(q2) or "N"
         pmd.display("Rest now")
-        start = datetime.now()
+        start, t0 = datetime.now(), time.monotonic()
         #interrupted = tick(rest * 60)
         interrupted = tick(2)
         stop = datetime.now()
-        break_duration = (stop - start).seconds
+        break_duration = int(time.monotonic() - t0)
         #cap break duration at 20% extra
         if break_duration > 1.2 * pomo_length * 60:
             break_duration = 1.2 * pomo_length * 60
@@ -314,32 +685,44 @@ def run_pomo(todo, rest=5):
 
 def feedback(pomo_done=0,time_today=0,done_list=[],todays_list=[]):
     '''
-    Give feedback on completion of pomos and To-dos
-    Remains to be implemented:
-    add some info about previous days/weeks for comparison
+    Give feedback on completion of pomos and To-dos, compared to previous
+    days and weeks (from the rollups)
     '''
     # metrics of stuff done today, compare to previous days/weeks
-    print(80*'#')
+    screen = render.Screen()
+    screen.add(render.RULE)
     if pomo_done and time_today:
-        print("So far you finished {} pomodoros and "\
+        screen.add("So far you finished {} pomodoros and "\
         "you worked for {} seconds".format(pomo_done,time_today))
-        print(80*'#')
+        screen.add(render.RULE)
     if done_list:
-        print("You also completed {} To-dos.".format(len(done_list)))
-        print("The To-dos completed are :")
-        for i, todo in enumerate(done_list):
-            print(i, " - ",  todo)
-        print(80*'+')
+        screen.add("You also completed {} To-dos.".format(len(done_list)))
+        screen.add("The To-dos completed are :")
+        add_first_page(screen, done_list)
+        screen.add(80*'+')
     if todays_list:
-        print("The remaining To-dos for today are :")
-        for i, todo in enumerate(todays_list):
-            print(i, " - ",  todo)
-    print(80*'#' + '\n' + 80*'#')
+        screen.add("The remaining To-dos for today are :")
+        add_first_page(screen, todays_list)
+        screen.add(80*'+')
+    screen.add(*[rollup.format_aggregate(name, aggregate)
+                 for name, aggregate in rollups().compare(date.today())])
+    screen.add(render.RULE, render.RULE)
+    screen.write()
 
-def update_todo(todo,completed, pomo_count, pomo_cycle_duration):
+def add_first_page(screen, todo_list):
+    '''
+    Add the first page of an enumerated list of To-dos to a screen
     '''
-    Updates a To-dos state: completion, pomodoro count (Pmd), total time (Ttotal)
+    for i, todo in enumerate(todo_list[:render.PAGE_SIZE]):
+        screen.add("{}  -  {}".format(i, line_cache().line(todo)))
+    if len(todo_list) > render.PAGE_SIZE:
+        screen.add("... and {} more".format(len(todo_list) - render.PAGE_SIZE))
+
+def set_todo_state(todo, completed, pomo_count, pomo_cycle_duration):
+    '''
+    Sets a To-dos state: completion, pomodoro count (Pmd), total time (Ttotal)
     the latter as custom tags
+    returns: True if the To-do was changed
     '''
     if completed == 'Y':
         #update completion status by adding a completion date, changes both
@@ -349,6 +732,19 @@ def update_todo(todo,completed, pomo_count, pomo_cycle_duration):
     if pomo_count and pomo_cycle_duration:
         todo.tags['Pmd'] = str(pomo_count + int(todo.tags.get('Pmd', 0)))
         todo.tags['Ttotal'] = str(pomo_cycle_duration + int(todo.tags.get('Ttotal', 0)))
+    return bool(completed == 'Y' or (pomo_count and pomo_cycle_duration))
+
+def update_todo(todo,completed, pomo_count, pomo_cycle_duration):
+    '''
+    Updates a To-dos state (see set_todo_state), re-indexes and saves it,
+    and counts it in the rollups if completed
+    '''
+    if set_todo_state(todo, completed, pomo_count, pomo_cycle_duration):
+        if completed == 'Y':
+            rollups().add_completed(todo.completion_date, todo.projects)
+        todo_index.update(todo)
+        line_cache().invalidate(todo)
+        save_todo(todo)
 
 def todo_list_menu_selection(list_of_todos, todays_list):
     '''
@@ -360,6 +756,7 @@ def todo_list_menu_selection(list_of_todos, todays_list):
                "P" : "Change To-do priority",
                "A" : "Add new To-do",
                "E" : "Edit existing To-do",
+               "B" : "Batch edit several To-dos",
                "M" : "Go back to main menu"
                   }
 
@@ -391,14 +788,15 @@ def todo_list_menu_selection(list_of_todos, todays_list):
             list_of_todos,todays_list = add_new_todo(list_of_todos,todays_list)
         elif option_selected == "E":
             print('not implemented yet')
+        elif option_selected == "B":
+            list_of_todos, todays_list = batch_edit(list_of_todos, todays_list)
         elif option_selected == "M":
             break
 
-    #sort modified lists
-    sort_todo_list(list_of_todos)
-    sort_todo_list(todays_list)
+    #list_of_todos is kept sorted, re-sort To-dos changed in todays_list
+    todays_list.refresh()
     #save modified list
-    tdt.to_file(TODO_TXT_TMP,list_of_todos)
+    save_list(list_of_todos)
     print("Modified list saved!")
     return list_of_todos, todays_list
 
@@ -411,41 +809,57 @@ def add_new_todo(list_of_todos,todays_list):
     q2 = "Enter the priority:"
     #q3 = "Enter the project(s) as a comma-separated list:"
     q4 = "Should this be added to Today's list of To-Dos (Y/n) ?"
-    #nested set comprehension equivalent to :
-    #for todo in list_of_todos:
-    #    for project in todo.projects:
-    #         project
-    projects = {project for todo in list_of_todos for project in todo.projects}
+    projects = todo_index.projects()
     q3 = "Enter xxxthe project(s) as a comma-separated list: \n"\
          "(Existing projects are: " + ", ".join(projects) + ")"
     t = input(q1)
     pt = input(q2).upper()
+    #a single letter (or none), as in todo.txt
+    while len(pt) > 1 or (pt and not 'A' <= pt <= 'Z'):
+        print("Incorrect priority, please enter a single letter")
+        pt = input(q2).upper()
     pj = input(q3).replace(" ","").split(",")
     add_to_today = input(q4) or "Y"
     #instantiate To-Do
-    todo = tdt.Todo(text=t,priority=pt, projects=pj)
+    if COMPACT_TODOS:
+        todo = compact.CompactTodo(text=t,priority=pt, projects=pj)
+    else:
+        todo = tdt.Todo(text=t,priority=pt, projects=pj)
+    #add tdid to new To-Do (needed for its place in the sorted lists)
+    todo_id([todo])
     list_of_todos.append(todo)
     if add_to_today.upper() == "Y":
         todays_list.append(todo)
-    #add tdid to new To-Do
-    list_of_todos = todo_id(list_of_todos)
+    save_todo(todo)
     return list_of_todos, todays_list
 
 def edit_todo(list_of_todos):
     '''
     Change priority (or potentially other property) of existing todo
+    list_of_todos : a todopomo_sorted.SortedTodoList
     '''
     priorities = 'ABCDEFIRU'
-    q1 = "Enter the number corresponding to the To-Do you want to change:"
+    q1 = "Enter the number corresponding to the To-Do you want to change"\
+         " (or words to search):"
     q2 = "Enter the new priority (possible values:{})".format(list(priorities))
-    #list all to-dos available for selection
-    for i, option in enumerate(list_of_todos):
-        print("[{}] - {}".format(i,option))
+    #words instead of a number search the To-dos
+    pager = render.Pager(list_of_todos, todo_index.query, free_text=True)
+    show = True
     #make todo selection
     while True:
+        #list the to-dos available for selection, a page at a time
+        if show:
+            screen = render.Screen()
+            pager.render(screen, line_cache())
+            screen.write()
+            show = False
         try:
-            todo = list_of_todos[int(input(q1))]
-            print("You selected:\n{}".format(todo))
+            answer = input(q1)
+            if pager.command(answer):
+                show = True
+                continue
+            todo = list_of_todos[int(answer)]
+            print("You selected:\n{}".format(line_cache().line(todo)))
             p = input(q2).upper()
             assert p in priorities
             break
@@ -456,9 +870,98 @@ def edit_todo(list_of_todos):
             print("Incorrect selection, please try again")
             continue
     todo.priority = p
+    list_of_todos.reposition(todo)
+    todo_index.update(todo)
+    line_cache().invalidate(todo)
+    save_todo(todo)
     return list_of_todos
 
+def batch_edit(list_of_todos, todays_list):
+    '''
+    Apply the same changes (priority, completion, projects, today's list) to
+    several To-dos, selected by numbers and ranges or by a search, in one
+    pass: the To-dos are re-indexed and journalled together, and the list
+    is saved once when leaving the menu (see todopomo_batch)
+    list_of_todos, todays_list : todopomo_sorted.SortedTodoList
+    returns: list_of_todos, todays_list
+    '''
+    priorities = 'ABCDEFIRU'
+    q1 = "Select To-dos by numbers and ranges (eg 0-5,8,12-), or type words"\
+         " to search then Enter to select all the To-dos found:"
+    q2 = "Enter the changes as a comma-separated list (P<priority>: set"\
+         " priority, X: complete,\n +project / -project: add / remove"\
+         " project, T / R: add to / remove from today's list):"
+    pager = render.Pager(list_of_todos, todo_index.query, free_text=True)
+    show = True
+    while True:
+        if show:
+            screen = render.Screen()
+            pager.render(screen, line_cache())
+            screen.write()
+            show = False
+        try:
+            answer = input(q1)
+        except KeyboardInterrupt:
+            print("returning to menu")
+            return list_of_todos, todays_list
+        if pager.command(answer):
+            show = True
+            continue
+        if not answer.strip():
+            if not pager.query:
+                return list_of_todos, todays_list
+            selected = [list_of_todos[i] for i in pager.positions]
+            break
+        numbers = batch.parse_selection(answer, len(list_of_todos))
+        if numbers is None:
+            print("Incorrect selection, please try again")
+            continue
+        selected = [list_of_todos[i] for i in numbers]
+        break
+    print("You selected {} To-dos.".format(len(selected)))
+    while True:
+        try:
+            answer = input(q2)
+            if not answer.strip():
+                return list_of_todos, todays_list
+            operations = batch.parse_operations(answer, priorities)
+            break
+        except KeyboardInterrupt:
+            print("returning to menu")
+            return list_of_todos, todays_list
+        except ValueError as error:
+            print("{}, please try again".format(error))
+    #one pass over the selection, then one journal write
+    changed = []
+    for todo in selected:
+        was_completed = todo.completed
+        if not batch.apply(todo, operations):
+            continue
+        changed.append(todo)
+        if todo.completed and not was_completed:
+            rollups().add_completed(todo.completion_date, todo.projects)
+        todo_index.update(todo)
+        line_cache().invalidate(todo)
+        list_of_todos.reposition(todo)
+        if todo in todays_list:
+            todays_list.reposition(todo)
+    save_todos(changed)
+    add_today = ('add_today', None) in operations
+    remove_today = ('remove_today', None) in operations
+    for todo in selected:
+        if todo.completed or remove_today:
+            todays_list.discard(todo)
+        elif add_today and todo not in todays_list:
+            todays_list.append(todo)
+    print("Changed {} To-dos.".format(len(changed)))
+    return list_of_todos, todays_list
+
 def tick(duration):
+    '''
+    Blocking command line timer (see todopomo_timers for running many timers
+    at once on an event loop)
+    returns: True if interrupted with Ctrl+C
+    '''
     try:
         pmd.cli_timer(duration)
     except KeyboardInterrupt:
@@ -469,31 +972,109 @@ def tick(duration):
     return interrupt
 
 
+def todo_parser():
+    '''
+    Function parsing todo.txt lines: into CompactTodo if COMPACT_TODOS is set
+    '''
+    if COMPACT_TODOS:
+        return compact.from_string
+    return tdt.from_string
+
+def read_todos(path):
+    '''
+    Read a todo.txt file - from TODO_CACHE if the file is unchanged since
+    it was cached (and USE_CACHE is set)
+    '''
+    if USE_CACHE:
+        return caching.load(path, TODO_CACHE, todo_parser())
+    if COMPACT_TODOS:
+        return compact.from_file(path)
+    return tdt.from_file(path)
+
+def load_todos():
+    '''
+    Load all To-dos: from todo_txt.tmp if it remains (else todo.txt) with
+    the journal replayed, archive the old completed ones, back up todo.txt,
+    give IDs to all To-dos and save the sorted list to todo_txt.tmp
+    returns: list_of_todos (a todopomo_sorted.SortedTodoList)
+    '''
+    #todo.txt as it is now, to notice later changes by other programs
+    if WATCH_TODO_TXT:
+        todo_watcher()
+    #other sessions don't write meanwhile
+    with todo_store().lock():
+        #check if tmp file remains, if so, load it
+        if os.path.isfile(TODO_TXT_TMP):
+            list_of_todos = read_todos(TODO_TXT_TMP)
+            print('Loaded To-Dos from {} !'.format(TODO_TXT_TMP))
+        else:
+            #generate the main list of To-dos by reading in todo.txt
+            list_of_todos = read_todos(TODO_TXT)
+        #apply changes journalled since the last snapshot
+        list_of_todos, replayed = journal.replay(JOURNAL_FILE, list_of_todos,
+                                                 todo_parser())
+        if replayed:
+            print('Replayed {} changes from {} !'.format(replayed,
+                                                         JOURNAL_FILE))
+        #move To-dos completed a while ago to done.txt
+        list_of_todos, archived = done_archive().archive(list_of_todos,
+                                                         ARCHIVE_AFTER_DAYS)
+        if archived:
+            print('Archived {} completed To-Dos to {} !'.format(
+                                                   len(archived), DONE_TXT))
+        #save timestamped backup of todo.txt content
+        backup_name = 'todo_txt_' + re.sub(r'\D+','',
+                       datetime.now().isoformat(timespec='seconds'))
+        #tdt.to_file(backup_name, list_of_todos)
+        #copied rather than moved: other programs keep using todo.txt
+        if os.path.isfile(TODO_TXT):
+            shutil.copy2(TODO_TXT,backup_name)
+        #renumber To-dos sharing a tdid, then give IDs to all To-dos,
+        #sort list, save to todo_txt_tmp
+        for old, new in tdid_allocator().repair(list_of_todos):
+            print('Duplicate tdid {} renumbered to {}'.format(old, new))
+        list_of_todos = sorting.SortedTodoList(todo_id(list_of_todos))
+        with metrics.span('save'):
+            journal.compact(JOURNAL_FILE, TODO_TXT_TMP, list_of_todos)
+        todo_store().reset(list_of_todos)
+    count_save(TODO_TXT_TMP)
+    return list_of_todos
+
+def finish_session(list_of_todos, todays_list):
+    """
+    Save the final list (already sorted) to TODO_TXT, with the latest changes
+    made by other sessions and programs merged in rather than overwritten,
+    and remove TODO_TXT_TMP and the journal
+    """
+    with todo_store().lock():
+        merge_external_changes(list_of_todos, todays_list)
+        with metrics.span('save'):
+            #tmp file removed - otherwise it will be loaded next time
+            if todo_store().finish(list_of_todos):
+                print("removed {}.".format(TODO_TXT_TMP))
+    count_save(TODO_TXT)
+
 def main():
-    #check if tmp file remains, if so, load it
-    if os.path.isfile(TODO_TXT_TMP):
-        list_of_todos = tdt.from_file(TODO_TXT_TMP)
-        print('Loaded To-Dos from {} !'.format(TODO_TXT_TMP))
-    else:
-        #generate the main list of To-dos by reading in todo.txt
-        list_of_todos = tdt.from_file(TODO_TXT)
-    #save timestamped backup of todo.txt content
-    backup_name = 'todo_txt_' + re.sub(r'\D+','',
-                   datetime.now().isoformat(timespec='seconds'))
-    #tdt.to_file(backup_name, list_of_todos)
-    if os.path.isfile(TODO_TXT):
-        os.rename(TODO_TXT,backup_name)
-    #give IDs to all To-dos, sort list, save to todo_txt_tmp
-    list_of_todos = todo_id(list_of_todos)
-    sort_todo_list(list_of_todos)
-    tdt.to_file(TODO_TXT_TMP,list_of_todos)
+    #timings and counters, only if asked for (TODOPOMO_TRACE)
+    metrics.start()
+    with metrics.span('load'):
+        list_of_todos = load_todos()
+    metrics.count('todos_loaded', len(list_of_todos))
+    #load (or build) the rollups before anything new is recorded
+    rollups()
+    #the log only keeps the current month
+    rotate_log(LOG_FILE, STATS_CACHE, log_writer())
 #    print_list(list_of_todos, completed='Y')
     #define today's list of To-Dos from those that aren't completed
-    todays_list = make_todays_list(tdt.search(list_of_todos,completed=False))
+    todays_list = make_todays_list(todo_index.search(completed=False,
+                                                     within=list_of_todos))
     #initialise variables keeping track of Pomos done, their number, time spent
     done_list, pomo_done, time_today = [], 0, 0
     #loop for moving To-dos from today's list to done list by doing them
     while True:
+        merged = merge_external_changes(list_of_todos, todays_list)
+        if merged:
+            print('Merged {} To-dos changed in {} !'.format(merged, TODO_TXT))
         option_selected = selection(todays_list, "CRSF", default_option='0')
         if option_selected == 'C':
             list_of_todos, todays_list = todo_list_menu_selection(list_of_todos, todays_list)
@@ -510,7 +1091,9 @@ def main():
             feedback(pomo_done,time_today,done_list,todays_list)
             continue
         elif option_selected == 'S':
-            print("not yet implemented")
+            log_writer().flush()
+            pomo_stats.show_stats(LOG_FILE, STATS_CACHE,
+                                  list(list_of_todos) + done_archive().todos())
             continue
 #        else: #has to be a To-do
         try:
@@ -524,25 +1107,26 @@ def main():
         time_today += pomo_cycle_duration
         #update the to-do that's going through a pomodoro cycle
         update_todo(option_selected, completed, pomo_count, pomo_cycle_duration)
+        list_of_todos.reposition(option_selected)
         print('checking:', option_selected)
         #update the temprary todo.txt file
-        tdt.to_file(TODO_TXT_TMP, list_of_todos)
+        save_list(list_of_todos)
         feedback(pomo_done,time_today,done_list,todays_list)
         if completed == "Y":
             print("You just finished:\n {} \n Well done!".format(option_selected))
             done_list.append(option_selected)
             todays_list.remove(option_selected)
         feedback(pomo_done,time_today,done_list,todays_list)
-    #sort full list, overwrite the temporary todo.txt file
-    sort_todo_list(list_of_todos)
-    #save final list, overwriting the original
-    tdt.to_file(TODO_TXT,list_of_todos)
+    finish_session(list_of_todos, todays_list)
+    rollups().save()
+    if _todo_watcher is not None:
+        _todo_watcher.close()
     if os.path.isfile(TODO_TXT):
         print("saved current To-Dos to {}.".format(TODO_TXT))
-    #remove tmp file - otherwise it will be loaded next time
-    if os.path.isfile(TODO_TXT_TMP):
-        os.remove(TODO_TXT_TMP)
-        print("removed {}.".format(TODO_TXT_TMP))
+        #next session can start from the cache
+        if USE_CACHE:
+            caching.store(TODO_TXT, TODO_CACHE, list_of_todos,
+                          parse=todo_parser())
 
 
 if __name__ == "__main__":
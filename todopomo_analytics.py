@@ -0,0 +1,198 @@
+"""
+Analytics over the Pomodoro history, for charts and visualisation.
+
+The log is loaded into columnar NumPy arrays from the binary sidecar that
+write_pomo() maintains next to todopomo_log.txt (see todopomo_log), which is
+memory-mapped rather than parsed - after the records of past months, from
+the sidecar of the segments once the log was rotated (see
+todopomo_segments). All
+analytics are vectorised over these columns instead of looping over the
+records.
+
+columns: tdid (code, index into tdids), tdids (list of tdid names),
+         start, stop (int64, epoch seconds), duration (float64, seconds),
+         is_break, is_work (bool: completed Pomodoros, no interruptions)
+"""
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    has_numpy = False
+else:
+    has_numpy = True
+    #same layout as todopomo_log.RECORD
+    RECORD_DTYPE = np.dtype([('tdid', '<u4'), ('start', '<i8'),
+                             ('stop', '<i8'), ('duration', '<f8'),
+                             ('endpoint', '<u8')])
+
+DAY = 86400
+#an interrupted Pomodoro's line in the endpoints of a sidecar
+INTERRUPTED_LINE = (pomo_log.INTERRUPTED + '\n').encode()
+
+def load_sidecar(log_file):
+    """
+    Memory-map the binary sidecar of a log (or of its segments, see
+    todopomo_segments.segments_sidecar)
+    returns: records (structured array), tdids (list), interrupted (bool
+             array: endpoint of the record is todopomo_log.INTERRUPTED)
+    """
+    bin_file, tdids_file, endpoints_file = pomo_log.sidecar_paths(log_file)
+    n = os.path.getsize(bin_file) // RECORD_DTYPE.itemsize
+    if n:
+        records = np.memmap(bin_file, dtype=RECORD_DTYPE, mode='r',
+                            shape=(n,))
+    else:
+        records = np.zeros(0, dtype=RECORD_DTYPE)
+    return (records, pomo_log.read_tdids(tdids_file),
+            interrupted(records, endpoints_file))
+
+def interrupted(records, endpoints_file):
+    """
+    Mask of the records whose endpoint is todopomo_log.INTERRUPTED
+    """
+    mask = np.zeros(len(records), dtype=bool)
+    size = os.path.getsize(endpoints_file) \
+           if os.path.isfile(endpoints_file) else 0
+    if not len(records) or not size:
+        return mask
+    endpoints = np.memmap(endpoints_file, dtype=np.uint8, mode='r')
+    offsets = records['endpoint'].astype(np.int64)
+    #endpoints starting with the first byte, then compared in full
+    fits = np.flatnonzero(offsets + len(INTERRUPTED_LINE) <= size)
+    candidates = fits[endpoints[offsets[fits]] == INTERRUPTED_LINE[0]]
+    line = np.frombuffer(INTERRUPTED_LINE, dtype=np.uint8)
+    window = offsets[candidates][:, None] + np.arange(len(line))
+    mask[candidates] = (endpoints[window] == line).all(axis=1)
+    return mask
+
+def load_columns(log_file):
+    """
+    Load the log as columns, building the binary sidecar first if needed
+    """
+    if not os.path.isfile(pomo_log.sidecar_paths(log_file)[0]):
+        pomo_log.convert(log_file)
+    #past months (of the segments) first, the tdid codes of each sidecar
+    #mapped to those of all the records
+    tdids, code_of = [], {}
+    parts = []
+    for name in (segments.segments_sidecar(log_file), log_file):
+        records, part_tdids, part_interrupted = load_sidecar(name)
+        for tdid in part_tdids:
+            if tdid not in code_of:
+                code_of[tdid] = len(tdids)
+                tdids.append(tdid)
+        codes = np.array([code_of[tdid] for tdid in part_tdids],
+                         dtype=np.int64)
+        parts.append((codes[records['tdid']], records, part_interrupted))
+    codes = np.concatenate([part[0] for part in parts])
+    duration, start, stop = [np.concatenate([part[1][field]
+                                             for part in parts])
+                             for field in ('duration', 'start', 'stop')]
+    is_interrupted = np.concatenate([part[2] for part in parts])
+    break_code = tdids.index('break') if 'break' in tdids else -1
+    is_break = codes == break_code
+    return {'tdid': codes,
+            'tdids': tdids,
+            'start': start,
+            'stop': stop,
+            'duration': duration,
+            'is_break': is_break,
+            'is_work': ~is_break & ~is_interrupted}
+
+def local_time(epochs):
+    """
+    Convert epoch seconds to seconds since the epoch in local time.
+    The UTC offset is looked up once per day (at noon UTC), which is exact
+    except for the few hours around a daylight saving time change.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if not len(epochs):
+        return epochs.copy()
+    days, inverse = np.unique(epochs // DAY, return_inverse=True)
+    offsets = np.array([time.localtime(int(day) * DAY + DAY // 2).tm_gmtoff
+                        for day in days], dtype=np.int64)
+    return epochs + offsets[inverse]
+
+def hour_histogram(columns):
+    """
+    Pomodoros and seconds worked by hour of day (local time) they started
+    returns: counts, seconds - arrays of length 24
+    """
+    work = columns['is_work']
+    hours = (local_time(columns['start'][work]) % DAY) // 3600
+    counts = np.bincount(hours, minlength=24)
+    seconds = np.bincount(hours, weights=columns['duration'][work],
+                          minlength=24)
+    return counts, seconds
+
+def daily_totals(columns):
+    """
+    Seconds worked per day, from the first to the last day worked (days
+    without work included as 0)
+    returns: days (days since the epoch, local time), seconds
+    """
+    work = columns['is_work']
+    days = local_time(columns['start'][work]) // DAY
+    if not len(days):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    first = days.min()
+    seconds = np.bincount(days - first, weights=columns['duration'][work])
+    return np.arange(first, first + len(seconds)), seconds
+
+def rolling_weekly(columns, weeks=4):
+    """
+    Rolling average of the seconds worked per week, over the last `weeks`
+    weeks ending on each day
+    returns: days, average seconds per week
+    """
+    days, seconds = daily_totals(columns)
+    window = 7 * weeks
+    cumulative = np.concatenate(([0.], np.cumsum(seconds)))
+    lower = np.maximum(np.arange(1, len(seconds) + 1) - window, 0)
+    return days, (cumulative[1:] - cumulative[lower]) / weeks
+
+def streaks(columns):
+    """
+    Streaks of consecutive days with at least one Pomodoro
+    returns: longest streak, current streak (ending on the last day worked)
+    """
+    days, seconds = daily_totals(columns)
+    if not len(days):
+        return 0, 0
+    worked = np.concatenate(([0], seconds > 0, [0])).astype(np.int8)
+    edges = np.diff(worked)
+    lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return int(lengths.max()), int(lengths[-1])
+
+def project_shares(columns, todo_list):
+    """
+    Share of the time worked spent on each project. The time of a To-do with
+    several projects is split evenly between them; tdids not found in
+    todo_list (or To-dos without project) count as 'No project'.
+    returns: dictionary project -> share (sums to 1)
+    """
+    work = columns['is_work']
+    tdids = columns['tdids']
+    per_tdid = np.bincount(columns['tdid'][work],
+                           weights=columns['duration'][work],
+                           minlength=len(tdids))
+    total = per_tdid.sum()
+    if not total:
+        return {}
+    todo_projects = {todo.tags.get('tdid'): todo.projects for todo in todo_list}
+    #(tdid code, project index, fraction) triples, one loop over tdids only
+    names, codes, indices, fractions = {}, [], [], []
+    for code, tdid in enumerate(tdids):
+        projects = todo_projects.get(tdid) or ['No project']
+        for project in projects:
+            codes.append(code)
+            indices.append(names.setdefault(project, len(names)))
+            fractions.append(1. / len(projects))
+    seconds = np.bincount(indices, weights=per_tdid[codes] * fractions,
+                          minlength=len(names))
+    return {project: seconds[i] / total for project, i in names.items()}
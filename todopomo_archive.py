@@ -0,0 +1,66 @@
+"""
+Archive of completed To-dos (done.txt, as used by other todo.txt clients).
+
+To-dos completed more than a number of days ago are moved from the list of
+To-dos (todo.txt) to done.txt, keeping todo.txt small. done.txt is only
+read when the archived To-dos are actually needed (stats, listing completed
+To-dos).
+"""
+import todotxtio as tdt
+
+from datetime import date, timedelta
+import os
+
+class Archive(object):
+    """
+    The archived To-dos of done_file, loaded on first use
+    """
+
+    def __init__(self, done_file):
+        self.done_file = done_file
+        self._todos = None
+
+    def archive(self, todo_list, days):
+        """
+        Move To-dos completed more than `days` days ago to the archive
+        (To-dos completed without completion date are kept, as their age
+        is unknown)
+        returns: list of remaining To-dos, list of archived To-dos
+        """
+        cutoff = (date.today() - timedelta(days=days)).isoformat()
+        remaining, archived = [], []
+        for todo in todo_list:
+            if todo.completed and todo.completion_date \
+                    and todo.completion_date < cutoff:
+                archived.append(todo)
+            else:
+                remaining.append(todo)
+        if archived:
+            self.append(archived)
+        return remaining, archived
+
+    def append(self, todo_list):
+        """
+        Append To-dos to done_file
+        """
+        #to_file doesn't end the last To-do with a newline
+        separator = ''
+        if os.path.isfile(self.done_file) and os.path.getsize(self.done_file):
+            with open(self.done_file, 'rb') as fd:
+                fd.seek(-1, os.SEEK_END)
+                separator = '' if fd.read(1) == b'\n' else '\n'
+        with open(self.done_file, 'a') as fd:
+            fd.write(separator + tdt.to_string(todo_list) + '\n')
+        if self._todos is not None:
+            self._todos.extend(todo_list)
+
+    def todos(self):
+        """
+        The archived To-dos, read from done_file the first time
+        """
+        if self._todos is None:
+            if os.path.isfile(self.done_file):
+                self._todos = tdt.from_file(self.done_file)
+            else:
+                self._todos = []
+        return self._todos
@@ -0,0 +1,90 @@
+"""
+Batch edits: the same changes applied to many To-dos at once.
+
+selection: comma-separated numbers and ranges of the To-dos listed,
+           eg '0-5,8,12-' (a range without end runs to the last To-do)
+operations: comma-separated list of
+    P<priority>  set the priority, eg PA (P alone removes it)
+    X            mark as completed (today)
+    +project     add a project
+    -project     remove a project
+    T            add to today's list
+    R            remove from today's list
+
+Only the To-dos themselves are changed here (apply()); the lists, index and
+saving are left to the caller, which does them once for the whole batch.
+"""
+from datetime import date
+import re
+
+SELECTION = re.compile(r'^\s*\d+\s*(-\s*\d*\s*)?(,\s*\d+\s*(-\s*\d*\s*)?)*$')
+
+def parse_selection(text, count):
+    """
+    Numbers selected by a list of numbers and ranges
+    count : number of To-dos listed
+    returns: sorted list of numbers, or None if text isn't such a list or
+             a number is out of range
+    """
+    if not SELECTION.match(text):
+        return None
+    numbers = set()
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = (int(last) if last.strip() else count - 1) if _ else first
+        if first > last or last >= count:
+            return None
+        numbers.update(range(first, last + 1))
+    return sorted(numbers)
+
+def parse_operations(text, priorities):
+    """
+    Operations of a batch edit
+    priorities : the valid priorities
+    returns: list of (operation, argument), operation being one of
+             'priority', 'complete', 'add_project', 'remove_project',
+             'add_today', 'remove_today'
+    raises: ValueError for anything else
+    """
+    operations = []
+    for part in text.split(','):
+        part = part.strip()
+        code = part[:1].upper()
+        if part[:1] in '+-' and len(part) > 1 and ' ' not in part:
+            operation = 'add_project' if part[0] == '+' else 'remove_project'
+            operations.append((operation, part[1:]))
+        elif code == 'P' and (len(part) == 1 or (len(part) == 2
+                                                 and part[1].upper() in priorities)):
+            operations.append(('priority', part[1:].upper() or None))
+        elif part.upper() == 'X':
+            operations.append(('complete', None))
+        elif part.upper() == 'T':
+            operations.append(('add_today', None))
+        elif part.upper() == 'R':
+            operations.append(('remove_today', None))
+        else:
+            raise ValueError("unknown operation '{}'".format(part))
+    return operations
+
+def apply(todo, operations):
+    """
+    Apply the operations on a To-do itself (not those on today's list).
+    Projects are assigned as new lists rather than changed in place.
+    returns: True if the To-do was changed
+    """
+    changed = False
+    for operation, argument in operations:
+        if operation == 'priority' and todo.priority != argument:
+            todo.priority = argument
+        elif operation == 'complete' and not todo.completed:
+            todo.completion_date = date.today().isoformat()
+        elif operation == 'add_project' and argument not in todo.projects:
+            todo.projects = list(todo.projects) + [argument]
+        elif operation == 'remove_project' and argument in todo.projects:
+            todo.projects = [project for project in todo.projects
+                                     if project != argument]
+        else:
+            continue
+        changed = True
+    return changed
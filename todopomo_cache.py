@@ -0,0 +1,58 @@
+"""
+Cache of parsed todo.txt files, so an unchanged file loads without parsing.
+
+The cache file holds the key of the file it was made from (size, mtime and
+sha1 hash of the content, and the parser used) followed by the pickled list
+of To-dos. Only the
+key is unpickled to check the cache; reading and hashing the file costs a
+fraction of parsing it.
+"""
+import todotxtio as tdt
+
+import hashlib
+import os
+import pickle
+
+def read_key(path, parse=tdt.from_string):
+    """
+    Key of a file, and its content
+    parse : the function parsing the file, as To-dos parsed by another one
+            (eg todopomo_compact.from_string) don't match
+    returns: (size, mtime, hash, parser), content (str)
+    """
+    with open(path, 'rb') as fd:
+        data = fd.read()
+        stat = os.fstat(fd.fileno())
+    key = (stat.st_size, stat.st_mtime_ns, hashlib.sha1(data).hexdigest(),
+           parse.__module__)
+    return key, data.decode('utf-8')
+
+def store(path, cache_file, todo_list, key=None, parse=tdt.from_string):
+    """
+    Save the To-dos parsed from (or just written to) path in the cache
+    """
+    if key is None:
+        key = read_key(path, parse)[0]
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as fd:
+        pickle.dump(key, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(list(todo_list), fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+def load(path, cache_file, parse=tdt.from_string):
+    """
+    Load the To-dos of a todo.txt file: from the cache if it was made from
+    the same file, otherwise by parsing the file (and caching the result)
+    returns: list of To-dos
+    """
+    key, content = read_key(path, parse)
+    try:
+        with open(cache_file, 'rb') as fd:
+            if pickle.load(fd) == key:
+                return pickle.load(fd)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+        pass
+    todo_list = parse(content)
+    store(path, cache_file, todo_list, key)
+    return todo_list
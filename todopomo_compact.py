@@ -0,0 +1,169 @@
+"""
+Compact representation of To-dos, for large todo.txt files.
+
+CompactTodo has the attributes of todotxtio.Todo used by todopomo (text,
+priority, completed, completion_date, creation_date, projects, contexts,
+tags) and formats to the same todo.txt line, but:
+- uses __slots__ instead of an instance dictionary
+- stores the priority as a small int (0 for none, 1 for A, ...)
+- keeps projects and contexts as tuples of interned strings, so the same
+  project is stored once however many To-dos have it
+- interns dates and tag names
+Projects and contexts can't be changed in place: assign a new list instead
+(todo.projects = list(todo.projects) + ['garden']).
+
+Lines are parsed by todotxtio one at a time and converted, so parsing
+behaves exactly as for todotxtio.Todo without building the whole list of
+todotxtio.Todo first.
+"""
+import todotxtio as tdt
+
+import sys
+
+intern = sys.intern
+
+def _intern_all(names):
+    return tuple(intern(name) for name in names) if names else ()
+
+class CompactTodo(object):
+    """
+    To-do with the attributes of todotxtio.Todo, in less memory
+    """
+    __slots__ = ('text', '_priority', '_completed', '_completion_date',
+                 '_creation_date', '_projects', '_contexts', 'tags',
+                 '__weakref__')
+
+    def __init__(self, text=None, completed=False, completion_date=None,
+                 priority=None, creation_date=None, projects=None,
+                 contexts=None, tags=None):
+        self.text = text
+        self._completed = bool(completed)
+        self._completion_date = None
+        if completion_date and completed:
+            self.completion_date = completion_date
+        self.priority = priority
+        self.creation_date = creation_date
+        self.projects = projects
+        self.contexts = contexts
+        self.tags = tags if tags is not None else {}
+
+    @property
+    def priority(self):
+        if not self._priority:
+            return None
+        return chr(64 + self._priority)
+
+    @priority.setter
+    def priority(self, priority):
+        if priority and (len(priority) != 1 or not 'A' <= priority <= 'Z'):
+            raise ValueError("not a priority: {!r}".format(priority))
+        self._priority = ord(priority) - 64 if priority else 0
+
+    #as for todotxtio.Todo: a completion date marks the To-do as completed,
+    #un-completing it removes the completion date
+    @property
+    def completed(self):
+        return self._completed
+
+    @completed.setter
+    def completed(self, completed):
+        self._completed = bool(completed)
+        if not completed:
+            self._completion_date = None
+
+    @property
+    def completion_date(self):
+        return self._completion_date
+
+    @completion_date.setter
+    def completion_date(self, completion_date):
+        self._completion_date = intern(completion_date) \
+                                if completion_date else None
+        if completion_date:
+            self._completed = True
+
+    @property
+    def creation_date(self):
+        return self._creation_date
+
+    @creation_date.setter
+    def creation_date(self, creation_date):
+        self._creation_date = intern(creation_date) if creation_date else None
+
+    @property
+    def projects(self):
+        return self._projects
+
+    @projects.setter
+    def projects(self, projects):
+        self._projects = _intern_all(projects)
+
+    @property
+    def contexts(self):
+        return self._contexts
+
+    @contexts.setter
+    def contexts(self, contexts):
+        self._contexts = _intern_all(contexts)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__[:-1])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__[:-1], state):
+            object.__setattr__(self, name, value)
+
+    def __str__(self):
+        line = []
+        if self._completed:
+            line.append('x')
+        if self._completion_date:
+            line.append(self._completion_date)
+        if self._priority:
+            line.append('(' + self.priority + ')')
+        if self._creation_date:
+            line.append(self._creation_date)
+        line.append(self.text)
+        if self._projects:
+            line.append(' '.join(['+' + project for project in self._projects]))
+        if self._contexts:
+            line.append(' '.join(['@' + context for context in self._contexts]))
+        if self.tags:
+            line.append(' '.join([name + ':' + value
+                                  for name, value in self.tags.items()]))
+        return ' '.join(line)
+
+    def __repr__(self):
+        return 'CompactTodo("{}")'.format(str(self))
+
+def compact(todo):
+    """
+    CompactTodo with the content of a todotxtio.Todo
+    """
+    tags = todo.tags
+    if tags:
+        tags = {intern(name): value for name, value in tags.items()}
+    return CompactTodo(todo.text, todo.completed, todo.completion_date,
+                       todo.priority, todo.creation_date, todo.projects,
+                       todo.contexts, tags)
+
+def from_string(string):
+    """
+    Parse todo.txt content into a list of CompactTodo
+    """
+    todos = []
+    for line in string.splitlines():
+        if line.strip():
+            todos.extend(compact(todo) for todo in tdt.from_string(line))
+    return todos
+
+def from_file(path):
+    """
+    Read a todo.txt file into a list of CompactTodo
+    """
+    todos = []
+    with open(path, encoding='utf-8') as fd:
+        for line in fd:
+            if line.strip():
+                todos.extend(compact(todo) for todo in tdt.from_string(line))
+    return todos
@@ -0,0 +1,119 @@
+"""
+Allocation of To-do IDs (tdid), the primary key joining To-dos and the log.
+
+format: P_, the date, underscore, incrementing number
+The number is counted per day and the counter is saved in a small state file,
+so that IDs handed out earlier the same day (eg in a previous session) are
+never handed out again. Every new tdid is also checked against the set of
+tdids in use.
+Several processes can hand out tdids from the same state file: the counter
+is read again, under the lock of the file (see todopomo_lock), before
+handing out new tdids and saving it.
+"""
+import todopomo_lock as locking
+
+from datetime import date
+import json
+import os
+
+class TdidAllocator(object):
+    """
+    Hands out unique tdids
+    state_file : json file keeping the day and the counter for that day
+    tdids : tdids already in use
+    """
+
+    def __init__(self, state_file, tdids=()):
+        self.state_file = state_file
+        self.tdids = set(tdids)
+        self.day, self.counter = None, 0
+        self.load()
+
+    def load(self):
+        """
+        Read the counter saved (by this or another process), keeping ours if
+        it is further
+        """
+        try:
+            with open(self.state_file) as fd:
+                state = json.load(fd)
+        except (OSError, ValueError):
+            return
+        day, counter = state.get('day'), state.get('counter', 0)
+        if day != self.day:
+            self.day, self.counter = day, counter
+        else:
+            self.counter = max(self.counter, counter)
+
+    def save(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as fd:
+            json.dump({'day': self.day, 'counter': self.counter}, fd)
+        os.replace(tmp_file, self.state_file)
+
+    def register(self, tdid):
+        """
+        Mark a tdid as being in use
+        """
+        self.tdids.add(tdid)
+
+    def allocate(self):
+        """
+        Hand out the next free tdid of today (the counter isn't saved, see
+        save())
+        """
+        today = date.today().isoformat()
+        if today != self.day:
+            self.day, self.counter = today, 0
+        while True:
+            tdid = 'P_' + today + '_' + str(self.counter)
+            self.counter += 1
+            if tdid not in self.tdids:
+                self.tdids.add(tdid)
+                return tdid
+
+    def tag(self, todo_list):
+        """
+        Give a tdid to the To-dos of the list which don't have one yet
+        returns: the To-dos tagged
+        """
+        tagged = []
+        for todo in todo_list:
+            if 'tdid' in todo.tags:
+                self.tdids.add(todo.tags['tdid'])
+            else:
+                tagged.append(todo)
+        if tagged:
+            with locking.lock(self.state_file):
+                self.load()
+                for todo in tagged:
+                    todo.tags['tdid'] = self.allocate()
+                self.save()
+        return tagged
+
+    def repair(self, todo_list):
+        """
+        Find To-dos sharing a tdid and give all but the first of them a new
+        one, in a single pass over the list
+        returns: list of (old tdid, new tdid)
+        """
+        seen, duplicates = set(), []
+        for todo in todo_list:
+            tdid = todo.tags.get('tdid')
+            if tdid is None:
+                continue
+            if tdid in seen:
+                duplicates.append(todo)
+            else:
+                seen.add(tdid)
+        self.tdids |= seen
+        renumbered = []
+        if duplicates:
+            with locking.lock(self.state_file):
+                self.load()
+                for todo in duplicates:
+                    tdid = self.allocate()
+                    renumbered.append((todo.tags['tdid'], tdid))
+                    todo.tags['tdid'] = tdid
+                self.save()
+        return renumbered
@@ -0,0 +1,455 @@
+"""
+In-memory index of the list of To-dos.
+
+Maps tdid -> To-do, and keeps buckets of To-dos (tdid -> To-do) by priority,
+project, context and completion state, so that lookups don't need to scan
+the whole list. The index has to be told about changes: add() for new
+To-dos, update() after a To-do was changed, remove() when one is dropped.
+
+Full-text search (query()) uses an inverted index: search token -> postings
+(tdid -> weight), with the tokens also kept in a sorted list so that a
+query word matches all tokens starting with it. It is built on the first
+query, then kept up to date like the buckets.
+
+With a limit, query() avoids scoring every match when it can: if few To-dos
+can reach the best possible score (eg a whole project name), only those
+are ranked; if matches are common, the To-dos are read in ranking order
+(not completed first, then by tdid) until `limit` of them have the best
+score. Otherwise, and to find matches with lower scores, all matches are
+scored.
+
+search tokens: words of the text, projects (+name) and contexts (@name) and
+               their words, tags (key:value) - all lower case
+"""
+from bisect import bisect_left, insort
+import heapq
+from itertools import islice
+from operator import itemgetter
+import re
+
+WORD = re.compile(r'\w+')
+#weight of a token in the ranking, by where it comes from
+TEXT_WEIGHT = 1
+NAME_WEIGHT = 3 #projects and contexts
+TAG_WEIGHT = 1
+EXACT_BONUS = 2 #factor for query words matching a whole token
+#relative cost of checking the tokens of one To-do against a query word,
+#compared to looking up one posting
+CHECK_COST = 10
+#a walk through the ranking order looking for the best matches is given up
+#after this many times the number of To-dos it was expected to look at
+WALK_MARGIN = 4
+
+def tokens_of(todo):
+    """
+    Search tokens of a To-do
+    returns: dictionary token -> weight
+    """
+    tokens = {}
+    for word in WORD.findall((todo.text or '').lower()):
+        tokens[word] = TEXT_WEIGHT
+    for key, value in todo.tags.items():
+        tokens['{}:{}'.format(key, value).lower()] = TAG_WEIGHT
+    for sign, names in (('+', todo.projects), ('@', todo.contexts)):
+        for name in names:
+            name = name.lower()
+            tokens[sign + name] = NAME_WEIGHT
+            for word in WORD.findall(name):
+                tokens[word] = NAME_WEIGHT
+    return tokens
+
+def query_terms(text):
+    """
+    Words of a query: +project, @context and key:value are kept whole,
+    other words split like the text of To-dos
+    """
+    terms = []
+    for term in text.lower().split():
+        if term[0] in '+@' or ':' in term:
+            terms.append(term)
+        else:
+            terms.extend(WORD.findall(term))
+    return terms
+
+class TodoIndex(object):
+    """
+    Index of To-dos by tdid, priority, project, context and completion
+    """
+
+    def __init__(self, todo_list=()):
+        self.todos = {}    #tdid -> To-do
+        self._keys = {}    #tdid -> indexed values, to find its buckets again
+        self.priority = {}
+        self.project = {}
+        self.context = {}
+        self.completed = {}
+        self._postings = None   #token -> {tdid: weight}, built by query()
+        self._names = {}        #the postings of _postings with NAME_WEIGHT
+        self._vocabulary = []   #sorted tokens of _postings
+        self._tokens = {}       #tdid -> {token: weight}
+        self._ranking = []      #sorted (completed, tdid) of all To-dos
+        for todo in todo_list:
+            self.add(todo)
+
+    def __len__(self):
+        return len(self.todos)
+
+    def __contains__(self, todo):
+        """
+        Check if a To-do (or a tdid) is indexed
+        """
+        if isinstance(todo, str):
+            return todo in self.todos
+        return self.todos.get(todo.tags.get('tdid')) is todo
+
+    def get(self, tdid, default=None):
+        return self.todos.get(tdid, default)
+
+    @staticmethod
+    def _keys_of(todo):
+        return (todo.priority, tuple(todo.projects), tuple(todo.contexts),
+                bool(todo.completed))
+
+    def _buckets(self, keys):
+        priority, projects, contexts, completed = keys
+        yield self.priority, priority
+        for project in projects:
+            yield self.project, project
+        for context in contexts:
+            yield self.context, context
+        yield self.completed, completed
+
+    def add(self, todo):
+        """
+        Index a To-do (it must have a tdid), replacing any To-do indexed
+        with the same tdid
+        """
+        tdid = todo.tags['tdid']
+        previous = self.todos.get(tdid)
+        if previous is todo:
+            return
+        if previous is not None:
+            self.remove(previous)
+        keys = self._keys_of(todo)
+        self.todos[tdid] = todo
+        self._keys[tdid] = keys
+        for buckets, key in self._buckets(keys):
+            buckets.setdefault(key, {})[tdid] = todo
+        if self._postings is not None:
+            self._index_text(tdid, tokens_of(todo))
+            insort(self._ranking, (keys[3], tdid))
+
+    def remove(self, todo):
+        """
+        Remove a To-do from the index (nothing happens if it isn't indexed)
+        """
+        tdid = todo.tags.get('tdid')
+        if self.todos.get(tdid) is not todo:
+            return
+        keys = self._keys.pop(tdid)
+        for buckets, key in self._buckets(keys):
+            bucket = buckets[key]
+            del bucket[tdid]
+            if not bucket:
+                del buckets[key]
+        if self._postings is not None:
+            self._unindex_text(tdid)
+            del self._ranking[bisect_left(self._ranking, (keys[3], tdid))]
+        del self.todos[tdid]
+
+    def update(self, todo):
+        """
+        Re-index a To-do after its priority, projects, contexts, completion,
+        text or tags changed (a To-do not yet indexed is added)
+        """
+        tdid = todo.tags['tdid']
+        if self.todos.get(tdid) is todo \
+                and self._keys[tdid] == self._keys_of(todo):
+            #only the text or tags may have changed
+            if self._postings is not None:
+                tokens = tokens_of(todo)
+                if tokens != self._tokens[tdid]:
+                    self._unindex_text(tdid)
+                    self._index_text(tdid, tokens)
+            return
+        self.remove(todo)
+        self.add(todo)
+
+    def _index_text(self, tdid, tokens):
+        self._tokens[tdid] = tokens
+        for token, weight in tokens.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            postings[tdid] = weight
+            if weight == NAME_WEIGHT:
+                self._names.setdefault(token, {})[tdid] = weight
+
+    def _unindex_text(self, tdid):
+        for token, weight in self._tokens.pop(tdid).items():
+            postings = self._postings[token]
+            del postings[tdid]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+            if weight == NAME_WEIGHT:
+                names = self._names[token]
+                del names[tdid]
+                if not names:
+                    del self._names[token]
+
+    def _build_text_index(self):
+        self._postings = {}
+        self._names = {}
+        for tdid, todo in self.todos.items():
+            tokens = self._tokens[tdid] = tokens_of(todo)
+            for token, weight in tokens.items():
+                self._postings.setdefault(token, {})[tdid] = weight
+                if weight == NAME_WEIGHT:
+                    self._names.setdefault(token, {})[tdid] = weight
+        self._vocabulary = sorted(self._postings)
+        self._ranking = sorted((keys[3], tdid)
+                               for tdid, keys in self._keys.items())
+
+    def _expand(self, term):
+        """
+        Tokens starting with a query word
+        """
+        tokens = []
+        i = bisect_left(self._vocabulary, term)
+        while i < len(self._vocabulary) \
+                and self._vocabulary[i].startswith(term):
+            tokens.append(self._vocabulary[i])
+            i += 1
+        return tokens
+
+    def _term_scores(self, term, tokens):
+        """
+        Best weight of the tokens starting with a query word, by tdid
+        tokens : the tokens starting with term
+        """
+        if len(tokens) == 1:
+            bonus = EXACT_BONUS if tokens[0] == term else 1
+            return {tdid: weight * bonus
+                    for tdid, weight in self._postings[tokens[0]].items()}
+        scores = {}
+        for token in tokens:
+            bonus = EXACT_BONUS if token == term else 1
+            for tdid, weight in self._postings[token].items():
+                weight *= bonus
+                if weight > scores.get(tdid, 0):
+                    scores[tdid] = weight
+        return scores
+
+    def _best_weight(self, tdid, term):
+        """
+        Best weight of the tokens of a To-do starting with a query word
+        (0 if it has none)
+        """
+        best = 0
+        for token, weight in self._tokens[tdid].items():
+            if token.startswith(term):
+                if token == term:
+                    weight *= EXACT_BONUS
+                if weight > best:
+                    best = weight
+        return best
+
+    def _check_term(self, scores, term):
+        """
+        Keep the tdids of scores having a token starting with a query word,
+        adding the best weight of these tokens to their score
+        """
+        checked = {}
+        for tdid, score in scores.items():
+            best = self._best_weight(tdid, term)
+            if best:
+                checked[tdid] = score + best
+        return checked
+
+    def _top_band(self, term, tokens):
+        """
+        Best weight a To-do can get for a query word, and the postings of
+        the To-dos which get it
+        tokens : the tokens starting with term
+        """
+        bands = {}
+        for token in tokens:
+            bonus = EXACT_BONUS if token == term else 1
+            if token in self._names:
+                bands.setdefault(NAME_WEIGHT * bonus, []).append(
+                                                         self._names[token])
+            if len(self._names.get(token, ())) < len(self._postings[token]):
+                bands.setdefault(max(TEXT_WEIGHT, TAG_WEIGHT) * bonus,
+                                 []).append(self._postings[token])
+        best = max(bands)
+        return best, bands[best]
+
+    def _top(self, expanded, sizes, limit, allowed):
+        """
+        The `limit` best matches of a query, found without scoring all the
+        matches (see module docstring)
+        expanded : (query word, tokens starting with it), fewest matches first
+        sizes : number of postings of the tokens of each query word
+        allowed : ids of the To-dos to search, None for all
+        returns: list of To-dos, None if they can't be found that way
+        """
+        bands = [self._top_band(term, tokens) for term, tokens in expanded]
+        best = sum(weight for weight, postings in bands)
+        #the To-dos reaching the best score, from the rarest band
+        size, rarest = min((sum(map(len, postings)), i)
+                           for i, (weight, postings) in enumerate(bands))
+        #To-dos to read in ranking order to find `limit` matches, if the
+        #query words were independent
+        density = 1.
+        for n in sizes:
+            density *= n / max(1, len(self.todos))
+        steps = limit / density if density else len(self.todos)
+        if size <= steps * len(expanded):
+            top = {tdid for postings in bands[rarest][1] for tdid in postings}
+            for i, (weight, postings) in enumerate(bands):
+                if i != rarest:
+                    top = {tdid for tdid in top
+                                if any(tdid in p for p in postings)}
+            if allowed is not None:
+                top = {tdid for tdid in top
+                            if id(self.todos[tdid]) in allowed}
+            if len(top) < limit:
+                return None
+            return self._rank(dict.fromkeys(top, best), limit)
+        if steps * len(expanded) >= sizes[0]:
+            return None
+        #postings to look the To-dos up in (and their bonus) for each query
+        #word, None to check the To-do's own tokens instead
+        checks = [(term, [(self._postings[token],
+                           EXACT_BONUS if token == term else 1)
+                          for token in tokens]
+                         if len(tokens) <= CHECK_COST else None)
+                  for term, tokens in expanded]
+        found = []
+        #the To-dos in ranking order, those missing a query word of a
+        #single token filtered out first
+        reads = int(WALK_MARGIN * steps) + limit
+        candidates = map(itemgetter(1), islice(self._ranking, reads))
+        for term, tokens in expanded:
+            if len(tokens) == 1:
+                candidates = filter(self._postings[tokens[0]].__contains__,
+                                    candidates)
+        for tdid in candidates:
+            if allowed is not None and id(self.todos[tdid]) not in allowed:
+                continue
+            score = 0
+            for term, postings in checks:
+                if postings is None:
+                    term_score = self._best_weight(tdid, term)
+                else:
+                    term_score = 0
+                    for token_postings, bonus in postings:
+                        weight = token_postings.get(tdid, 0) * bonus
+                        if weight > term_score:
+                            term_score = weight
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                if score == best:
+                    found.append(self.todos[tdid])
+                    if len(found) == limit:
+                        return found
+        return None
+
+    def _rank(self, scores, limit=None):
+        """
+        To-dos of scores (tdid -> score), best first
+        """
+        done = self.completed.get(True, {})
+        ranked = ((-score, tdid in done, tdid) for tdid, score in scores.items())
+        if limit is None:
+            ranked = sorted(ranked)
+        else:
+            ranked = heapq.nsmallest(limit, ranked)
+        return [self.todos[tdid] for score, completed, tdid in ranked]
+
+    def projects(self):
+        """
+        All projects of the indexed To-dos
+        """
+        return list(self.project)
+
+    def search(self, priority=None, project=None, context=None,
+               completed=None, within=None):
+        """
+        Find the To-dos matching all the given criteria
+        within : if given, only To-dos of this list are returned, in its order
+                 (otherwise in the order they were indexed)
+        """
+        criteria = [(self.priority, priority), (self.project, project),
+                    (self.context, context), (self.completed, completed)]
+        buckets = [buckets.get(key, {}) for buckets, key in criteria
+                                        if key is not None]
+        if not buckets:
+            result = self.todos
+        else:
+            buckets.sort(key=len)
+            result = buckets[0]
+            if len(buckets) > 1:
+                result = {tdid: todo for tdid, todo in result.items()
+                          if all(tdid in bucket for bucket in buckets[1:])}
+        if within is None:
+            return list(result.values())
+        return [todo for todo in within
+                if result.get(todo.tags.get('tdid')) is todo]
+
+    def query(self, text, within=None, limit=None):
+        """
+        Full-text search: the To-dos having, for every word of text, a token
+        equal to or starting with it, best matches first (whole tokens rank
+        above prefixes, projects and contexts above text and tags; then
+        not completed first, then by tdid)
+        within : if given, only To-dos of this list are returned
+        limit : if given, at most this many To-dos are returned
+        """
+        terms = query_terms(text)
+        if not terms:
+            return []
+        if self._postings is None:
+            self._build_text_index()
+        expanded = [(term, self._expand(term)) for term in terms]
+        sizes = [sum(len(self._postings[token]) for token in tokens)
+                 for term, tokens in expanded]
+        expanded = [expanded[i] for i in sorted(range(len(terms)),
+                                                key=sizes.__getitem__)]
+        sizes.sort()
+        if not sizes[0]:
+            return []
+        if within is not None and len(within) * CHECK_COST < sizes[0]:
+            #fewer To-dos to search than postings: check their own tokens
+            scores = {}
+            for todo in within:
+                tdid = todo.tags.get('tdid')
+                if self.todos.get(tdid) is todo:
+                    scores[tdid] = 0
+            for term, tokens in expanded:
+                scores = self._check_term(scores, term)
+            return self._rank(scores, limit)
+        allowed = None if within is None else set(map(id, within))
+        if limit is not None:
+            found = self._top(expanded, sizes, limit, allowed)
+            if found is not None:
+                return found
+        #start from the word with the fewest matches, then narrow down
+        scores = self._term_scores(*expanded[0])
+        for (term, tokens), size in zip(expanded[1:], sizes[1:]):
+            if len(scores) * CHECK_COST < size:
+                #fewer To-dos left than postings: check their own tokens
+                scores = self._check_term(scores, term)
+            else:
+                term_scores = self._term_scores(term, tokens)
+                scores = {tdid: score + term_scores[tdid]
+                          for tdid, score in scores.items()
+                          if tdid in term_scores}
+        if allowed is not None:
+            scores = {tdid: score for tdid, score in scores.items()
+                      if id(self.todos[tdid]) in allowed}
+        return self._rank(scores, limit)
@@ -0,0 +1,147 @@
+"""
+Append-only change journal for the list of To-dos.
+
+Instead of re-writing the whole todo_txt.tmp file after every Pomodoro or
+menu visit, each changed To-do is appended to the journal as one small
+record. On start-up the journal is replayed on top of the last full snapshot
+(todo_txt.tmp), and the full list is only written again when the journal is
+compacted: when finishing for the day or when it grows past a size threshold.
+
+journal format: one record per line, "tdid<TAB>todo.txt line"
+                later records for the same tdid replace earlier ones
+                a first line "#journal <token>" identifies the journal: the
+                token is new for each journal (see todopomo_sync)
+
+Records are appended in a single write under the journal's lock (see
+todopomo_lock), so the records of several processes never interleave.
+"""
+import todotxtio as tdt
+import todopomo_lock as locking
+
+import binascii
+import os
+
+HEADER = "#journal {}\n"
+
+def new_header():
+    return HEADER.format(binascii.hexlify(os.urandom(8)).decode())
+
+def append(journal_file, todo):
+    """
+    Append the current state of a To-do (identified by its tdid) to the journal
+    returns: size of the journal
+    """
+    line = "{0}\t{1}\n".format(todo.tags['tdid'], todo)
+    return locking.append(journal_file, line, new_header())
+
+def extend(journal_file, todo_list):
+    """
+    Append the current state of several To-dos in one write
+    returns: size of the journal
+    """
+    lines = "".join("{0}\t{1}\n".format(todo.tags['tdid'], todo)
+                    for todo in todo_list)
+    if lines:
+        return locking.append(journal_file, lines, new_header())
+    return size(journal_file)
+
+def token(journal_file):
+    """
+    Token of the journal (None if there is no journal, or it has no header)
+    """
+    try:
+        with open(journal_file) as fd:
+            first = fd.readline()
+    except OSError:
+        return None
+    if first.startswith(HEADER[:9]) and first.endswith("\n"):
+        return first[9:-1]
+    return None
+
+def read(journal_file):
+    """
+    Read the journal, keeping only the latest record for each tdid
+    returns: dictionary tdid -> todo.txt line (in order of first appearance)
+    """
+    return read_since(journal_file)[0]
+
+def read_since(journal_file, offset=0):
+    """
+    Read the records appended to the journal from a position on
+    returns: dictionary tdid -> todo.txt line as for read(), position after
+             the last complete record
+    """
+    records = {}
+    try:
+        with open(journal_file, "rb") as fd:
+            fd.seek(offset)
+            data = fd.read()
+    except OSError:
+        return records, 0
+    #a partly written last line (e.g. after a crash) has no newline
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].decode("utf-8").splitlines():
+        if "\t" not in line:
+            continue
+        tdid, todo_line = line.split("\t", 1)
+        records[tdid] = todo_line
+    return records, offset + end
+
+def replay(journal_file, todo_list, parse=tdt.from_string):
+    """
+    Apply the journal on top of a list of To-dos (typically the snapshot
+    loaded from todo_txt.tmp). To-dos with a journalled tdid are replaced in
+    place, To-dos only found in the journal are appended.
+    parse : function parsing todo.txt lines into a list of To-dos
+    returns: updated list, number of records applied
+    """
+    records = read(journal_file)
+    if not records:
+        return todo_list, 0
+    positions = {todo.tags['tdid']: i for i, todo in enumerate(todo_list)
+                                      if 'tdid' in todo.tags}
+    for tdid, todo_line in records.items():
+        todo = parse(todo_line)[0]
+        if tdid in positions:
+            todo_list[positions[tdid]] = todo
+        else:
+            todo_list.append(todo)
+    return todo_list, len(records)
+
+def size(journal_file):
+    """
+    Size of the journal in bytes (0 if there is none)
+    """
+    try:
+        return os.path.getsize(journal_file)
+    except OSError:
+        return 0
+
+def compact(journal_file, snapshot_file, todo_list):
+    """
+    Write the full list to the snapshot file, then empty the journal
+    todo_list : To-dos, or their todo.txt lines
+    The snapshot is written to a temporary file first, so that other
+    processes never read it half written.
+    """
+    tmp_file = snapshot_file + ".new"
+    tdt.to_file(tmp_file, todo_list)
+    os.replace(tmp_file, snapshot_file)
+    clear(journal_file)
+
+def compact_if_needed(journal_file, snapshot_file, todo_list, max_bytes):
+    """
+    Compact the journal only once it has grown past max_bytes
+    returns: True if the snapshot was re-written
+    """
+    if size(journal_file) > max_bytes:
+        compact(journal_file, snapshot_file, todo_list)
+        return True
+    return False
+
+def clear(journal_file):
+    """
+    Remove the journal (its content is contained in the snapshot)
+    """
+    if os.path.isfile(journal_file):
+        os.remove(journal_file)
@@ -0,0 +1,148 @@
+"""
+Advisory file locks between the processes sharing a user's files (two
+command line sessions, the server and a session...).
+
+lock(path) is the lock of a file, taken with `with`. It is a flock() on a
+separate lock file (path + '.lock'), so that the file itself can be
+replaced (os.replace) while locked, and it is released by the OS if the
+process dies. It is re-entrant, and also excludes the other threads of the
+process. Without fcntl (Windows) only the threads are excluded.
+
+Locks are meant to be held briefly: only around the reads and writes of
+the file, never while waiting for the user. Each lock counts how often it
+was taken, how often it had to wait (contention) and the time spent
+waiting and holding it - see report(), and the lock_* counters of
+todopomo_metrics.
+
+append() appends to a file in a single write, under its lock, so that the
+appends of several processes never interleave.
+"""
+import todopomo_metrics as metrics
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    has_fcntl = False
+else:
+    has_fcntl = True
+
+LOCK_SUFFIX = '.lock'
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+class FileLock(object):
+    """
+    Re-entrant, exclusive lock of a file (see module docstring)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._acquired_at = None
+        self.acquired = 0
+        self.contended = 0
+        self.waited = 0.   #seconds
+        self.held = 0.     #seconds
+        self.max_held = 0. #seconds
+
+    def __enter__(self):
+        start = time.perf_counter()
+        contended = not self._thread_lock.acquire(blocking=False)
+        if contended:
+            self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth > 1:
+            return self
+        try:
+            if has_fcntl:
+                if self._fd is None:
+                    self._fd = os.open(self.path + LOCK_SUFFIX,
+                                       os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    contended = True
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._depth -= 1
+            self._thread_lock.release()
+            raise
+        self._acquired_at = time.perf_counter()
+        waited = self._acquired_at - start
+        self.acquired += 1
+        self.waited += waited
+        metrics.count('lock_acquired')
+        if contended:
+            self.contended += 1
+            metrics.count('lock_contended')
+            metrics.count('lock_contended:' + self.name)
+            metrics.count('lock_wait_seconds', waited)
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            held = time.perf_counter() - self._acquired_at
+            self.held += held
+            self.max_held = max(self.max_held, held)
+            metrics.count('lock_held_seconds', held)
+            if has_fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+        return False
+
+def lock(path):
+    """
+    The lock of a file - the same object for all users of the file in this
+    process (two flock()s of one process on the same file would wait for
+    each other)
+    """
+    try:
+        return _locks[path]
+    except KeyError:
+        with _locks_lock:
+            return _locks.setdefault(path, FileLock(path))
+
+def report():
+    """
+    Use of the locks taken so far
+    returns: dictionary file -> {'acquired', 'contended', 'waited', 'held',
+             'max_held'} (times in seconds)
+    """
+    return {path: {'acquired': l.acquired, 'contended': l.contended,
+                   'waited': round(l.waited, 6), 'held': round(l.held, 6),
+                   'max_held': round(l.max_held, 6)}
+            for path, l in list(_locks.items())}
+
+def write_all(fd, data):
+    """
+    Write bytes to a file descriptor (os.write may write only part of them)
+    """
+    while data:
+        data = data[os.write(fd, data):]
+
+def append(path, data, header=''):
+    """
+    Append data (str or bytes) to a file in a single write, under its lock
+    header : written first if the file is new or empty
+    returns: size of the file after the append
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with lock(path):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if header and os.fstat(fd).st_size == 0:
+                data = header.encode('utf-8') + data
+            write_all(fd, data)
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
@@ -0,0 +1,251 @@
+"""
+Writing (and reading back) the log of Pomodoros and breaks.
+
+PomoLogWriter keeps todopomo_log.txt open and batches records, rather than
+opening and closing the file for every Pomodoro and break. Next to the CSV
+log it maintains a binary sidecar of fixed-width records which analysis can
+memory-map instead of re-parsing the CSV:
+
+todopomo_log.bin: one RECORD per Pomodoro/break - tdid index, start and stop
+                  (epoch seconds), duration (seconds), endpoint offset
+todopomo_log.tdids: one tdid per line, the tdid index is the line number
+todopomo_log.endpoints: endpoints, one per line, the offset is the position
+                        (in bytes) of the start of the line
+
+To build the sidecar from an existing CSV log:
+    python todopomo_log.py [todopomo_log.txt]
+"""
+import todopomo_lock as locking
+
+import csv
+from datetime import datetime
+import mmap
+import os
+import struct
+import sys
+
+LOG_HEADER = "To-Do ID (tdid),start,end,duration,endpoint\n"
+#endpoint of the Pomodoros stopped early (logged without time worked)
+INTERRUPTED = 'interrupted'
+#little-endian, no padding: uint32, int64, int64, float64, uint64
+RECORD = struct.Struct('<IqqdQ')
+APPEND = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+
+def format_line(start, stop, duration, tdid='break', todo_endpoint=''):
+    """
+    Format one Pomodoro or break as a line of the CSV log
+    """
+    start = start.isoformat(timespec='minutes')
+    stop = stop.isoformat(timespec='minutes')
+    line = "{0},{1},{2},{3},\"{4}\"\n".format(tdid, start, stop,
+                                                    duration, todo_endpoint)
+                           #escaped {4} so that commas don't mess up csv
+    return line
+
+def sidecar_paths(log_file):
+    """
+    Names of the binary sidecar files belonging to a CSV log
+    returns: records file, tdid table, endpoint strings
+    """
+    base = os.path.splitext(log_file)[0]
+    return base + '.bin', base + '.tdids', base + '.endpoints'
+
+def read_tdids(tdids_file):
+    """
+    Read the tdid table of a sidecar, as a list (index -> tdid)
+    """
+    if not os.path.isfile(tdids_file):
+        return []
+    with open(tdids_file) as fd:
+        return fd.read().splitlines()
+
+class PomoLogWriter(object):
+    """
+    Appends Pomodoros and breaks to the CSV log and its binary sidecar.
+    Files are opened on the first write and kept open until close().
+    flush_every : number of records buffered before they are written out
+    fsync : also fsync the files on every flush, so records survive a crash
+    binary : maintain the binary sidecar
+    Records are written under the lock of the log (see todopomo_lock), with
+    one write per file, so several processes can log to the same files: the
+    sidecar indexes are only computed then, from the files as they are.
+    """
+
+    def __init__(self, log_file, flush_every=1, fsync=False, binary=True):
+        self.log_file = log_file
+        self.flush_every = max(1, flush_every)
+        self.fsync = fsync
+        self.binary = binary
+        self._buffer = []
+        self._files = None
+
+    def _open(self):
+        with locking.lock(self.log_file):
+            self._files = [os.open(self.log_file, APPEND, 0o644)]
+            self._inode = os.fstat(self._files[0]).st_ino
+            if self.binary:
+                bin_file, tdids_file, endpoints_file = \
+                                                  sidecar_paths(self.log_file)
+                #existing CSV log without sidecar: build the sidecar first
+                if not os.path.isfile(bin_file):
+                    convert(self.log_file)
+                self._files += [os.open(path, APPEND, 0o644) for path in
+                                (bin_file, tdids_file, endpoints_file)]
+                self._tdids_size = None
+
+    def _sync_sidecar(self):
+        """
+        Catch up with the tdids and endpoints other processes added
+        """
+        tdids_size = os.fstat(self._files[2]).st_size
+        if tdids_size != self._tdids_size:
+            self._tdids = {tdid: i for i, tdid in enumerate(
+                           read_tdids(sidecar_paths(self.log_file)[1]))}
+            self._tdids_size = tdids_size
+        self._endpoints_size = os.fstat(self._files[3]).st_size
+
+    def write(self, start, stop, duration, tdid='break', todo_endpoint=''):
+        """
+        Add one Pomodoro or break to the log, writing it out according to
+        the flush policy
+        """
+        self._buffer.append((start, stop, duration, tdid, todo_endpoint))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write out all buffered records
+        """
+        if not self._buffer:
+            return
+        if self._files is None:
+            self._open()
+        with locking.lock(self.log_file):
+            #the log was replaced (rotated, see todopomo_segments): re-open
+            try:
+                replaced = os.stat(self.log_file).st_ino != self._inode
+            except OSError:
+                replaced = True
+            if replaced:
+                for fd in self._files:
+                    os.close(fd)
+                self._open()
+            lines = ''.join(format_line(*record) for record in self._buffer)
+            #file is new (or empty): start with the header
+            if os.fstat(self._files[0]).st_size == 0:
+                lines = LOG_HEADER + lines
+            locking.write_all(self._files[0], lines.encode())
+            if self.binary:
+                self._sync_sidecar()
+                new_tdids, endpoints, records = [], [], []
+                for start, stop, duration, tdid, todo_endpoint in self._buffer:
+                    if tdid not in self._tdids:
+                        self._tdids[tdid] = len(self._tdids)
+                        new_tdids.append(tdid + '\n')
+                    endpoint = (str(todo_endpoint) + '\n').encode()
+                    records.append(RECORD.pack(self._tdids[tdid],
+                                               int(start.timestamp()),
+                                               int(stop.timestamp()),
+                                               float(duration),
+                                               self._endpoints_size))
+                    self._endpoints_size += len(endpoint)
+                    endpoints.append(endpoint)
+                #tdids and endpoints first, records refer to them
+                locking.write_all(self._files[2], ''.join(new_tdids).encode())
+                locking.write_all(self._files[3], b''.join(endpoints))
+                locking.write_all(self._files[1], b''.join(records))
+                self._tdids_size = os.fstat(self._files[2]).st_size
+            self._buffer = []
+            if self.fsync:
+                for fd in self._files:
+                    os.fsync(fd)
+
+    def close(self):
+        """
+        Flush and close the log files (they are re-opened by the next write)
+        """
+        self.flush()
+        if self._files is None:
+            return
+        for fd in self._files:
+            os.close(fd)
+        self._files = None
+
+def record_of(row):
+    """
+    Record of a row of the CSV log (None if it isn't one)
+    returns: tdid, start, stop (datetime), duration (float), endpoint
+    """
+    if len(row) < 5:
+        return None
+    return (row[0], datetime.fromisoformat(row[1]),
+            datetime.fromisoformat(row[2]), float(row[3]), row[4])
+
+def iter_csv(log_file):
+    """
+    Iterate over the records of the CSV log (of the current month only, once
+    it was rotated: see todopomo_segments.iter_log for the whole log)
+    yields: tdid, start, stop (datetime), duration (float), endpoint
+    """
+    with open(log_file, newline='') as fd:
+        reader = csv.reader(fd)
+        next(reader, None) #header
+        for row in reader:
+            record = record_of(row)
+            if record is not None:
+                yield record
+
+def iter_binary(log_file):
+    """
+    Iterate over the records of the binary sidecar, using mmap
+    yields: tdid, start, stop (epoch seconds), duration, endpoint
+    """
+    bin_file, tdids_file, endpoints_file = sidecar_paths(log_file)
+    tdids = read_tdids(tdids_file)
+    if not os.path.isfile(bin_file) or not os.path.getsize(bin_file):
+        return
+    with open(bin_file, 'rb') as fd, open(endpoints_file, 'rb') as fe:
+        records = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        endpoints = mmap.mmap(fe.fileno(), 0, access=mmap.ACCESS_READ) \
+                    if os.path.getsize(endpoints_file) else b''
+        #ignore an incomplete last record
+        end = len(records) - len(records) % RECORD.size
+        for tdid_index, start, stop, duration, offset in \
+                        RECORD.iter_unpack(records[:end]):
+            endpoint = endpoints[offset:endpoints.find(b'\n', offset)]
+            yield (tdids[tdid_index], start, stop, duration,
+                   endpoint.decode())
+
+def convert(log_file, records=None, append=False):
+    """
+    (Re-)build the binary sidecar from an existing CSV log
+    records : records to write instead of those of the log, as yielded by
+              iter_csv() (eg of its segments, see todopomo_segments)
+    append : add the records to the sidecar rather than re-write it
+    returns: number of records converted
+    """
+    bin_file, tdids_file, endpoints_file = sidecar_paths(log_file)
+    if records is None:
+        records = iter_csv(log_file) if os.path.isfile(log_file) else ()
+    tdids = {}
+    if append:
+        tdids = {tdid: i for i, tdid in enumerate(read_tdids(tdids_file))}
+    mode = 'a' if append else 'w'
+    n = 0
+    with open(bin_file, mode + 'b') as fb, open(tdids_file, mode) as ft, \
+         open(endpoints_file, mode + 'b') as fe:
+        for tdid, start, stop, duration, endpoint in records:
+            if tdid not in tdids:
+                tdids[tdid] = len(tdids)
+                ft.write(tdid + '\n')
+            fb.write(RECORD.pack(tdids[tdid], int(start.timestamp()),
+                                 int(stop.timestamp()), duration, fe.tell()))
+            fe.write((endpoint + '\n').encode())
+            n += 1
+    return n
+
+if __name__ == "__main__":
+    log = sys.argv[1] if len(sys.argv) > 1 else 'todopomo_log.txt'
+    print("Converted {} records from {} to {}".format(convert(log), log,
+                                                      sidecar_paths(log)[0]))
@@ -0,0 +1,170 @@
+"""
+Opt-in instrumentation of the hot paths: timing spans, counters, and an
+optional cProfile / tracemalloc capture, written as structured events (one
+json object per line) to TRACE_FILE when the session ends.
+
+Off unless the TODOPOMO_TRACE environment variable is set to a
+comma-separated list of (other values, eg 0, off or false, are ignored):
+    on      : spans and counters
+    profile : also run cProfile over the session (stats saved next to
+              TRACE_FILE, the slowest functions written as an event)
+    memory  : also trace allocations with tracemalloc (peak and top
+              allocation sites written as an event)
+e.g. TODOPOMO_TRACE=on,memory python todopomo.py
+TODOPOMO_TRACE_FILE overrides the file the events are appended to.
+
+When off, timed() returns functions unchanged and span() a shared no-op
+context, so the instrumented code runs as if it weren't.
+"""
+import atexit
+import contextlib
+from datetime import datetime
+import functools
+import io
+import json
+import os
+import time
+
+ENV_VAR = 'TODOPOMO_TRACE'
+TRACE_FILE = os.environ.get('TODOPOMO_TRACE_FILE', 'todopomo_trace.jsonl')
+TOP = 20 #number of functions / allocation sites reported
+MODES = {'on', 'profile', 'memory'}
+
+modes = {mode.strip().lower() for mode in os.environ.get(ENV_VAR, '')
+                                                 .split(',')} & MODES
+enabled = bool(modes)
+
+_events = []
+_counters = {}
+_t0 = time.perf_counter()
+_session = datetime.now().isoformat(timespec='seconds')
+_profiler = None
+_started = False
+_null_span = contextlib.nullcontext()
+
+def span(name):
+    """
+    Context manager timing a phase, recorded as a 'span' event
+    """
+    if not enabled:
+        return _null_span
+    return _span(name)
+
+@contextlib.contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stop = time.perf_counter()
+        _events.append({'event': 'span', 'name': name,
+                        'at': round(start - _t0, 6),
+                        'seconds': round(stop - start, 6)})
+
+def timed(name=None):
+    """
+    Decorator recording each call of a function as a span (named after the
+    function by default)
+    """
+    def decorate(f):
+        if not enabled:
+            return f
+        span_name = name or f.__name__
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with _span(span_name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """
+    Add n to a counter
+    """
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+def count_bytes(name, path):
+    """
+    Add the size of a file just written to a counter
+    """
+    if enabled and os.path.isfile(path):
+        count(name, os.path.getsize(path))
+
+def start():
+    """
+    Start the capture modes (cProfile, tracemalloc) asked for, and write
+    the events at exit - called once at the start of the session
+    """
+    global _profiler, _started
+    if not enabled or _started:
+        return
+    _started = True
+    if 'memory' in modes:
+        import tracemalloc
+        tracemalloc.start()
+    if 'profile' in modes:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(finish)
+
+def summary():
+    """
+    Aggregate of the spans recorded so far
+    returns: dictionary name -> {'calls', 'seconds', 'max'}
+    """
+    spans = {}
+    for event in _events:
+        if event['event'] != 'span':
+            continue
+        s = spans.setdefault(event['name'], {'calls': 0, 'seconds': 0.,
+                                             'max': 0.})
+        s['calls'] += 1
+        s['seconds'] += event['seconds']
+        s['max'] = max(s['max'], event['seconds'])
+    for s in spans.values():
+        s['seconds'] = round(s['seconds'], 6)
+    return spans
+
+def profile_event():
+    _profiler.disable()
+    import pstats
+    _profiler.dump_stats(os.path.splitext(TRACE_FILE)[0] + '.prof')
+    stats = pstats.Stats(_profiler, stream=io.StringIO())
+    top = sorted(stats.stats.items(), key=lambda item: item[1][3],
+                 reverse=True)[:TOP]
+    return {'event': 'profile',
+            'top': [{'function': '{}:{}({})'.format(*function),
+                     'calls': calls, 'own_seconds': round(own, 6),
+                     'cumulative_seconds': round(cumulative, 6)}
+                    for function, (primitive, calls, own, cumulative, callers)
+                    in top]}
+
+def memory_event():
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics('lineno')[:TOP]
+    tracemalloc.stop()
+    return {'event': 'memory', 'current_bytes': current, 'peak_bytes': peak,
+            'top': [{'where': str(stat.traceback[0]), 'bytes': stat.size,
+                     'blocks': stat.count} for stat in top]}
+
+def finish():
+    """
+    Append the events of the session to TRACE_FILE
+    """
+    if not enabled:
+        return
+    events = list(_events)
+    events.append({'event': 'counters', 'counters': dict(_counters)})
+    events.append({'event': 'summary', 'spans': summary(),
+                   'seconds': round(time.perf_counter() - _t0, 6)})
+    if _profiler is not None:
+        events.append(profile_event())
+    if 'memory' in modes and _started:
+        events.append(memory_event())
+    with open(TRACE_FILE, 'a') as fd:
+        for event in events:
+            event['session'] = _session
+            fd.write(json.dumps(event) + '\n')
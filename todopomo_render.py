@@ -0,0 +1,156 @@
+"""
+Rendering of To-do lists for the terminal.
+
+LineCache: the formatted line of each To-do, kept until the To-do changes
+           (the code changing a To-do calls invalidate(), as for todo_index)
+Screen: lines collected and written to the terminal in one write
+Pager: pages (and filters) a list of To-dos so only the visible page is
+       formatted; the To-dos keep their number in the full list, so the
+       numbers typed to select them don't depend on the page shown
+
+Pager commands (typed instead of a selection):
+    >        next page
+    <        previous page
+    /words   only show the To-dos matching the words, best matches first
+             ('/' alone clears the filter) - with free_text, words can also
+             be typed without the '/'
+The matching To-dos are found with a search function (typically
+TodoIndex.query), or else those whose text, projects and contexts contain
+all the words.
+"""
+import sys
+
+PAGE_SIZE = 40 #To-dos per page
+#answers made only of these are selections (numbers, ranges), not queries
+SELECTION_CHARACTERS = '0123456789,- '
+RULE = 80 * '#'
+
+class LineCache(object):
+    """
+    Formatted line (str(todo)) of each To-do, by To-do
+    """
+
+    def __init__(self):
+        self.lines = {}
+
+    def line(self, todo):
+        try:
+            return self.lines[todo]
+        except KeyError:
+            line = self.lines[todo] = str(todo)
+            return line
+
+    def invalidate(self, todo):
+        """
+        Forget the line of a To-do which has changed
+        """
+        self.lines.pop(todo, None)
+
+    def clear(self):
+        self.lines.clear()
+
+class Screen(object):
+    """
+    Lines of one screen, written to the terminal in one go
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def add(self, *lines):
+        self.lines.extend(lines)
+
+    def write(self):
+        sys.stdout.write('\n'.join(self.lines) + '\n')
+        sys.stdout.flush()
+        self.lines = []
+
+def matches(todo, words):
+    """
+    True if all words (lower case) are in the text, projects or contexts
+    of a To-do
+    """
+    haystack = ' '.join([todo.text or '']
+                        + ['+' + project for project in todo.projects]
+                        + ['@' + context for context in todo.contexts]).lower()
+    return all(word in haystack for word in words)
+
+class Pager(object):
+    """
+    Pages through a list of To-dos, optionally filtered
+    todos : the full list (numbered from 0)
+    search : function(query, within) returning the To-dos of within matching
+             query, best first
+    free_text : take any answer which isn't a selection (numbers, ranges)
+                as a query
+    """
+
+    def __init__(self, todos, search=None, free_text=False,
+                 page_size=PAGE_SIZE):
+        self.todos = todos
+        self.search = search
+        self.free_text = free_text
+        self.page_size = page_size
+        self.page = 0
+        self.query = ''
+        self.positions = range(len(todos)) #numbers of the To-dos shown
+        self._numbers = None #id(todo) -> number, for search results
+
+    def pages(self):
+        return max(1, -(-len(self.positions) // self.page_size))
+
+    def filter(self, query):
+        self.query = query.strip()
+        words = self.query.lower().split()
+        if words and self.search is not None:
+            if self._numbers is None:
+                self._numbers = {id(todo): i
+                                 for i, todo in enumerate(self.todos)}
+            self.positions = [self._numbers[id(todo)] for todo in
+                              self.search(self.query, within=self.todos)]
+        elif words:
+            self.positions = [i for i, todo in enumerate(self.todos)
+                                if matches(todo, words)]
+        else:
+            self.positions = range(len(self.todos))
+        self.page = 0
+
+    def command(self, answer):
+        """
+        Carry out a pager command (see module docstring)
+        returns: True if answer was a command
+        """
+        answer = answer.strip()
+        if answer == '>':
+            self.page = min(self.page + 1, self.pages() - 1)
+        elif answer == '<':
+            self.page = max(self.page - 1, 0)
+        elif answer.startswith('/'):
+            self.filter(answer[1:])
+        elif self.free_text and answer.strip(SELECTION_CHARACTERS):
+            self.filter(answer)
+        else:
+            return False
+        return True
+
+    def visible(self):
+        """
+        returns: list of (number, To-do) on the current page
+        """
+        start = self.page * self.page_size
+        return [(i, self.todos[i])
+                for i in self.positions[start:start + self.page_size]]
+
+    def render(self, screen, cache, template="[{}] - {}"):
+        """
+        Add the current page, and if needed a footer on how to page, to screen
+        """
+        for i, todo in self.visible():
+            screen.add(template.format(i, cache.line(todo)))
+        if self.pages() > 1 or self.query:
+            footer = "page {}/{} of {} To-dos".format(self.page + 1,
+                                              self.pages(), len(self.positions))
+            if self.query:
+                footer += " matching '{}'".format(self.query)
+            screen.add(footer + " - type > (next), < (previous) or"
+                                " /words (search)")
@@ -0,0 +1,202 @@
+"""
+Materialised daily and weekly rollups of the work done, so feedback can
+compare today with earlier days and weeks without reading the log.
+
+todopomo_rollup.json holds one aggregate per day ('2024-01-03') and per ISO
+week ('2024-W01'), each with the totals per project. The rollups in memory
+are updated as Pomodoros are logged and To-dos completed (Rollups.add_pomo
+and Rollups.add_completed); the file only from time to time and at the end
+of a session (Rollups.save), under its lock (see todopomo_lock) and merged
+with what other sessions saved meanwhile. It can be rebuilt from the log
+and the To-do lists at any time:
+    python todopomo_rollup.py [todopomo_log.txt] [todo.txt] [done.txt]
+
+aggregate: pomos, seconds (worked), completed (To-dos), projects (project ->
+           pomos, seconds, completed)
+"""
+import todopomo_lock as locking
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+import todopomo_stats as pomo_stats
+
+from datetime import date, timedelta
+import json
+import os
+import sys
+import time
+
+ROLLUP_FILE = 'todopomo_rollup.json'
+#longest time changes stay unsaved while Pomodoros are logged (seconds)
+SAVE_EVERY = 300
+#bump when the aggregates change shape
+VERSION = 1
+KEYS = ('pomos', 'seconds', 'completed')
+
+def new_aggregate():
+    return {'pomos': 0, 'seconds': 0.0, 'completed': 0, 'projects': {}}
+
+def iso_week(day):
+    """
+    ISO week ('2024-W01') of a day ('2024-01-03')
+    """
+    year, week_number, _ = date.fromisoformat(day).isocalendar()
+    return '{}-W{:02d}'.format(year, week_number)
+
+class Rollups(object):
+    """
+    The rollups of rollup_file, kept in memory. Changes are only marked as
+    pending: save() writes them, added to the rollups as other processes
+    saved them meanwhile; flush() saves at most every SAVE_EVERY seconds.
+    """
+
+    def __init__(self, rollup_file):
+        self.rollup_file = rollup_file
+        self.days, self.weeks = self._read()
+        self._pending = [] #(day, projects, values) added since last save
+        self._saved = time.monotonic()
+
+    def _read(self):
+        try:
+            with open(self.rollup_file) as fd:
+                rollups = json.load(fd)
+        except (OSError, ValueError):
+            return {}, {}
+        if rollups.get('version') != VERSION:
+            return {}, {}
+        return rollups['days'], rollups['weeks']
+
+    def _write(self):
+        tmp_file = self.rollup_file + '.tmp'
+        #json.dumps (unlike json.dump) uses the C encoder
+        data = json.dumps({'version': VERSION, 'days': self.days,
+                           'weeks': self.weeks})
+        with open(tmp_file, 'w') as fd:
+            fd.write(data)
+        os.replace(tmp_file, self.rollup_file)
+
+    @property
+    def dirty(self):
+        return bool(self._pending)
+
+    def save(self):
+        """
+        Write the changes made since the last save, on top of the rollups
+        as saved by other processes meanwhile
+        returns: True if there were changes to write
+        """
+        if not self._pending:
+            return False
+        with locking.lock(self.rollup_file):
+            self.days, self.weeks = self._read()
+            for day, projects, values in self._pending:
+                self._add(day, projects, values)
+            self._write()
+        self._pending = []
+        self._saved = time.monotonic()
+        return True
+
+    def flush(self):
+        """
+        Save the changes if the last save was SAVE_EVERY seconds ago or more
+        """
+        if self._pending and time.monotonic() - self._saved >= SAVE_EVERY:
+            self.save()
+
+    def add(self, day, projects, values):
+        """
+        Add values (dictionary with some of KEYS) to the day, its week and
+        the projects (saved later, see save())
+        """
+        self._add(day, projects, values)
+        self._pending.append((day, projects, values))
+
+    def _add(self, day, projects, values):
+        for aggregate in (self.days.setdefault(day, new_aggregate()),
+                          self.weeks.setdefault(iso_week(day),
+                                                new_aggregate())):
+            for project in projects or ['No project']:
+                totals = aggregate['projects'].setdefault(project,
+                                                   dict.fromkeys(KEYS, 0))
+                for key, value in values.items():
+                    totals[key] += value / len(projects or [None])
+            for key, value in values.items():
+                aggregate[key] += value
+
+    def add_pomo(self, start, duration, projects=()):
+        """
+        Add a Pomodoro (logged at datetime start, lasting duration seconds)
+        """
+        self.add(start.date().isoformat(), list(projects),
+                 {'pomos': pomo_stats.pomo_count(duration),
+                  'seconds': duration})
+
+    def add_completed(self, day, projects=()):
+        """
+        Add a To-do completed on day ('2024-01-03')
+        """
+        self.add(day, list(projects), {'completed': 1})
+
+    def day(self, day):
+        return self.days.get(day.isoformat(), new_aggregate())
+
+    def week(self, day):
+        return self.weeks.get(iso_week(day.isoformat()), new_aggregate())
+
+    def compare(self, today, weeks=4):
+        """
+        Today, yesterday, this and last week, and the weekly average of the
+        `weeks` weeks before this one
+        returns: list of (name, aggregate)
+        """
+        average = new_aggregate()
+        for n in range(1, weeks + 1):
+            week = self.week(today - timedelta(weeks=n))
+            for key in KEYS:
+                average[key] += week[key] / weeks
+        return [('Today', self.day(today)),
+                ('Yesterday', self.day(today - timedelta(days=1))),
+                ('This week', self.week(today)),
+                ('Last week', self.week(today - timedelta(weeks=1))),
+                ('{}-week average'.format(weeks), average)]
+
+def format_aggregate(name, aggregate):
+    return "{:<16} {:>5.0f} pomos {:>8.0f} s worked {:>4.0f} To-dos "\
+           "completed".format(name, aggregate['pomos'], aggregate['seconds'],
+                              aggregate['completed'])
+
+def rebuild(rollup_file, log_file, todo_list):
+    """
+    Regenerate the rollups from the log (Pomodoros) and a list of To-dos
+    (completion dates, projects of the tdids logged)
+    returns: the new Rollups
+    """
+    rollups = Rollups(rollup_file)
+    rollups.days, rollups.weeks = {}, {}
+    projects = {todo.tags['tdid']: todo.projects for todo in todo_list
+                                                 if 'tdid' in todo.tags}
+    for tdid, start, stop, duration, endpoint in segments.iter_log(log_file):
+        #breaks and interrupted Pomodoros (no time worked) not counted
+        if tdid == 'break' or endpoint == pomo_log.INTERRUPTED:
+            continue
+        rollups.add_pomo(start, duration, projects.get(tdid, ()))
+    for todo in todo_list:
+        if todo.completed and todo.completion_date:
+            rollups.add_completed(todo.completion_date, todo.projects)
+    #a complete replacement of the file, not changes to merge into it
+    rollups._pending = []
+    with locking.lock(rollup_file):
+        rollups._write()
+    return rollups
+
+if __name__ == "__main__":
+    import todotxtio as tdt
+    args = sys.argv[1:]
+    log_file = args[0] if args else 'todopomo_log.txt'
+    todo_list = []
+    for todo_file in args[1:] or ['todo.txt', 'done.txt']:
+        if os.path.isfile(todo_file):
+            todo_list += tdt.from_file(todo_file)
+    rollups = rebuild(ROLLUP_FILE, log_file, todo_list)
+    print("Rebuilt {} from {}: {} days, {} weeks".format(ROLLUP_FILE,
+                                  log_file, len(rollups.days),
+                                  len(rollups.weeks)))
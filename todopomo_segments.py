@@ -0,0 +1,312 @@
+"""
+Rotation of the log of Pomodoros and breaks into monthly segments, and
+reading the log back by date range.
+
+todopomo_log.txt only keeps the records of the current month (and later):
+rotate() moves the records of earlier months to one gzip-compressed CSV
+segment per month, next to the log:
+
+todopomo_log.2024-01.txt.gz: the records started in January 2024, with the
+                             header of the log
+todopomo_log.index.json: for each segment, the first and last start of its
+                         records, their number, and for each tdid the
+                         offsets (in the uncompressed segment) of its lines
+todopomo_log.segments.bin, .tdids, .endpoints: binary sidecar of the
+                         records of all the segments, as the log's (see
+                         todopomo_log), which analytics memory-map rather
+                         than decompressing and parsing the segments
+
+iter_log() is the one way to read the whole log back: it goes through the
+segments overlapping the dates asked for (only the lines of a tdid when one
+is given, found with the offsets of the index) then through the log itself,
+and yields the records as todopomo_log.iter_csv() does.
+
+Rotation happens under the lock of the log (see todopomo_lock); writers
+notice the log was replaced and re-open it (see PomoLogWriter).
+
+To rotate a log (and rebuild its index):
+    python todopomo_segments.py [todopomo_log.txt]
+"""
+import todopomo_lock as locking
+import todopomo_log as pomo_log
+
+import csv
+from datetime import date
+import gzip
+import json
+import os
+import re
+import sys
+
+INDEX_VERSION = 1
+SEGMENT = re.compile(r'^\.(\d{4}-\d{2})\.txt\.gz$')
+COMPRESS_LEVEL = 6
+
+def segment_path(log_file, month):
+    return '{}.{}.txt.gz'.format(os.path.splitext(log_file)[0], month)
+
+def index_path(log_file):
+    return os.path.splitext(log_file)[0] + '.index.json'
+
+def sidecar_of(log_file):
+    """
+    Name of the binary sidecar of the segments, for
+    todopomo_log.sidecar_paths()
+    """
+    return os.path.splitext(log_file)[0] + '.segments.txt'
+
+def as_key(day):
+    """
+    Start of the records (as in the log, '2024-01-31T09:15') from a date or
+    datetime, to compare with the start of records
+    """
+    if day is None or isinstance(day, str):
+        return day
+    if hasattr(day, 'hour'):
+        return day.isoformat(timespec='minutes')
+    return day.isoformat()
+
+def start_of(line):
+    """
+    Start of the record of a line of the log (bytes), None for other lines
+    """
+    fields = line.split(b',', 2)
+    if len(fields) < 3:
+        return None
+    return fields[1].decode()
+
+def first_start(log_file):
+    """
+    Start of the first record of the log (None if it has none)
+    """
+    try:
+        with open(log_file, 'rb') as fd:
+            fd.readline() #header
+            return start_of(fd.readline())
+    except OSError:
+        return None
+
+def needs_rotation(log_file, today=None):
+    """
+    True if the log has records of months before the current one
+    """
+    first = first_start(log_file)
+    return first is not None \
+           and first[:7] < (today or date.today()).isoformat()[:7]
+
+def describe(content):
+    """
+    Index entry of a segment
+    content : uncompressed content of the segment (bytes, with header)
+    """
+    entry = {'file': None, 'first': None, 'last': None, 'records': 0,
+             'tdids': {}}
+    offset = content.find(b'\n') + 1
+    for line in content[offset:].splitlines(True):
+        start = start_of(line)
+        if start is not None:
+            if entry['first'] is None or start < entry['first']:
+                entry['first'] = start
+            if entry['last'] is None or start > entry['last']:
+                entry['last'] = start
+            entry['records'] += 1
+            tdid = line[:line.find(b',')].decode()
+            entry['tdids'].setdefault(tdid, []).append(offset)
+        offset += len(line)
+    return entry
+
+def read_segment(path):
+    with gzip.open(path, 'rb') as fd:
+        return fd.read()
+
+def write_segment(path, content):
+    tmp_file = path + '.tmp'
+    with gzip.open(tmp_file, 'wb', compresslevel=COMPRESS_LEVEL) as fd:
+        fd.write(content)
+    os.replace(tmp_file, path)
+
+def load_index(log_file):
+    """
+    The index of the segments of a log, rebuilt if missing or outdated
+    returns: dictionary month -> index entry
+    """
+    try:
+        with open(index_path(log_file)) as fd:
+            index = json.load(fd)
+        if index.get('version') == INDEX_VERSION:
+            return index['segments']
+    except (OSError, ValueError):
+        pass
+    return rebuild_index(log_file)
+
+def save_index(log_file, segments):
+    tmp_file = index_path(log_file) + '.tmp'
+    with open(tmp_file, 'w') as fd:
+        fd.write(json.dumps({'version': INDEX_VERSION, 'segments': segments}))
+    os.replace(tmp_file, index_path(log_file))
+
+def rebuild_index(log_file):
+    """
+    Index the segments found next to a log
+    returns: dictionary month -> index entry
+    """
+    directory = os.path.dirname(os.path.abspath(log_file))
+    prefix = os.path.basename(os.path.splitext(log_file)[0]) + '.'
+    segments = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(prefix):
+            continue
+        match = SEGMENT.match(name[len(prefix) - 1:])
+        if match:
+            month = match.group(1)
+            segments[month] = describe(read_segment(os.path.join(directory,
+                                                                 name)))
+            segments[month]['file'] = name
+    save_index(log_file, segments)
+    return segments
+
+def stale_sidecar(log_file):
+    """
+    True if the sidecar of the segments is missing or older than their index
+    (which is saved whenever segments are written)
+    """
+    bin_file = pomo_log.sidecar_paths(sidecar_of(log_file))[0]
+    return not os.path.isfile(bin_file) \
+           or os.path.getmtime(bin_file) < os.path.getmtime(index_path(log_file))
+
+def segments_sidecar(log_file):
+    """
+    The binary sidecar of the records of all the segments, rebuilt first if
+    stale
+    returns: name for todopomo_log.sidecar_paths()
+    """
+    if not os.path.isfile(index_path(log_file)):
+        load_index(log_file)
+    if stale_sidecar(log_file):
+        with locking.lock(log_file):
+            if stale_sidecar(log_file):
+                pomo_log.convert(sidecar_of(log_file),
+                                 iter_log(log_file, live=False))
+    return sidecar_of(log_file)
+
+def rotate(log_file, today=None):
+    """
+    Move the records of the months before the current one from the log to
+    their segments (added to the segment if there is one already), and
+    index them
+    returns: number of bytes of records removed from the start of the log,
+             None if records were removed elsewhere too (records out of
+             order), 0 if there was nothing to rotate
+    """
+    month = (today or date.today()).isoformat()[:7]
+    with locking.lock(log_file):
+        if not needs_rotation(log_file, today):
+            return 0
+        with open(log_file, 'rb') as fd:
+            data = fd.read()
+        header_end = data.find(b'\n') + 1
+        closed, kept = {}, []
+        removed, scattered = 0, False
+        for line in data[header_end:].splitlines(True):
+            start = start_of(line)
+            #partly written last line, or not a record: stays in the log
+            if not line.endswith(b'\n') or start is None \
+                    or start[:7] >= month:
+                kept.append(line)
+                continue
+            closed.setdefault(start[:7], []).append(line)
+            if kept:
+                scattered = True
+            else:
+                removed += len(line)
+        segments = load_index(log_file)
+        #months after all the segments: only added to their sidecar
+        append = all(closed_month > month for closed_month in closed
+                                          for month in segments) \
+                 and not stale_sidecar(log_file)
+        for closed_month, lines in sorted(closed.items()):
+            path = segment_path(log_file, closed_month)
+            if os.path.isfile(path):
+                content = read_segment(path)
+            else:
+                content = data[:header_end]
+            content += b''.join(lines)
+            write_segment(path, content)
+            segments[closed_month] = describe(content)
+            segments[closed_month]['file'] = os.path.basename(path)
+        save_index(log_file, segments)
+        if append:
+            pomo_log.convert(sidecar_of(log_file),
+                             parse(line.decode('utf-8')
+                                   for closed_month, lines
+                                       in sorted(closed.items())
+                                   for line in lines), append=True)
+        else:
+            pomo_log.convert(sidecar_of(log_file),
+                             iter_log(log_file, live=False))
+        #the log itself, then its binary sidecar, start again from the
+        #current month
+        tmp_file = log_file + '.tmp'
+        with open(tmp_file, 'wb') as fd:
+            fd.write(data[:header_end] + b''.join(kept))
+        os.replace(tmp_file, log_file)
+        pomo_log.convert(log_file)
+    return None if scattered else removed
+
+def parse(lines):
+    """
+    Records of lines of a log (str), as yielded by todopomo_log.iter_csv()
+    """
+    for row in csv.reader(lines):
+        record = pomo_log.record_of(row)
+        if record is not None:
+            yield record
+
+def iter_log(log_file, start=None, end=None, tdid=None, live=True):
+    """
+    Iterate over the records of the log and its segments, oldest first
+    start, end : only records started from start (included) to end
+                 (excluded) - dates, datetimes or strings as in the log
+    tdid : only the Pomodoros of this tdid (or 'break')
+    live : also read the log itself, not only its segments
+    yields: tdid, start, stop (datetime), duration (float), endpoint
+    """
+    start, end = as_key(start), as_key(end)
+    directory = os.path.dirname(log_file)
+    for month, entry in sorted(load_index(log_file).items()):
+        if not entry['records'] \
+                or (start is not None and entry['last'] < start) \
+                or (end is not None and entry['first'] >= end) \
+                or (tdid is not None and tdid not in entry['tdids']):
+            continue
+        content = read_segment(os.path.join(directory, entry['file']))
+        if tdid is None:
+            lines = content.decode('utf-8').splitlines()[1:]
+        else:
+            lines = [content[offset:content.find(b'\n', offset)]
+                     .decode('utf-8') for offset in entry['tdids'][tdid]]
+        for record in _select(parse(lines), start, end, tdid):
+            yield record
+    if not live or not os.path.isfile(log_file):
+        return
+    #the log starts with its oldest record
+    first = first_start(log_file)
+    if first is None or (end is not None and first >= end):
+        return
+    for record in _select(pomo_log.iter_csv(log_file), start, end, tdid):
+        yield record
+
+def _select(records, start, end, tdid):
+    for record in records:
+        if tdid is not None and record[0] != tdid:
+            continue
+        key = record[1].isoformat(timespec='minutes')
+        if (start is None or key >= start) and (end is None or key < end):
+            yield record
+
+if __name__ == "__main__":
+    log = sys.argv[1] if len(sys.argv) > 1 else 'todopomo_log.txt'
+    removed = rotate(log)
+    segments = rebuild_index(log)
+    print("Rotated {}: {} segments, {} records".format(log, len(segments),
+                       sum(entry['records'] for entry in segments.values())))
@@ -0,0 +1,362 @@
+"""
+Server mode: the To-do lists and Pomodoros as a (Flask) web app, eg on a NAS.
+
+Each user has a directory (DATA_DIR/<user>/) with their own todo.txt,
+done.txt and todopomo_log.txt. A user's files are read on their first
+request; the parsed list of To-dos, its index, today's list and the log
+writer are then kept in memory between requests. Requests of different users
+are served concurrently (one thread per request), requests of the same user
+one after the other (one lock per user).
+Changes to To-dos are journalled and compacted into todo_txt.tmp (see
+todopomo_journal), and written to todo.txt when the server stops: the same
+files as the command line version, so that sessions, other servers and
+this one may change the To-dos at once. The changes of other processes are
+applied on the next request of the user (see todopomo_sync).
+The Pomodoro timers of all users run on one asyncio event loop, in a
+background thread (see todopomo_timers). Pomodoros and completed To-dos are
+added to the user's rollups (see todopomo_rollup), like in a session.
+
+endpoints (all returning json):
+GET  /<user>/todos             list of To-dos, filtered by the optional
+                               parameters priority, project, context and
+                               completed (exclude (default), only, include)
+GET  /<user>/today             today's list of To-dos
+POST /<user>/today             select today's To-dos: {"add": [tdid, ...],
+                               "remove": [tdid, ...]}
+GET  /<user>/pomodoro          state of the running Pomodoro
+POST /<user>/pomodoro/start    {"tdid": ..., "endpoint": ..., "minutes": 25,
+                               "rest": 5, "cycles": 1}
+POST /<user>/pomodoro/pause
+POST /<user>/pomodoro/resume
+POST /<user>/pomodoro/stop     {"completed": true/false} - a Pomodoro stopped
+                               before its end is logged as interrupted
+GET  /<user>/stats             stats of the last days, weeks, To-dos, projects
+
+usage: python todopomo_server.py [data directory] [port] [host]
+       (host 127.0.0.1 by default: only this machine can connect. There is
+       no authentication, so only serve other machines, eg with host
+       0.0.0.0, on a trusted network)
+"""
+import todotxtio as tdt
+import todopomo as tp
+import todopomo_archive as archiving
+import todopomo_ids as ids
+import todopomo_index as indexing
+import todopomo_journal as journal
+import todopomo_log as pomo_log
+import todopomo_rollup as rollup
+import todopomo_sorted as sorting
+import todopomo_stats as pomo_stats
+import todopomo_timers as timers
+
+import atexit
+import os
+import re
+import sys
+import threading
+
+try:
+    from flask import Flask, abort, jsonify, request
+except ImportError:
+    has_flask = False
+else:
+    has_flask = True
+
+DATA_DIR = 'users'
+PORT = 5000
+HOST = '127.0.0.1'
+USER_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def todo_to_dict(todo):
+    return {'tdid': todo.tags.get('tdid'),
+            'todo': str(todo),
+            'text': todo.text,
+            'priority': todo.priority,
+            'projects': list(todo.projects),
+            'contexts': list(todo.contexts),
+            'completed': bool(todo.completed),
+            'pomodoros': int(todo.tags.get('Pmd', 0)),
+            'seconds': int(todo.tags.get('Ttotal', 0))}
+
+class UserState(object):
+    """
+    The To-dos and running Pomodoro of one user, kept in memory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = lambda name: os.path.join(directory, name)
+        self.log_file = path(tp.LOG_FILE)
+        self.stats_cache = path(tp.STATS_CACHE)
+        self.lock = threading.Lock()
+        self.store = tp.open_todo_store(directory)
+        with self.store.lock():
+            todo_list = []
+            #the changes of a session still running (or which crashed) are
+            #journalled against todo_txt.tmp
+            for todo_file in (self.store.snapshot_file, self.store.todo_file):
+                if os.path.isfile(todo_file):
+                    todo_list = tdt.from_file(todo_file)
+                    break
+            todo_list, replayed = journal.replay(self.store.journal_file,
+                                                 todo_list)
+            self.archive = archiving.Archive(path(tp.DONE_TXT))
+            todo_list, archived = self.archive.archive(todo_list,
+                                                       tp.ARCHIVE_AFTER_DAYS)
+            self.allocator = ids.TdidAllocator(path(tp.IDS_STATE))
+            repaired = self.allocator.repair(todo_list)
+            tagged = self.allocator.tag(todo_list)
+            self.index = indexing.TodoIndex(todo_list)
+            self.todos = sorting.SortedTodoList(todo_list)
+            self.today = sorting.SortedTodoList(todo for todo in todo_list
+                                                if not todo.completed
+                                                and todo.priority != 'F')
+            if replayed or archived or repaired or tagged:
+                journal.compact(self.store.journal_file,
+                                self.store.snapshot_file, self.todos)
+            self.store.reset(self.todos)
+        self.log = pomo_log.PomoLogWriter(self.log_file, tp.LOG_FLUSH_EVERY,
+                                          tp.LOG_FSYNC)
+        self.rollups = rollup.Rollups(path(tp.ROLLUP_FILE))
+        if not self.rollups.days and os.path.isfile(self.log_file):
+            self.log.flush()
+            self.rollups = rollup.rebuild(path(tp.ROLLUP_FILE), self.log_file,
+                                          list(self.todos)
+                                          + self.archive.todos())
+        tp.rotate_log(self.log_file, self.stats_cache, self.log)
+
+    def get(self, tdid):
+        todo = self.index.get(tdid)
+        if todo is None:
+            abort(404, 'no To-do with tdid {}'.format(tdid))
+        return todo
+
+    def changed(self, todo):
+        """
+        Journal, re-index and re-sort a changed To-do (merged first with the
+        changes other processes saved to it)
+        """
+        self.store.save([todo])
+        self.index.update(todo)
+        self.todos.reposition(todo)
+        if todo in self.today:
+            self.today.reposition(todo)
+        self.store.compact(self.todos, tp.JOURNAL_MAX_BYTES)
+
+    def sync(self):
+        """
+        Apply the changes other processes saved since the last request
+        """
+        changes, merged = self.store.take()
+        for todo in merged:
+            self.todos.reposition(todo)
+            if todo in self.today:
+                self.today.reposition(todo)
+        for tdid, todo in changes:
+            previous = self.index.get(tdid)
+            today = previous is not None and previous in self.today
+            if previous is not None:
+                self.todos.discard(previous)
+                self.today.discard(previous)
+                self.index.remove(previous)
+            if todo is not None:
+                self.allocator.register(tdid)
+                self.index.add(todo)
+                self.todos.add(todo)
+                if today and not todo.completed:
+                    self.today.add(todo)
+
+    def on_phase(self, session, phase, start, stop, duration):
+        """
+        Log a finished Pomodoro phase and count it on the To-do and in the
+        rollups (called on the timers' thread)
+        """
+        with self.lock:
+            if phase == timers.BREAK:
+                self.log.write(start, stop, duration)
+            elif phase == timers.INTERRUPTED:
+                self.log.write(start, stop, 0, session.tdid,
+                               pomo_log.INTERRUPTED)
+            else:
+                self.log.write(start, stop, duration, session.tdid,
+                               session.endpoint)
+                todo = self.index.get(session.tdid)
+                self.rollups.add_pomo(start, duration,
+                                      todo.projects if todo else ())
+                self.rollups.flush()
+                if todo is not None and tp.set_todo_state(todo, 'N',
+                                  pomo_stats.pomo_count(duration), duration):
+                    self.changed(todo)
+
+    def close(self):
+        """
+        Save the files, like at the end of a session: todo.txt written with
+        the changes of other processes applied, todo_txt.tmp and the journal
+        removed
+        """
+        self.log.close()
+        self.rollups.save()
+        with self.store.lock():
+            self.sync()
+            self.store.finish(self.todos)
+
+class Users(object):
+    """
+    The states of all users, created on their first request
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def get(self, user):
+        if not USER_NAME.match(user):
+            abort(404, 'unknown user')
+        state = self.states.get(user)
+        if state is None:
+            #only one thread loads the files of a new user
+            with self.lock:
+                state = self.states.get(user)
+                if state is None:
+                    state = UserState(os.path.join(self.data_dir, user))
+                    self.states[user] = state
+        with state.lock:
+            state.sync()
+        return state
+
+    def close(self):
+        with self.lock:
+            for state in self.states.values():
+                with state.lock:
+                    state.close()
+
+def create_app(data_dir=DATA_DIR):
+    """
+    Create the Flask app serving the users of data_dir
+    """
+    if not has_flask:
+        raise ImportError("server mode needs Flask (pip install flask)")
+    app = Flask(__name__)
+    users = Users(data_dir)
+    scheduler = timers.PomoScheduler()
+    scheduler.run_in_thread()
+    app.config['USERS'] = users
+    app.config['SCHEDULER'] = scheduler
+
+    def close():
+        """
+        Stop the timers, then save the files of all users
+        """
+        scheduler.shutdown()
+        users.close()
+    app.config['CLOSE'] = close
+
+    #NB the scheduler calls UserState.on_phase, which takes the user's lock:
+    #never wait for the scheduler while holding a user's lock
+
+    @app.route('/<user>/todos')
+    def todos(user):
+        state = users.get(user)
+        completed = {'exclude': False, 'only': True, 'include': None}.get(
+                     request.args.get('completed', 'exclude'), False)
+        with state.lock:
+            todo_list = state.index.search(
+                            priority=request.args.get('priority'),
+                            project=request.args.get('project'),
+                            context=request.args.get('context'),
+                            completed=completed, within=state.todos)
+            if request.args.get('completed') in ('only', 'include'):
+                todo_list = todo_list + state.archive.todos()
+            return jsonify([todo_to_dict(todo) for todo in todo_list])
+
+    @app.route('/<user>/today', methods=['GET', 'POST'])
+    def today(user):
+        state = users.get(user)
+        with state.lock:
+            if request.method == 'POST':
+                data = request.get_json(force=True, silent=True) or {}
+                for tdid in data.get('add', []):
+                    todo = state.get(tdid)
+                    if todo not in state.today:
+                        state.today.add(todo)
+                for tdid in data.get('remove', []):
+                    state.today.discard(state.get(tdid))
+            return jsonify([todo_to_dict(todo) for todo in state.today])
+
+    @app.route('/<user>/pomodoro')
+    def pomodoro(user):
+        users.get(user)
+        return jsonify(scheduler.submit(scheduler.status, user))
+
+    @app.route('/<user>/pomodoro/start', methods=['POST'])
+    def pomodoro_start(user):
+        state = users.get(user)
+        data = request.get_json(force=True, silent=True) or {}
+        with state.lock:
+            todo = state.get(data.get('tdid'))
+        try:
+            scheduler.submit(scheduler.start, user, todo.tags['tdid'],
+                             work=float(data.get('minutes', 25)) * 60,
+                             rest=float(data.get('rest', 5)) * 60,
+                             cycles=int(data.get('cycles', 1)),
+                             endpoint=data.get('endpoint', 'Not specified'),
+                             on_phase=state.on_phase)
+        except ValueError as e:
+            abort(409, str(e))
+        return jsonify(scheduler.submit(scheduler.status, user))
+
+    @app.route('/<user>/pomodoro/<action>', methods=['POST'])
+    def pomodoro_pause_resume(user, action):
+        users.get(user)
+        if action not in ('pause', 'resume'):
+            abort(404)
+        if scheduler.submit(scheduler.get, user) is None:
+            abort(409, 'no Pomodoro is running')
+        method = scheduler.pause if action == 'pause' else scheduler.resume
+        scheduler.submit(method, user)
+        return jsonify(scheduler.submit(scheduler.status, user))
+
+    @app.route('/<user>/pomodoro/stop', methods=['POST'])
+    def pomodoro_stop(user):
+        state = users.get(user)
+        data = request.get_json(force=True, silent=True) or {}
+        session = scheduler.submit(scheduler.stop, user)
+        if session is None:
+            abort(409, 'no Pomodoro is running')
+        with state.lock:
+            todo = state.get(session.tdid)
+            was_completed = todo.completed
+            if data.get('completed') and tp.set_todo_state(todo, 'Y', 0, 0):
+                if not was_completed:
+                    state.rollups.add_completed(todo.completion_date,
+                                                todo.projects)
+                state.changed(todo)
+            if todo.completed:
+                state.today.discard(todo)
+            return jsonify({'todo': todo_to_dict(todo),
+                            'pomodoros': session.pomos,
+                            'worked': session.worked})
+
+    @app.route('/<user>/stats')
+    def stats(user):
+        state = users.get(user)
+        last = request.args.get('last', 7, type=int)
+        with state.lock:
+            #the server may run into a new month
+            tp.rotate_log(state.log_file, state.stats_cache, state.log)
+            state.log.flush()
+            aggregates = pomo_stats.update(state.log_file, state.stats_cache)
+            todo_list = list(state.todos) + state.archive.todos()
+            return jsonify(pomo_stats.summary(aggregates, todo_list, last))
+
+    return app
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    host = sys.argv[3] if len(sys.argv) > 3 else HOST
+    app = create_app(data_dir)
+    atexit.register(app.config['CLOSE'])
+    app.run(host=host, port=port, threaded=True)
@@ -0,0 +1,114 @@
+"""
+Sorted list of To-dos, kept in the order of sort_todo_list() as To-dos are
+added, removed or changed, instead of re-sorting the whole list.
+
+order: completion state (completed last), priority (routine, A, B, etc),
+       tdid (ie oldest first) - To-dos which are equal on all three keep the
+       order in which they were added
+
+Building a list and refresh() are timed as the 'sort' and 'sort_refresh'
+spans of todopomo_metrics; the To-dos moved are counted as
+'sort_repositions'.
+"""
+import todopomo_metrics as metrics
+
+import bisect
+import itertools
+
+def sort_key(todo):
+    """
+    Composite key of the three sorts done by sort_todo_list()
+    """
+    #need to provide default since priority is optional
+    priority = '0' if todo.priority == 'R' \
+                   else (todo.priority if todo.priority else '')
+    return (todo.completed, priority, todo.tags['tdid'])
+
+class SortedTodoList(object):
+    """
+    List of To-dos which stays sorted. Finding the place of a To-do is a
+    binary search on its key; reposition() must be called after a To-do's
+    priority, completion or tdid was changed.
+    Supports iteration, len(), indexing and `in` like a list.
+    """
+
+    @metrics.timed('sort')
+    def __init__(self, todo_list=()):
+        self._order = itertools.count()
+        todos = list(todo_list)
+        keys = [sort_key(todo) + (next(self._order),) for todo in todos]
+        order = sorted(range(len(todos)), key=keys.__getitem__)
+        self._todos = [todos[i] for i in order]
+        self._keys = [keys[i] for i in order]
+        self._key_of = {id(todo): key for todo, key in zip(todos, keys)}
+        metrics.count('sorted_todos', len(todos))
+
+    def __len__(self):
+        return len(self._todos)
+
+    def __iter__(self):
+        return iter(self._todos)
+
+    def __getitem__(self, i):
+        return self._todos[i]
+
+    def __contains__(self, todo):
+        return id(todo) in self._key_of
+
+    def __repr__(self):
+        return 'SortedTodoList({!r})'.format(self._todos)
+
+    def index(self, todo):
+        """
+        Position of a To-do in the list
+        """
+        if id(todo) not in self._key_of:
+            raise ValueError('{!r} is not in list'.format(todo))
+        return bisect.bisect_left(self._keys, self._key_of[id(todo)])
+
+    def add(self, todo):
+        """
+        Insert a To-do at its place in the order
+        """
+        key = sort_key(todo) + (next(self._order),)
+        i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._todos.insert(i, todo)
+        self._key_of[id(todo)] = key
+
+    append = add
+
+    def extend(self, todo_list):
+        for todo in todo_list:
+            self.add(todo)
+
+    def remove(self, todo):
+        i = self.index(todo)
+        del self._keys[i]
+        del self._todos[i]
+        del self._key_of[id(todo)]
+
+    def discard(self, todo):
+        if todo in self:
+            self.remove(todo)
+
+    def reposition(self, todo):
+        """
+        Move a changed To-do to its new place (if it has moved at all)
+        """
+        if self._key_of[id(todo)][:-1] == sort_key(todo):
+            return
+        self.remove(todo)
+        self.add(todo)
+        metrics.count('sort_repositions')
+
+    @metrics.timed('sort_refresh')
+    def refresh(self):
+        """
+        Reposition all To-dos which were changed without calling
+        reposition(), eg by a function which only got a plain list
+        """
+        changed = [todo for todo, key in zip(self._todos, self._keys)
+                        if key[:-1] != sort_key(todo)]
+        for todo in changed:
+            self.reposition(todo)
@@ -0,0 +1,230 @@
+"""
+Stats over the log of Pomodoros and breaks (todopomo_log.txt).
+
+The log is read as a stream, one line at a time, and only the aggregates are
+kept: per day, per ISO week and per tdid (per project is derived from the
+tdids when the stats are shown, as projects of a To-do can change).
+The aggregates are cached together with the byte offset up to which the log
+was read, so later calls only parse the lines appended since. When the log
+is rotated (see todopomo_segments) the offset is moved back by the bytes
+moved out of the log (rebase()); aggregates started from scratch first go
+through the segments of past months.
+
+aggregate: pomos, seconds (worked), breaks, break_seconds, interruptions
+"""
+import todopomo_log as pomo_log
+import todopomo_segments as segments
+
+from datetime import date
+import os
+import pickle
+
+#bump when the cached aggregates change shape
+CACHE_VERSION = 2
+#bytes at the start of the log used to recognise it (eg after it was replaced)
+HEAD_BYTES = 256
+
+def new_aggregate():
+    return {'pomos': 0, 'seconds': 0.0, 'breaks': 0, 'break_seconds': 0.0,
+            'interruptions': 0}
+
+def new_stats():
+    return {'version': CACHE_VERSION, 'offset': 0, 'head': b'',
+            'last_tdid': None, 'days': {}, 'weeks': {}, 'tdids': {},
+            'day_weeks': {}}
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as fd:
+            stats = pickle.load(fd)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return new_stats()
+    if stats.get('version') != CACHE_VERSION:
+        return new_stats()
+    return stats
+
+def save_cache(cache_file, stats):
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as fd:
+        pickle.dump(stats, fd, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+def pomo_count(duration):
+    """
+    Number of Pomodoros a logged work period counts for (50 minutes count
+    double, as in run_pomo)
+    """
+    return max(1, int(round(duration / 1500.)))
+
+def week_of(day, stats):
+    """
+    ISO week ('2024-W01') of a day ('2024-01-03'), memoised in the stats
+    """
+    week = stats['day_weeks'].get(day)
+    if week is None:
+        year, week_number, _ = date.fromisoformat(day).isocalendar()
+        week = '{}-W{:02d}'.format(year, week_number)
+        stats['day_weeks'][day] = week
+    return week
+
+def add_record(stats, tdid, start, duration, endpoint):
+    """
+    Add one line of the log to the aggregates
+    Breaks are also attributed to the tdid worked on before them.
+    """
+    day = start[:10]
+    if tdid == 'break':
+        tdid = stats['last_tdid']
+        keys = ['breaks', 'break_seconds']
+        values = [1, duration]
+    elif endpoint == pomo_log.INTERRUPTED:
+        keys, values = ['interruptions'], [1]
+    else:
+        stats['last_tdid'] = tdid
+        keys = ['pomos', 'seconds']
+        values = [pomo_count(duration), duration]
+    buckets = [stats['days'].setdefault(day, new_aggregate()),
+               stats['weeks'].setdefault(week_of(day, stats), new_aggregate())]
+    if tdid is not None:
+        buckets.append(stats['tdids'].setdefault(tdid, new_aggregate()))
+    for bucket in buckets:
+        for key, value in zip(keys, values):
+            bucket[key] += value
+
+def update(log_file, cache_file):
+    """
+    Bring the cached aggregates up to date with the log, parsing only the
+    lines appended since the last call
+    returns: the aggregates
+    """
+    stats = load_cache(cache_file)
+    if not os.path.isfile(log_file):
+        return new_stats()
+    with open(log_file, 'rb') as fd:
+        head = fd.read(HEAD_BYTES)
+        #log was truncated or replaced: start again from scratch
+        if (os.fstat(fd.fileno()).st_size < stats['offset']
+                or not head.startswith(stats['head'])):
+            stats = new_stats()
+        if stats['offset'] == 0:
+            #past months first
+            for tdid, start, stop, duration, endpoint in \
+                    segments.iter_log(log_file, live=False):
+                add_record(stats, tdid, start.isoformat(), duration,
+                           endpoint)
+        offset = stats['offset']
+        fd.seek(offset)
+        if offset == 0:
+            offset += len(fd.readline()) #header
+        for line in fd:
+            #last line is still being written
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            fields = line.decode().split(',', 4)
+            if len(fields) < 5:
+                continue
+            try:
+                duration = float(fields[3])
+            except ValueError:
+                continue
+            #endpoint as written by todopomo_log.format_line(), in quotes
+            endpoint = fields[4].rstrip('\r\n')[1:-1]
+            add_record(stats, fields[0], fields[1], duration, endpoint)
+    if offset != stats['offset']:
+        stats['offset'] = offset
+        stats['head'] = head[:offset]
+        save_cache(cache_file, stats)
+    return stats
+
+def rebase(cache_file, log_file, removed):
+    """
+    Move the offset of the cached aggregates after rotation removed records
+    from the start of the log (their aggregates are kept)
+    removed : bytes removed (as returned by todopomo_segments.rotate), None
+              if they weren't all at the start: the aggregates are then
+              recomputed on the next update()
+    """
+    stats = load_cache(cache_file)
+    if not stats['offset'] or not removed:
+        if removed is None and os.path.isfile(cache_file):
+            os.remove(cache_file)
+        return
+    header = len(stats['head'].split(b'\n', 1)[0]) + 1
+    if stats['offset'] < header + removed:
+        #records rotated before they were read: read everything again
+        os.remove(cache_file)
+        return
+    stats['offset'] -= removed
+    with open(log_file, 'rb') as fd:
+        stats['head'] = fd.read(HEAD_BYTES)[:stats['offset']]
+    save_cache(cache_file, stats)
+
+def project_totals(stats, todo_list):
+    """
+    Aggregate the per-tdid totals by project of the To-dos
+    To-dos without project are grouped as 'No project'.
+    """
+    projects = {}
+    for todo in todo_list:
+        tdid = todo.tags.get('tdid')
+        if tdid not in stats['tdids']:
+            continue
+        for project in todo.projects or ['No project']:
+            total = projects.setdefault(project, new_aggregate())
+            for key, value in stats['tdids'][tdid].items():
+                total[key] += value
+    return projects
+
+def break_ratio(aggregate):
+    if not aggregate['seconds']:
+        return 0.
+    return aggregate['break_seconds'] / aggregate['seconds']
+
+def format_aggregate(name, aggregate):
+    return "{:<20} {:>5} pomos {:>8.0f} s worked {:>5.0%} breaks "\
+           "{:>3} interruptions".format(name, aggregate['pomos'],
+                                        aggregate['seconds'],
+                                        break_ratio(aggregate),
+                                        aggregate['interruptions'])
+
+def summary(stats, todo_list, last=7):
+    """
+    The stats of the last days and weeks, and of the most worked on To-dos
+    and projects
+    todo_list : To-dos used to look up the projects of each tdid
+    last : number of days, weeks, To-dos and projects
+    returns: dictionary with lists of (name, aggregate) for 'days', 'weeks',
+             'tdids' and 'projects'
+    """
+    by_seconds = lambda x: -x[1]['seconds']
+    return {'days': [(day, stats['days'][day])
+                     for day in sorted(stats['days'])[-last:]],
+            'weeks': [(week, stats['weeks'][week])
+                      for week in sorted(stats['weeks'])[-last:]],
+            'tdids': sorted(stats['tdids'].items(), key=by_seconds)[:last],
+            'projects': sorted(project_totals(stats, todo_list).items(),
+                               key=by_seconds)[:last]}
+
+def show_stats(log_file, cache_file, todo_list, last=7):
+    """
+    Print the stats of the last days and weeks, of the To-dos and projects
+    todo_list : To-dos used to look up the projects of each tdid
+    last : number of days, weeks, To-dos and projects shown
+    """
+    stats = update(log_file, cache_file)
+    print(80*'#')
+    if not stats['days']:
+        print("No Pomodoros logged yet.")
+        print(80*'#')
+        return
+    titles = [('days', "Last days :"), ('weeks', "Last weeks :"),
+              ('tdids', "Most worked on To-dos :"), ('projects', "Projects :")]
+    lines = summary(stats, todo_list, last)
+    for i, (key, title) in enumerate(titles):
+        if i:
+            print(80*'+')
+        print(title)
+        for name, aggregate in lines[key]:
+            print(format_aggregate(name, aggregate))
+    print(80*'#')
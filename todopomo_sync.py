@@ -0,0 +1,260 @@
+"""
+Optimistic concurrency for the To-dos, when several processes (two command
+line sessions, the server and a session) save To-dos to the same files.
+
+The To-dos are stored as a snapshot (todo_txt.tmp, or todo.txt) and the
+journal of the changes made since (see todopomo_journal). The version of
+this store is the stamp (size, mtime) of the snapshot, the token of the
+journal and the size of the journal. A TodoStore keeps the version it last
+saw, and the line of each To-do as the session last read or wrote it (its
+base).
+
+Every write takes the store's lock (the journal's, see todopomo_lock) and
+first compares the versions. If other processes wrote since, their changes
+are read - only the end of the journal, unless the snapshot was re-written
+- and kept as pending until the session applies them to its lists (take()).
+A To-do saved by the session which another process changed too is merged
+with their version field by field (merge()), so that no change is lost.
+Compacting the journal writes the pending changes along with ours.
+"""
+import todotxtio as tdt
+import todopomo_journal as journal
+import todopomo_lock as locking
+import todopomo_metrics as metrics
+import todopomo_watch as watch
+
+import os
+
+#fields merged by merge() (completed before completion_date, which it clears)
+FIELDS = ('text', 'priority', 'completed', 'completion_date',
+          'creation_date', 'projects', 'contexts')
+#tags counting work done on a To-do: the work of both sides adds up
+COUNTERS = ('Pmd', 'Ttotal')
+
+def _value(todo, field):
+    value = getattr(todo, field)
+    if field in ('projects', 'contexts'):
+        return list(value or ())
+    return value
+
+def merge(base, ours, theirs):
+    """
+    Three-way merge of a To-do changed by this session (ours, changed in
+    place) and by another one (theirs), from the version both started from
+    (base): fields and tags changed on one side only take that side, the
+    COUNTERS changed on both sides add up, and other fields changed
+    differently on both sides keep ours
+    returns: number of fields changed differently on both sides
+    """
+    conflicts = 0
+    for field in FIELDS:
+        b, o, t = (_value(todo, field) for todo in (base, ours, theirs))
+        if o == b and t != b:
+            setattr(ours, field, t)
+        elif t != b and t != o:
+            conflicts += 1
+    for key in set(base.tags) | set(ours.tags) | set(theirs.tags):
+        b, o, t = (todo.tags.get(key) for todo in (base, ours, theirs))
+        if key in COUNTERS and o != b and t != b:
+            try:
+                ours.tags[key] = str(int(o or 0) + int(t or 0) - int(b or 0))
+                continue
+            except ValueError:
+                pass
+        if o == b and t != b:
+            if t is None:
+                del ours.tags[key]
+            else:
+                ours.tags[key] = t
+        elif t != b and t != o:
+            conflicts += 1
+    return conflicts
+
+class TodoStore(object):
+    """
+    The To-dos of a snapshot and its journal, as seen by one session
+    todo_file : read instead of snapshot_file when there is no snapshot
+    """
+
+    def __init__(self, journal_file, snapshot_file, todo_file=None):
+        self.journal_file = journal_file
+        self.snapshot_file = snapshot_file
+        self.todo_file = todo_file
+        self.base = {}     #tdid -> line as last read or written here
+        self.pending = {}  #tdid -> line written by another process
+                           #(None if it removed the To-do)
+        self.merged = []   #To-dos merged with the changes of another process
+        self.conflicts = 0
+        self._version = (None, None, 0) #snapshot stamp, journal token, size
+
+    def lock(self):
+        return locking.lock(self.journal_file)
+
+    def _snapshot(self):
+        if self.todo_file is not None \
+                and not os.path.isfile(self.snapshot_file):
+            return self.todo_file
+        return self.snapshot_file
+
+    def _stamp(self):
+        path = self._snapshot()
+        return path, watch.stamp(path)
+
+    def reset(self, todo_list):
+        """
+        Take todo_list as the content of the store, as just read or written
+        by this session (with the lock held)
+        """
+        self.base = {todo.tags['tdid']: str(todo) for todo in todo_list
+                                                  if 'tdid' in todo.tags}
+        self.pending = {}
+        self._version = (self._stamp(), journal.token(self.journal_file),
+                         journal.size(self.journal_file))
+
+    def pull(self):
+        """
+        Read the changes made by other processes since the version last seen
+        into pending (with the lock held)
+        returns: number of To-dos they changed
+        """
+        stamp, token, offset = self._version
+        current = self._stamp()
+        current_token = journal.token(self.journal_file)
+        size = journal.size(self.journal_file)
+        if (current, current_token, size) == self._version:
+            return 0
+        if current == stamp and (current_token == token or offset == 0) \
+                and size >= offset:
+            #only the end of the journal is new
+            records, offset = journal.read_since(self.journal_file, offset)
+        else:
+            #the snapshot was re-written: compare all the To-dos
+            records = {}
+            if os.path.isfile(current[0]):
+                with open(current[0], encoding='utf-8') as fd:
+                    for line in fd:
+                        key = watch.line_key(line.strip())
+                        if isinstance(key, str):
+                            records[key] = line.strip()
+            journalled, offset = journal.read_since(self.journal_file)
+            records.update(journalled)
+            for tdid in self.base:
+                if tdid not in records:
+                    records[tdid] = None
+        self._version = (current, current_token, offset)
+        changed = 0
+        for tdid, line in records.items():
+            if line != self.pending.get(tdid, self.base.get(tdid)):
+                self.pending[tdid] = line
+                changed += 1
+        metrics.count('store_changes_pulled', changed)
+        return changed
+
+    def _merge_pending(self, todo):
+        """
+        Merge the pending change of another process into a To-do changed
+        here (with the lock held)
+        returns: True if there was one
+        """
+        tdid = todo.tags['tdid']
+        if tdid not in self.pending:
+            return False
+        theirs = self.pending.pop(tdid)
+        if theirs is None or tdid not in self.base:
+            #removed there, or another To-do with the same tdid: keep ours
+            return False
+        conflicts = merge(tdt.from_string(self.base[tdid])[0], todo,
+                          tdt.from_string(theirs)[0])
+        self.conflicts += conflicts
+        self.merged.append(todo)
+        metrics.count('store_merges')
+        metrics.count('store_conflicts', conflicts)
+        return True
+
+    def save(self, todo_list):
+        """
+        Append changed To-dos to the journal, merged first with the changes
+        other processes made to them since
+        returns: the To-dos merged
+        """
+        with self.lock():
+            self.pull()
+            merged = [todo for todo in todo_list if self._merge_pending(todo)]
+            size = journal.extend(self.journal_file, todo_list)
+            stamp, token, offset = self._version
+            if token is None:
+                token = journal.token(self.journal_file)
+            self._version = (stamp, token, size)
+            for todo in todo_list:
+                self.base[todo.tags['tdid']] = str(todo)
+        return merged
+
+    def compact(self, todo_list, max_bytes=None):
+        """
+        Write the To-dos to the snapshot and empty the journal, only once the
+        journal has grown past max_bytes if given. The changes of other
+        processes not applied yet are written too (merged into the To-dos
+        changed here as well).
+        returns: True if the snapshot was written
+        """
+        with self.lock():
+            if max_bytes is not None \
+                    and journal.size(self.journal_file) <= max_bytes:
+                return False
+            self.pull()
+            lines, tdids = [], set()
+            for todo in todo_list:
+                tdid = todo.tags.get('tdid')
+                tdids.add(tdid)
+                if tdid in self.pending \
+                        and str(todo) == self.base.get(tdid):
+                    #not changed here: as written by the other process
+                    if self.pending[tdid] is not None:
+                        lines.append(self.pending[tdid])
+                    continue
+                if tdid is not None:
+                    self._merge_pending(todo)
+                    self.base[tdid] = str(todo)
+                lines.append(todo)
+            lines.extend(line for tdid, line in self.pending.items()
+                              if tdid not in tdids and line is not None)
+            journal.compact(self.journal_file, self.snapshot_file, lines)
+            self._version = (self._stamp(), None, 0)
+        return True
+
+    def finish(self, todo_list):
+        """
+        Write the To-dos to todo_file and remove the snapshot and the journal,
+        once a session ends (with the lock held, the changes of other
+        processes taken first)
+        returns: True if the snapshot was removed
+        """
+        tdt.to_file(self.todo_file, todo_list)
+        removed = os.path.isfile(self.snapshot_file)
+        if removed:
+            os.remove(self.snapshot_file)
+        journal.clear(self.journal_file)
+        self.reset(todo_list)
+        return removed
+
+    def take(self, parse=tdt.from_string):
+        """
+        The changes of other processes, for the session to apply to its lists
+        (they are then taken as read)
+        returns: list of (tdid, To-do or None if it was removed), list of the
+                 To-dos merged with changes of other processes since the
+                 last call (their place in sorted lists may have changed)
+        """
+        with self.lock():
+            self.pull()
+            pending, self.pending = self.pending, {}
+            merged, self.merged = self.merged, []
+        changes = []
+        for tdid, line in pending.items():
+            if line is None:
+                self.base.pop(tdid, None)
+                changes.append((tdid, None))
+            else:
+                self.base[tdid] = line
+                changes.append((tdid, parse(line)[0]))
+        return changes, merged
@@ -0,0 +1,264 @@
+"""
+Pomodoro timers on an asyncio event loop.
+
+PomoScheduler runs any number of independent Pomodoro sessions (cycles of
+work followed by a break) on one event loop, instead of blocking a whole
+process or thread in a timer per session as tick() does. Each phase is a
+single loop.call_later() callback, durations are measured with the loop's
+monotonic clock, and pausing just cancels the callback and keeps the time
+elapsed so far, so nothing is busy-waiting.
+
+At the end of each phase a notification is shown and the phase is logged
+(by default with todopomo.write_pomo): work phases with the tdid, breaks as
+'break', and work phases stopped early as interruptions (duration 0), like
+run_pomo() does. The session moves on to its next phase first: an error
+while logging is only reported (with the logging module).
+"""
+import todopomo_log as pomo_log
+
+import asyncio
+from datetime import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+WORK, BREAK, DONE = 'work', 'break', 'done'
+INTERRUPTED = 'interrupted'      #phase of a work phase stopped early
+
+def write_pomo_phase(session, phase, start, stop, duration):
+    """
+    Default logging of a finished phase: todopomo.write_pomo()
+    """
+    import todopomo as tp
+    if phase == BREAK:
+        tp.write_pomo(start, stop, duration)
+    elif phase == INTERRUPTED:
+        tp.write_pomo(start, stop, 0, session.tdid, pomo_log.INTERRUPTED)
+    else:
+        tp.write_pomo(start, stop, duration, session.tdid, session.endpoint)
+
+def notify(title, message):
+    """
+    Default notification: pomodoro.notify(), if the module is available
+    """
+    try:
+        import pomodoro as pmd
+    except ImportError:
+        return
+    pmd.notify(title, message)
+
+class PomoSession(object):
+    """
+    State of one Pomodoro session: the current phase and its timing
+    """
+
+    def __init__(self, key, tdid, work, rest, cycles, endpoint, on_phase):
+        self.key = key
+        self.tdid = tdid
+        self.work = work            #seconds
+        self.rest = rest            #seconds
+        self.cycles = cycles        #number of work/break cycles left
+        self.endpoint = endpoint
+        self.on_phase = on_phase
+        self.phase = None
+        self.elapsed = 0.           #seconds of the phase before last resume
+        self.resumed = None         #loop time of last (re)start, None: paused
+        self.started = None         #wall clock start of the phase, for log
+        self.handle = None
+        self.pomos = 0              #work phases completed
+        self.worked = 0             #seconds of the work phases completed
+        self.done = None            #future, set when the session ends
+
+    @property
+    def length(self):
+        return self.work if self.phase == WORK else self.rest
+
+    @property
+    def paused(self):
+        return self.phase in (WORK, BREAK) and self.resumed is None
+
+    def phase_elapsed(self, now):
+        if self.resumed is None:
+            return self.elapsed
+        return self.elapsed + now - self.resumed
+
+    def status(self, now):
+        return {'key': self.key, 'tdid': self.tdid, 'phase': self.phase,
+                'paused': self.paused,
+                'elapsed': int(self.phase_elapsed(now)),
+                'remaining': max(0, int(self.length
+                                        - self.phase_elapsed(now))),
+                'pomos': self.pomos, 'worked': self.worked}
+
+class PomoScheduler(object):
+    """
+    Runs Pomodoro sessions, identified by a key (eg the user), on an event
+    loop. Its methods must be called from the loop's thread - from other
+    threads, use submit().
+    on_phase : called as on_phase(session, phase, start, stop, duration) at
+               the end of each phase, phase being WORK, BREAK or INTERRUPTED
+               (default: write_pomo_phase)
+    notify : called as notify(title, message), in an executor thread
+    """
+
+    def __init__(self, on_phase=write_pomo_phase, notify=notify, loop=None):
+        self.on_phase = on_phase
+        self.notify = notify
+        self.loop = loop
+        self.sessions = {}
+        self._thread = None
+
+    def _loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return self.loop
+
+    def start(self, key, tdid, work=25 * 60, rest=5 * 60, cycles=1,
+              endpoint='', on_phase=None):
+        """
+        Start a session of `cycles` work/break cycles (work, rest in seconds)
+        on_phase : overrides the scheduler's on_phase for this session
+        """
+        session = self.sessions.get(key)
+        if session is not None and session.phase != DONE:
+            raise ValueError('a Pomodoro is already running for {}'
+                             .format(key))
+        session = PomoSession(key, tdid, work, rest, cycles, endpoint,
+                              on_phase or self.on_phase)
+        session.done = self._loop().create_future()
+        self.sessions[key] = session
+        self._start_phase(session, WORK)
+        return session
+
+    def _start_phase(self, session, phase):
+        session.phase = phase
+        session.elapsed = 0.
+        session.started = datetime.now()
+        session.resumed = self.loop.time()
+        session.handle = self.loop.call_later(session.length,
+                                              self._end_phase, session)
+
+    def _end_phase(self, session, interrupted=False):
+        now = self.loop.time()
+        duration = int(session.phase_elapsed(now))
+        phase, started = session.phase, session.started
+        session.handle = None
+        #the session moves on before the phase is logged, so that a failure
+        #to log it can't leave the session stuck in a phase which is over
+        if phase == WORK and interrupted:
+            self._finish(session)
+            self._log_phase(session, INTERRUPTED, started, 0)
+            return
+        if phase == WORK:
+            session.pomos += 1
+            session.worked += duration
+            self._notify('Finished pomo, rest now.')
+            self._start_phase(session, BREAK)
+        else:
+            session.cycles -= 1
+            if session.cycles > 0 and not interrupted:
+                self._notify('Finished rest, work now.')
+                self._start_phase(session, WORK)
+            else:
+                self._notify('Pomodoro cycle is complete.')
+                self._finish(session)
+        self._log_phase(session, phase, started, duration)
+
+    def _log_phase(self, session, phase, start, duration):
+        try:
+            session.on_phase(session, phase, start, datetime.now(), duration)
+        except Exception:
+            logger.exception("could not log the {} phase of {}"
+                             .format(phase, session.key))
+
+    def _finish(self, session):
+        session.phase = DONE
+        session.resumed = None
+        if not session.done.done():
+            session.done.set_result(session)
+
+    def _notify(self, message):
+        if self.notify is not None:
+            self.loop.run_in_executor(None, self.notify, 'pomodoro', message)
+
+    def get(self, key):
+        return self.sessions.get(key)
+
+    def status(self, key):
+        session = self.sessions.get(key)
+        if session is None:
+            return None
+        return session.status(self.loop.time())
+
+    def pause(self, key):
+        session = self.sessions[key]
+        if session.phase == DONE or session.paused:
+            return session
+        session.handle.cancel()
+        session.handle = None
+        session.elapsed = session.phase_elapsed(self.loop.time())
+        session.resumed = None
+        return session
+
+    def resume(self, key):
+        session = self.sessions[key]
+        if not session.paused:
+            return session
+        session.resumed = self.loop.time()
+        session.handle = self.loop.call_later(session.length
+                                              - session.elapsed,
+                                              self._end_phase, session)
+        return session
+
+    def stop(self, key):
+        """
+        Stop a session: a work phase is logged as interrupted, a break with
+        the time it lasted
+        returns: the session (None if there is none)
+        """
+        session = self.sessions.get(key)
+        if session is None or session.phase == DONE:
+            return session
+        if session.handle is not None:
+            session.handle.cancel()
+        self._end_phase(session, interrupted=True)
+        return session
+
+    async def wait(self, key):
+        """
+        Wait for the end of a session
+        """
+        return await self.sessions[key].done
+
+    def run_in_thread(self):
+        """
+        Run the event loop in a background (daemon) thread, for use from
+        synchronous code such as the web server
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        daemon=True, name='pomodoro-timers')
+        self._thread.start()
+        return self._thread
+
+    def shutdown(self):
+        """
+        Stop the event loop run by run_in_thread() (the phases still running
+        are dropped, not logged)
+        """
+        if self._thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+        self.loop.close()
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Call a method of the scheduler on the loop's thread and wait for the
+        result (exceptions are re-raised)
+        """
+        async def call():
+            return method(*args, **kwargs)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
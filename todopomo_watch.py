@@ -0,0 +1,133 @@
+"""
+Watching todo.txt for changes made by other programs (todo.txt clients on a
+phone, sync tools, editors) while a session runs.
+
+The watcher keeps the lines of the file as last read, by key (the tdid of
+the line, or the line itself for lines without tdid). When the file changes
+it is read again and diffed against them, line by line, so only the lines
+which changed need parsing.
+
+Changes are noticed with inotify when the inotify_simple package is
+available (watching the directory, as many programs replace the file
+rather than write to it), otherwise by polling the size and mtime of the
+file. Either way the content hash is compared before diffing.
+"""
+import hashlib
+import os
+import re
+
+try:
+    import inotify_simple
+except ImportError:
+    has_inotify = False
+else:
+    has_inotify = True
+
+TDID = re.compile(r'(?:^|\s)tdid:(\S+)')
+
+def line_key(line):
+    """
+    Key of a todo.txt line: its tdid, or the line for lines without one
+    """
+    match = TDID.search(line)
+    if match:
+        return match.group(1)
+    return ('line', line)
+
+def read_lines(path):
+    """
+    Lines of a todo.txt file by key, and the hash of the content
+    returns: dictionary key -> line, hash (None if there is no file)
+    """
+    try:
+        with open(path, 'rb') as fd:
+            data = fd.read()
+    except OSError:
+        return {}, None
+    lines = {}
+    for line in data.decode('utf-8').splitlines():
+        line = line.strip()
+        if line:
+            lines[line_key(line)] = line
+    return lines, hashlib.sha1(data).hexdigest()
+
+def diff(old, new):
+    """
+    Lines changed between two versions of a file (as returned by read_lines)
+    returns: dictionary key -> line of the lines changed or added,
+             list of keys of the lines removed
+    """
+    changed = {key: line for key, line in new.items() if old.get(key) != line}
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+def stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class TodoFileWatcher(object):
+    """
+    Watches a todo.txt file for changes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lines, self.hash = read_lines(path)
+        self.stamp = stamp(path)
+        self.inotify = None
+        if has_inotify:
+            try:
+                self.inotify = inotify_simple.INotify()
+                flags = inotify_simple.flags
+                self.inotify.add_watch(os.path.dirname(os.path.abspath(path)),
+                                       flags.CLOSE_WRITE | flags.MOVED_TO
+                                       | flags.CREATE | flags.DELETE
+                                       | flags.MOVED_FROM)
+            except OSError:
+                #eg out of watches: fall back to polling
+                self.inotify = None
+
+    def touched(self):
+        """
+        True if the file may have changed since the last call
+        """
+        if self.inotify is not None:
+            name = os.path.basename(self.path)
+            return any(event.name == name
+                       for event in self.inotify.read(timeout=0))
+        current = stamp(self.path)
+        if current != self.stamp:
+            self.stamp = current
+            return True
+        return False
+
+    def poll(self):
+        """
+        Check the file for changes
+        returns: None if unchanged, otherwise (changed, removed) as for diff()
+        """
+        if not self.touched():
+            return None
+        lines, content_hash = read_lines(self.path)
+        if content_hash == self.hash:
+            return None
+        changes = diff(self.lines, lines)
+        self.lines, self.hash = lines, content_hash
+        return changes
+
+    def reset(self):
+        """
+        Take the current content of the file as read (eg after writing it)
+        """
+        if self.inotify is not None:
+            self.inotify.read(timeout=0)
+        self.lines, self.hash = read_lines(self.path)
+        self.stamp = stamp(self.path)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None